@@ -77,6 +77,7 @@ def main(args):
         if os.path.isdir(corrected_dirpath):
             shutil.rmtree(corrected_dirpath)
         os.mkdir(corrected_dirpath)
+    qconfig.reference_index_dirpath = qconfig.cache_dirpath or corrected_dirpath
 
     qconfig.set_max_threads(logger)
     check_reads_fpaths(logger)
@@ -145,76 +146,101 @@ def main(args):
     ########################################################################
     ### Stats and plots
     ########################################################################
-    from quast_libs import basic_stats
-    icarus_gc_fpath, circos_gc_fpath = basic_stats.do(ref_fpath, contigs_fpaths, os.path.join(output_dirpath, 'basic_stats'), output_dirpath)
+    # Stages not depending on each other run at the same time: stages drawing plots run in the main thread,
+    # gene prediction, BUSCO, Barrnap and KMC don't need the reference alignments and run in background threads
+    from quast_libs.stages import Stage, run_stages
+    stages = []
+
+    def run_basic_stats(data):
+        from quast_libs import basic_stats
+        icarus_gc_fpath, circos_gc_fpath = basic_stats.do(ref_fpath, contigs_fpaths, os.path.join(output_dirpath, 'basic_stats'), output_dirpath)
+        return {'icarus_gc_fpath': icarus_gc_fpath, 'circos_gc_fpath': circos_gc_fpath}
+    stages.append(Stage('basic_stats', run_basic_stats, outputs=['icarus_gc_fpath', 'circos_gc_fpath'], main_thread=True))
 
     if qconfig.use_kmc and ref_fpath:
-        unique_kmers.do(os.path.join(output_dirpath, 'k_mer_stats'), ref_fpath, contigs_fpaths, logger)
+        def run_unique_kmers(data):
+            unique_kmers.do(os.path.join(output_dirpath, 'k_mer_stats'), ref_fpath, contigs_fpaths, logger)
+        stages.append(Stage('unique_kmers', run_unique_kmers))
 
-    aligned_contigs_fpaths = []
-    aligned_lengths_lists = []
-    icarus_html_fpath = None
-    circos_png_fpath = None
+    data = {'aligned_contigs_fpaths': [], 'aligned_lengths_lists': [], 'features_containers': None,
+            'genes_by_labels': None, 'cov_fpath': cov_fpath, 'physical_cov_fpath': physical_cov_fpath}
     if ref_fpath:
         ########################################################################
         ### former PLANTAKOLYA, PLANTAGORA
         ########################################################################
-        from quast_libs import contigs_analyzer
-        is_cyclic = qconfig.prokaryote and not qconfig.check_for_fragmented_ref
-        aligner_statuses, aligned_lengths_per_fpath = contigs_analyzer.do(
-            ref_fpath, contigs_fpaths, is_cyclic, os.path.join(output_dirpath, 'contigs_reports'),
-            old_contigs_fpaths, qconfig.bed)
-        for contigs_fpath in contigs_fpaths:
-            if aligner_statuses[contigs_fpath] == contigs_analyzer.AlignerStatus.OK:
-                aligned_contigs_fpaths.append(contigs_fpath)
-                aligned_lengths_lists.append(aligned_lengths_per_fpath[contigs_fpath])
+        def run_contigs_analyzer(data):
+            from quast_libs import contigs_analyzer
+            is_cyclic = qconfig.prokaryote and not qconfig.check_for_fragmented_ref
+            aligner_statuses, aligned_lengths_per_fpath = contigs_analyzer.do(
+                ref_fpath, contigs_fpaths, is_cyclic, os.path.join(output_dirpath, 'contigs_reports'),
+                old_contigs_fpaths, qconfig.bed)
+            aligned_contigs_fpaths = []
+            aligned_lengths_lists = []
+            for contigs_fpath in contigs_fpaths:
+                if aligner_statuses[contigs_fpath] == contigs_analyzer.AlignerStatus.OK:
+                    aligned_contigs_fpaths.append(contigs_fpath)
+                    aligned_lengths_lists.append(aligned_lengths_per_fpath[contigs_fpath])
+            return {'aligned_contigs_fpaths': aligned_contigs_fpaths, 'aligned_lengths_lists': aligned_lengths_lists}
+        stages.append(Stage('contigs_analyzer', run_contigs_analyzer,
+                            outputs=['aligned_contigs_fpaths', 'aligned_lengths_lists'], main_thread=True))
 
     if qconfig.is_agb_mode:  # AGB needs only alignments information
+        run_stages(stages, data)
         sys.exit(0)
 
-    # Before continue evaluating, check if aligner didn't skip all of the contigs files.
-    detailed_contigs_reports_dirpath = None
-    features_containers = None
-    if len(aligned_contigs_fpaths) and ref_fpath:
-        detailed_contigs_reports_dirpath = os.path.join(output_dirpath, 'contigs_reports')
-
+    if ref_fpath:
         ########################################################################
         ### NAx and NGAx ("aligned Nx and NGx")
         ########################################################################
-        from quast_libs import aligned_stats
-        aligned_stats.do(
-            ref_fpath, aligned_contigs_fpaths, output_dirpath,
-            aligned_lengths_lists, os.path.join(output_dirpath, 'aligned_stats'))
+        def run_aligned_stats(data):
+            if data['aligned_contigs_fpaths']:
+                from quast_libs import aligned_stats
+                aligned_stats.do(
+                    ref_fpath, data['aligned_contigs_fpaths'], output_dirpath,
+                    data['aligned_lengths_lists'], os.path.join(output_dirpath, 'aligned_stats'))
+        stages.append(Stage('aligned_stats', run_aligned_stats,
+                            inputs=['aligned_contigs_fpaths', 'aligned_lengths_lists'], main_thread=True))
 
         ########################################################################
         ### GENOME_ANALYZER
         ########################################################################
-        from quast_libs import genome_analyzer
-        features_containers = genome_analyzer.do(
-            ref_fpath, aligned_contigs_fpaths, output_dirpath,
-            qconfig.features, qconfig.operons, detailed_contigs_reports_dirpath,
-            os.path.join(output_dirpath, 'genome_stats'))
-
-    genes_by_labels = None
-    if qconfig.glimmer:
-        ########################################################################
-        ### Glimmer
-        ########################################################################
-        from quast_libs import glimmer
-        genes_by_labels = glimmer.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'))
-    if qconfig.gene_finding:
-        ########################################################################
-        ### GeneMark
-        ########################################################################
-        from quast_libs import genemark
-        genes_by_labels = genemark.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'),
-                    qconfig.prokaryote, qconfig.metagenemark)
-    if genes_by_labels is None:
+        def run_genome_analyzer(data):
+            if data['aligned_contigs_fpaths']:
+                from quast_libs import genome_analyzer
+                features_containers = genome_analyzer.do(
+                    ref_fpath, data['aligned_contigs_fpaths'], output_dirpath,
+                    qconfig.features, qconfig.operons, os.path.join(output_dirpath, 'contigs_reports'),
+                    os.path.join(output_dirpath, 'genome_stats'))
+                return {'features_containers': features_containers}
+        stages.append(Stage('genome_analyzer', run_genome_analyzer, inputs=['aligned_contigs_fpaths'],
+                            outputs=['features_containers'], main_thread=True))
+
+    if qconfig.glimmer or qconfig.gene_finding:
+        def run_gene_prediction(data):
+            genes_by_labels = None
+            if qconfig.glimmer:
+                ########################################################################
+                ### Glimmer
+                ########################################################################
+                from quast_libs import glimmer
+                genes_by_labels = glimmer.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'))
+            if qconfig.gene_finding:
+                ########################################################################
+                ### GeneMark
+                ########################################################################
+                from quast_libs import genemark
+                genes_by_labels = genemark.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'),
+                            qconfig.prokaryote, qconfig.metagenemark)
+            return {'genes_by_labels': genes_by_labels}
+        stages.append(Stage('gene_prediction', run_gene_prediction, outputs=['genes_by_labels']))
+    else:
         logger.main_info("")
         logger.notice("Genes are not predicted by default. Use --gene-finding or --glimmer option to enable it.")
 
     if qconfig.rna_gene_finding:
-        run_barrnap.do(contigs_fpaths, os.path.join(output_dirpath, 'predicted_genes'), logger)
+        def run_rna_gene_finding(data):
+            run_barrnap.do(contigs_fpaths, os.path.join(output_dirpath, 'predicted_genes'), logger)
+        stages.append(Stage('barrnap', run_rna_gene_finding))
 
     if qconfig.run_busco and not qconfig.is_combined_ref:
         if qconfig.platform_name == 'macosx':
@@ -224,55 +250,91 @@ def main(args):
             logger.main_info("")
             logger.warning("BUSCO does not support Python versions earlier than 2.6.")
         else:
-            from quast_libs import run_busco
-            run_busco.do(contigs_fpaths, os.path.join(output_dirpath, qconfig.busco_dirname), logger)
+            def run_busco(data):
+                from quast_libs import run_busco
+                run_busco.do(contigs_fpaths, os.path.join(output_dirpath, qconfig.busco_dirname), logger)
+            stages.append(Stage('busco', run_busco))
+
     ########################################################################
-    reports_fpaths, transposed_reports_fpaths = reporting.save_total(output_dirpath)
+    def save_total(data):
+        reports_fpaths, transposed_reports_fpaths = reporting.save_total(output_dirpath)
+        return {'reports_fpaths': reports_fpaths, 'transposed_reports_fpaths': transposed_reports_fpaths}
+    # the total report is saved after all stages adding metrics into it
+    stages.append(Stage('save_total', save_total, inputs=[stage.name for stage in stages],
+                        outputs=['reports_fpaths', 'transposed_reports_fpaths'], main_thread=True))
 
     ########################################################################
     ### LARGE DRAWING TASKS
     ########################################################################
-    if qconfig.draw_plots or qconfig.create_icarus_html or qconfig.draw_circos:
-        logger.print_timestamp()
-        logger.main_info('Creating large visual summaries...')
-        logger.main_info('This may take a while: press Ctrl-C to skip this step..')
-        try:
-            if detailed_contigs_reports_dirpath:
-                report_for_icarus_fpath_pattern = os.path.join(detailed_contigs_reports_dirpath, qconfig.icarus_report_fname_pattern)
-                stdout_pattern = os.path.join(detailed_contigs_reports_dirpath, qconfig.contig_report_fname_pattern)
-            else:
-                report_for_icarus_fpath_pattern = None
-                stdout_pattern = None
-            draw_alignment_plots = qconfig.create_icarus_html
-            draw_circos_plot = qconfig.draw_circos and ref_fpath and len(aligned_contigs_fpaths)
-            number_of_steps = sum([int(bool(value)) for value in [draw_alignment_plots, draw_circos_plot, all_pdf_fpath]])
-            if draw_alignment_plots:
-                ########################################################################
-                ### VISUALIZE CONTIG ALIGNMENT
-                ########################################################################
-                logger.main_info('  1 of %d: Creating Icarus viewers...' % number_of_steps)
-                from quast_libs import icarus
-                icarus_html_fpath = icarus.do(
-                    contigs_fpaths, report_for_icarus_fpath_pattern, output_dirpath, ref_fpath,
-                    stdout_pattern=stdout_pattern, features=features_containers,
-                    cov_fpath=cov_fpath, physical_cov_fpath=physical_cov_fpath, gc_fpath=icarus_gc_fpath,
-                    json_output_dir=qconfig.json_output_dirpath, genes_by_labels=genes_by_labels)
-
-            if draw_circos_plot:
-                logger.main_info('  %d of %d: Creating Circos plot...' % (2 if draw_alignment_plots else 1, number_of_steps))
+    data['icarus_html_fpath'] = None
+    data['circos_png_fpath'], data['circos_legend_fpath'] = None, None
+    if qconfig.draw_circos and ref_fpath:
+        # Circos plot doesn't need the total report, so it is drawn while BUSCO or gene prediction may still run
+        def draw_circos(data):
+            if not data['aligned_contigs_fpaths']:
+                return
+            logger.print_timestamp()
+            logger.main_info('Creating Circos plot...')
+            logger.main_info('This may take a while: press Ctrl-C to skip this step..')
+            try:
                 from quast_libs import circos
-                circos_png_fpath, circos_legend_fpath = circos.do(ref_fpath, contigs_fpaths, report_for_icarus_fpath_pattern, circos_gc_fpath,
-                                                                  features_containers, cov_fpath, os.path.join(output_dirpath, 'circos'), logger)
-
-            if all_pdf_fpath:
-                # full report in PDF format: all tables and plots
-                logger.main_info('  %d of %d: Creating PDF with all tables and plots...' % (number_of_steps, number_of_steps))
-                plotter.fill_all_pdf_file(all_pdf_fpath)
-            logger.main_info('Done')
-        except KeyboardInterrupt:
-            logger.main_info('..step skipped!')
-            if all_pdf_fpath and os.path.isfile(all_pdf_fpath):
-                os.remove(all_pdf_fpath)
+                report_for_icarus_fpath_pattern = os.path.join(output_dirpath, 'contigs_reports', qconfig.icarus_report_fname_pattern)
+                circos_png_fpath, circos_legend_fpath = circos.do(ref_fpath, contigs_fpaths, report_for_icarus_fpath_pattern,
+                                                                  data['circos_gc_fpath'], data['features_containers'],
+                                                                  data['cov_fpath'], os.path.join(output_dirpath, 'circos'), logger)
+                logger.main_info('Done')
+                return {'circos_png_fpath': circos_png_fpath, 'circos_legend_fpath': circos_legend_fpath}
+            except KeyboardInterrupt:
+                logger.main_info('..step skipped!')
+        stages.append(Stage('circos', draw_circos, inputs=['basic_stats', 'aligned_contigs_fpaths', 'features_containers'],
+                            outputs=['circos_png_fpath', 'circos_legend_fpath'], main_thread=True))
+
+    if qconfig.create_icarus_html or all_pdf_fpath:
+        # Icarus adds similarity statistics to reports, but they are not saved in the total report
+        def draw_visual_summaries(data):
+            logger.print_timestamp()
+            logger.main_info('Creating large visual summaries...')
+            logger.main_info('This may take a while: press Ctrl-C to skip this step..')
+            outputs = dict()
+            try:
+                if data['aligned_contigs_fpaths']:
+                    detailed_contigs_reports_dirpath = os.path.join(output_dirpath, 'contigs_reports')
+                    report_for_icarus_fpath_pattern = os.path.join(detailed_contigs_reports_dirpath, qconfig.icarus_report_fname_pattern)
+                    stdout_pattern = os.path.join(detailed_contigs_reports_dirpath, qconfig.contig_report_fname_pattern)
+                else:
+                    report_for_icarus_fpath_pattern = None
+                    stdout_pattern = None
+                draw_alignment_plots = qconfig.create_icarus_html
+                number_of_steps = sum([int(bool(value)) for value in [draw_alignment_plots, all_pdf_fpath]])
+                if draw_alignment_plots:
+                    ########################################################################
+                    ### VISUALIZE CONTIG ALIGNMENT
+                    ########################################################################
+                    logger.main_info('  1 of %d: Creating Icarus viewers...' % number_of_steps)
+                    from quast_libs import icarus
+                    outputs['icarus_html_fpath'] = icarus.do(
+                        contigs_fpaths, report_for_icarus_fpath_pattern, output_dirpath, ref_fpath,
+                        stdout_pattern=stdout_pattern, features=data['features_containers'],
+                        cov_fpath=data['cov_fpath'], physical_cov_fpath=data['physical_cov_fpath'], gc_fpath=data['icarus_gc_fpath'],
+                        json_output_dir=qconfig.json_output_dirpath, genes_by_labels=data['genes_by_labels'])
+
+                if all_pdf_fpath:
+                    # full report in PDF format: all tables and plots
+                    logger.main_info('  %d of %d: Creating PDF with all tables and plots...' % (number_of_steps, number_of_steps))
+                    plotter.fill_all_pdf_file(all_pdf_fpath)
+                logger.main_info('Done')
+            except KeyboardInterrupt:
+                logger.main_info('..step skipped!')
+                if all_pdf_fpath and os.path.isfile(all_pdf_fpath):
+                    os.remove(all_pdf_fpath)
+            return outputs
+        stages.append(Stage('visual_summaries', draw_visual_summaries, inputs=['save_total', 'genes_by_labels'],
+                            outputs=['icarus_html_fpath'], main_thread=True))
+
+    data = run_stages(stages, data)
+    reports_fpaths, transposed_reports_fpaths = data['reports_fpaths'], data['transposed_reports_fpaths']
+    icarus_html_fpath, circos_png_fpath, circos_legend_fpath = \
+        data['icarus_html_fpath'], data['circos_png_fpath'], data['circos_legend_fpath']
 
     ########################################################################
     ### TOTAL REPORT
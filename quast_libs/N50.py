@@ -5,6 +5,12 @@
 # See file LICENSE for details.
 ############################################################################
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
 def NG50(numlist, reference_length, percentage = 50.0):
     """
     Abstract: Returns the NG50 value of the passed list of numbers.
@@ -54,22 +60,60 @@ def L50(numlist, percentage = 50.0):
 
 
 def NG50_and_LG50(numlist, reference_length, percentage=50.0, need_sort=False):
-    assert percentage >= 0.0
-    assert percentage <= 100.0
+    return NGx_and_LGx(numlist, reference_length, [percentage], need_sort)[0]
+
+
+def N50_and_L50(numlist, percentage = 50.0):
+    return NG50_and_LG50(numlist, sum(numlist), percentage)
+
+
+def NGx_and_LGx(numlist, reference_length, percentages, need_sort=False):
+    """
+    Abstract: Returns list of (NGx, LGx) values for each percentage in the list of percentages,
+              numlist should be sorted in descending order (or need_sort should be True).
+    Comments: All values are computed in a single pass over cumulative lengths (NumPy is used if available).
+              Values are (None, None) if contigs don't reach the percentage of reference_length.
+    Usage: NGx_and_LGx(numlist, reference_length, [50, 75])
+    """
+    for percentage in percentages:
+        assert percentage >= 0.0
+        assert percentage <= 100.0
     if need_sort:
         numlist.sort(reverse=True)
+    limits = [reference_length * (100.0 - percentage) / 100.0 for percentage in percentages]
+    if numpy is not None and len(numlist) > 1:
+        # remaining lengths do not increase, so the first contig where remaining length <= limit is found by binary search
+        negative_remaining = numpy.cumsum(numpy.asarray(numlist, dtype=numpy.int64)) - reference_length
+        indices = numpy.searchsorted(negative_remaining, [-limit for limit in limits], side='left').tolist()
+        return [(numlist[i], i + 1) if i < len(numlist) else (None, None) for i in indices]
+
+    results = [(None, None)] * len(percentages)
+    order = sorted(range(len(percentages)), key=lambda idx: -limits[idx])  # larger limits are reached first
     s = reference_length
-    limit = reference_length * (100.0 - percentage) / 100.0
-    lg50 = 0
-    for l in numlist:
+    order_idx = 0
+    for lgx, l in enumerate(numlist, start=1):
+        if order_idx == len(order):
+            break
         s -= l
-        lg50 += 1
-        if s <= limit:
-            ng50 = l
-            return ng50, lg50
+        while order_idx < len(order) and s <= limits[order[order_idx]]:
+            results[order[order_idx]] = (l, lgx)
+            order_idx += 1
+    return results
 
-    return None, None
 
+def Nx_and_Lx(numlist, percentages, need_sort=False):
+    return NGx_and_LGx(numlist, sum(numlist), percentages, need_sort)
 
-def N50_and_L50(numlist, percentage = 50.0):
-    return NG50_and_LG50(numlist, sum(numlist), percentage)
\ No newline at end of file
+
+def cumulative_percents(numlist, total_length):
+    """
+    Abstract: Returns list of cumulative lengths of numlist in percents of total_length (x-coordinates of Nx-plots).
+    """
+    if numpy is not None:
+        return (numpy.cumsum(numpy.asarray(numlist, dtype=numpy.int64)) * 100.0 / total_length).tolist()
+    percents = []
+    lcur = 0
+    for l in numlist:
+        lcur += l
+        percents.append(lcur * 100.0 / total_length)
+    return percents
@@ -38,11 +38,9 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath,
     for i, (contigs_fpath, lens, assembly_len) in enumerate(
             zip(aligned_contigs_fpaths, aligned_lengths_lists, assembly_lengths)):
         sorted_lengths = sorted(lens, reverse=True)
-        na50, la50 = N50.NG50_and_LG50(sorted_lengths, assembly_len)
-        na75, la75 = N50.NG50_and_LG50(sorted_lengths, assembly_len, 75)
+        (na50, la50), (na75, la75) = N50.NGx_and_LGx(sorted_lengths, assembly_len, [50, 75])
         if not qconfig.is_combined_ref:
-            nga50, lga50 = N50.NG50_and_LG50(sorted_lengths, reference_length)
-            nga75, lga75 = N50.NG50_and_LG50(sorted_lengths, reference_length, 75)
+            (nga50, lga50), (nga75, lga75) = N50.NGx_and_LGx(sorted_lengths, reference_length, [50, 75])
 
         logger.info('  ' +
                     qutils.index_to_str(i) +
@@ -7,91 +7,128 @@
 
 from __future__ import with_statement
 from __future__ import division
+import math
 import os
 import re
 from os.path import join
 
-from quast_libs import fastaparser, qconfig, qutils, reporting, plotter
+from quast_libs import fastaparser, qconfig, qutils, reporting, plotter, N50, cache
+from quast_libs.qutils import run_parallel
 from quast_libs.circos import set_window_size
+from quast_libs.gc_content import count_GC_in_windows, get_GC_percents, get_total_counts
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 MIN_HISTOGRAM_POINTS = 5
 
 
-def GC_content(contigs_fpath, skip=False):
+class BasicStatsCollector(object):
     """
-       Returns percent of GC for assembly and GC distribution: (list of GC%, list of # windows)
+        Collects statistics of a FASTA-file reported by Basic statistics processor in a single pass over the file:
+        sequence lengths, number of Ns, coverage values from sequence names (e.g. NODE_1_length_100_cov_15.5),
+        GC content and GC distributions, and optionally GC tracks for Icarus and Circos (reference_length is needed for Circos).
+        If GC content is not needed and the file has the FASTA index, sequences are not read at all
     """
-    total_GC_amount = 0
-    total_contig_length = 0
-    GC_contigs_bin_num = int(100 / qconfig.GC_contig_bin_size) + 1
-    GC_contigs_distribution_x = [i * qconfig.GC_contig_bin_size for i in range(0, GC_contigs_bin_num)] # list of X-coordinates, i.e. GC %
-    GC_contigs_distribution_y = [0] * GC_contigs_bin_num # list of Y-coordinates, i.e. # contigs with GC % = x
-
-    GC_bin_num = int(100 / qconfig.GC_bin_size) + 1
-    GC_distribution_x = [i * qconfig.GC_bin_size for i in range(0, GC_bin_num)] # list of X-coordinates, i.e. GC %
-    GC_distribution_y = [0] * GC_bin_num # list of Y-coordinates, i.e. # windows with GC % = x
-    total_GC = None
-    if skip:
-        return total_GC, (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
-
-    for name, seq_full in fastaparser.read_fasta(contigs_fpath): # in tuples: (name, seq)
-        contig_ACGT_len = len(seq_full) - seq_full.count("N")
-        if not contig_ACGT_len:
-            continue
-        contig_GC_len = seq_full.count("G") + seq_full.count("C")
-        contig_GC_percent = 100.0 * contig_GC_len / contig_ACGT_len
-        GC_contigs_distribution_y[int(contig_GC_percent // qconfig.GC_contig_bin_size)] += 1
-
-        n = 100 # blocks of length 100
-        # non-overlapping windows
-        for seq in (seq_full[i:i+n] for i in range(0, len(seq_full), n)):
-            GC_percent = get_GC_percent(seq, n)
-            if not GC_percent:
+    cov_pattern = re.compile(r'_cov_(\d+\.?\d*)')
+    GC_window_size = 100  # non-overlapping windows for GC distribution
+
+    def __init__(self, fpath, skip_GC=False, icarus_gc_fpath=None, circos_gc_fpath=None, reference_length=None):
+        self.fpath = fpath
+        self.skip_GC = skip_GC
+        self.icarus_gc_fpath = icarus_gc_fpath
+        self.circos_gc_fpath = circos_gc_fpath
+        self.reference_length = reference_length
+
+        self.lengths = []
+        self.number_of_Ns = 0
+        self.coverage = []  # coverage --> total length of sequences with this coverage
+        self.total_GC = None
+        GC_contigs_bin_num = int(100 / qconfig.GC_contig_bin_size) + 1
+        GC_contigs_distribution_x = [i * qconfig.GC_contig_bin_size for i in range(0, GC_contigs_bin_num)] # list of X-coordinates, i.e. GC %
+        GC_contigs_distribution_y = [0] * GC_contigs_bin_num # list of Y-coordinates, i.e. # contigs with GC % = x
+        self.GC_contigs_distribution = (GC_contigs_distribution_x, GC_contigs_distribution_y)
+
+        GC_bin_num = int(100 / qconfig.GC_bin_size) + 1
+        GC_distribution_x = [i * qconfig.GC_bin_size for i in range(0, GC_bin_num)] # list of X-coordinates, i.e. GC %
+        GC_distribution_y = [0] * GC_bin_num # list of Y-coordinates, i.e. # windows with GC % = x
+        self.GC_distribution = (GC_distribution_x, GC_distribution_y)
+
+    def collect(self):
+        if self.skip_GC and not self.icarus_gc_fpath and not self.circos_gc_fpath:
+            for name, seq_len, seq_Ns in fastaparser.get_seq_summaries(self.fpath):
+                self._add_seq_summary(name, seq_len, seq_Ns)
+            return self
+
+        icarus_window_size = qconfig.GC_window_size_large if qconfig.large_genome else qconfig.GC_window_size
+        circos_window_size = set_window_size(self.reference_length) if self.circos_gc_fpath else None
+        window_sizes = [self.GC_window_size] + ([icarus_window_size] if self.icarus_gc_fpath else []) + \
+                       ([circos_window_size] if self.circos_gc_fpath else [])
+        icarus_out_f = open(self.icarus_gc_fpath, 'w') if self.icarus_gc_fpath else None
+        circos_out_f = open(self.circos_gc_fpath, 'w') if self.circos_gc_fpath else None
+
+        total_GC_amount = 0
+        total_ACGT_length = 0
+        chr_index = 0
+        for name, seq_full in fastaparser.read_fasta(self.fpath, binary=True): # in tuples: (name, seq)
+            self._add_seq_summary(name, len(seq_full), seq_full.count(b'N'))
+            GC_counts = count_GC_in_windows(seq_full, window_sizes)
+            if icarus_out_f:
+                icarus_out_f.write('#' + name + ' ' + str(chr_index) + '\n')
+                for GC_percent in get_GC_percents(*GC_counts[icarus_window_size], window_size=icarus_window_size):
+                    icarus_out_f.write(str(chr_index) + ' ' + str(GC_percent) + '\n')
+            if circos_out_f:
+                for i, GC_percent in enumerate(get_GC_percents(*GC_counts[circos_window_size], window_size=circos_window_size)):
+                    start = i * circos_window_size
+                    circos_out_f.write('\t'.join([name, str(start), str(start + circos_window_size), str(GC_percent) + '\n']))
+            if self.skip_GC:
                 continue
-            GC_distribution_y[int(int(GC_percent / qconfig.GC_bin_size) * qconfig.GC_bin_size)] += 1
-        total_GC_amount += contig_GC_len
-        total_contig_length += contig_ACGT_len
 
-    if total_contig_length == 0:
-        total_GC = None
-    else:
-        total_GC = total_GC_amount * 100.0 / total_contig_length
+            contig_ACGT_len, contig_GC_len = get_total_counts(*GC_counts[self.GC_window_size])
+            if not contig_ACGT_len:
+                continue
+            contig_GC_percent = 100.0 * contig_GC_len / contig_ACGT_len
+            self.GC_contigs_distribution[1][int(contig_GC_percent // qconfig.GC_contig_bin_size)] += 1
 
-    return total_GC, (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
+            for GC_percent in get_GC_percents(*GC_counts[self.GC_window_size], window_size=self.GC_window_size):
+                if not GC_percent:
+                    continue
+                self.GC_distribution[1][int(int(GC_percent / qconfig.GC_bin_size) * qconfig.GC_bin_size)] += 1
+            total_GC_amount += contig_GC_len
+            total_ACGT_length += contig_ACGT_len
 
+        if icarus_out_f:
+            icarus_out_f.close()
+        if circos_out_f:
+            circos_out_f.close()
 
-def get_GC_percent(seq, n):
-    ACGT_len = len(seq) - seq.count("N")
-    # skip block if it has less than half of ACGT letters (it also helps with "ends of contigs")
-    if ACGT_len < n // 2:
-        return 0
+        if total_ACGT_length:
+            self.total_GC = total_GC_amount * 100.0 / total_ACGT_length
+        return self
 
-    GC_len = seq.count("G") + seq.count("C")
-    GC_percent = 100.0 * GC_len / ACGT_len
-    return GC_percent
+    def _add_seq_summary(self, name, seq_len, seq_Ns):
+        self.lengths.append(seq_len)
+        self.number_of_Ns += seq_Ns
+        if self.cov_pattern.findall(name):
+            cov = int(float(self.cov_pattern.findall(name)[0]))
+            if len(self.coverage) <= cov:
+                self.coverage += [0] * (cov - len(self.coverage) + 1)
+            self.coverage[cov] += seq_len
 
 
-def save_icarus_GC(ref_fpath, gc_fpath):
-    chr_index = 0
-    n = qconfig.GC_window_size_large if qconfig.large_genome else qconfig.GC_window_size  # non-overlapping windows
-    with open(gc_fpath, 'w') as out_f:
-        for name, seq_full in fastaparser.read_fasta(ref_fpath):
-            out_f.write('#' + name + ' ' + str(chr_index) + '\n')
-            for i in range(0, len(seq_full), n):
-                seq = seq_full[i:i + n]
-                GC_percent = get_GC_percent(seq, n)
-                out_f.write(str(chr_index) + ' ' + str(GC_percent) + '\n')
+def collect_basic_stats(fpath, skip_GC=False):
+    return BasicStatsCollector(fpath, skip_GC=skip_GC).collect()
 
 
-def save_circos_GC(ref_fpath, reference_length, gc_fpath):
-    window_size = set_window_size(reference_length)
-    with open(gc_fpath, 'w') as out_f:
-        for name, seq_full in fastaparser.read_fasta(ref_fpath):
-            for i in range(0, len(seq_full), window_size):
-                seq = seq_full[i:i + window_size]
-                GC_percent = get_GC_percent(seq, window_size)
-                out_f.write('\t'.join([name, str(i), str(i + window_size), str(GC_percent) + '\n']))
+def GC_content(contigs_fpath, skip=False, icarus_gc_fpath=None, circos_gc_fpath=None, reference_length=None):
+    """
+       Returns percent of GC for assembly and GC distribution: (list of GC%, list of # windows)
+       If icarus_gc_fpath or circos_gc_fpath is specified, also saves GC tracks for Icarus and Circos
+       (reference_length is needed for Circos) during the same pass over the sequences
+    """
+    collector = BasicStatsCollector(contigs_fpath, skip_GC=skip, icarus_gc_fpath=icarus_gc_fpath,
+                                    circos_gc_fpath=circos_gc_fpath, reference_length=reference_length)
+    if not skip or icarus_gc_fpath or circos_gc_fpath:
+        collector.collect()
+    return collector.total_GC, collector.GC_distribution, collector.GC_contigs_distribution
 
 
 def binning_coverage(cov_values, nums_contigs):
@@ -187,13 +224,13 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
         reference_lengths = sorted(fastaparser.get_chr_lengths_from_fastafile(ref_fpath).values(), reverse=True)
         reference_fragments = len(reference_lengths)
         reference_length = sum(reference_lengths)
-        reference_GC, reference_GC_distribution, reference_GC_contigs_distribution = GC_content(ref_fpath)
         if qconfig.create_icarus_html or qconfig.draw_plots:
             icarus_gc_fpath = join(output_dirpath, 'gc.icarus.txt')
-            save_icarus_GC(ref_fpath, icarus_gc_fpath)
         if qconfig.draw_circos:
             circos_gc_fpath = join(output_dirpath, 'gc.circos.txt')
-            save_circos_GC(ref_fpath, reference_length, circos_gc_fpath)
+        reference_GC, reference_GC_distribution, reference_GC_contigs_distribution = \
+            GC_content(ref_fpath, icarus_gc_fpath=icarus_gc_fpath, circos_gc_fpath=circos_gc_fpath,
+                       reference_length=reference_length)
 
         logger.info('  Reference genome:')
         logger.info('    ' + os.path.basename(ref_fpath) + ', length = ' + str(reference_length) +
@@ -208,35 +245,23 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
         logger.info('  Estimated reference length = ' + str(reference_length))
 
     logger.info('  Contig files: ')
-    lists_of_lengths = []
-    numbers_of_Ns = []
-    coverage_dict = dict()
-    cov_pattern = re.compile(r'_cov_(\d+\.?\d*)')
     for id, contigs_fpath in enumerate(contigs_fpaths):
-        coverage_dict[contigs_fpath] = []
         assembly_label = qutils.label_from_fpath(contigs_fpath)
-
         logger.info('    ' + qutils.index_to_str(id) + assembly_label)
-        # lists_of_lengths.append(fastaparser.get_lengths_from_fastafile(contigs_fpath))
-        list_of_length = []
-        number_of_Ns = 0
-        for (name, seq) in fastaparser.read_fasta(contigs_fpath):
-            list_of_length.append(len(seq))
-            number_of_Ns += seq.count('N')
-            if cov_pattern.findall(name):
-                cov = int(float(cov_pattern.findall(name)[0]))
-                if len(coverage_dict[contigs_fpath]) <= cov:
-                    coverage_dict[contigs_fpath] += [0] * (cov - len(coverage_dict[contigs_fpath]) + 1)
-                coverage_dict[contigs_fpath][cov] += len(seq)
-
-        lists_of_lengths.append(list_of_length)
-        numbers_of_Ns.append(number_of_Ns)
+
+    n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
+    parallel_args = [(cache.get_entry('basic_stats', qutils.label_from_fpath(contigs_fpath), [contigs_fpath],
+                                      ['GC_bin_size', 'GC_contig_bin_size'], [qconfig.no_gc], index=index),
+                      None, collect_basic_stats, contigs_fpath, qconfig.no_gc) for index, contigs_fpath in enumerate(contigs_fpaths)]
+    collectors = run_parallel(cache.run_cached_job, parallel_args, n_jobs)
+    lists_of_lengths = [collector.lengths for collector in collectors]
+    numbers_of_Ns = [collector.number_of_Ns for collector in collectors]
+    coverage_dict = dict((contigs_fpath, collector.coverage) for contigs_fpath, collector in zip(contigs_fpaths, collectors))
 
     lists_of_lengths = [sorted(list, reverse=True) for list in lists_of_lengths]
     num_contigs = max([len(list_of_length) for list_of_length in lists_of_lengths])
     multiplicator = 1
     if num_contigs >= (qconfig.max_points * 2):
-        import math
         multiplicator = int(num_contigs / qconfig.max_points)
         max_points = num_contigs // multiplicator
         corr_lists_of_lengths = [[sum(list_of_length[((i - 1) * multiplicator):(i * multiplicator)]) for i in range(1, max_points)
@@ -250,7 +275,7 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
             last_index = len(corr_lists_of_lengths[num_list])
             corr_lists_of_lengths[num_list].append(sum(lists_of_lengths[num_list][last_index * multiplicator:]))
     else:
-        corr_lists_of_lengths = [sorted(list, reverse=True) for list in lists_of_lengths]
+        corr_lists_of_lengths = lists_of_lengths
 
     if reference_lengths:
         # Saving for an HTML report
@@ -270,19 +295,15 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
     list_of_GC_distributions = []
     list_of_GC_contigs_distributions = []
     largest_contig = 0
-    from . import N50
-    for id, (contigs_fpath, lengths_list, number_of_Ns) in enumerate(zip(contigs_fpaths, lists_of_lengths, numbers_of_Ns)):
+    for id, (contigs_fpath, lengths_list, number_of_Ns, collector) in enumerate(zip(contigs_fpaths, lists_of_lengths, numbers_of_Ns, collectors)):
         report = reporting.get(contigs_fpath)
-        n50, l50 = N50.N50_and_L50(lengths_list)
+        (n50, l50), (n75, l75) = N50.Nx_and_Lx(lengths_list, [50, 75])
         ng50, lg50 = None, None
-        if reference_length:
-            ng50, lg50 = N50.NG50_and_LG50(lengths_list, reference_length)
-        n75, l75 = N50.N50_and_L50(lengths_list, 75)
         ng75, lg75 = None, None
         if reference_length:
-            ng75, lg75 = N50.NG50_and_LG50(lengths_list, reference_length, 75)
+            (ng50, lg50), (ng75, lg75) = N50.NGx_and_LGx(lengths_list, reference_length, [50, 75])
         total_length = sum(lengths_list)
-        total_GC, GC_distribution, GC_contigs_distribution = GC_content(contigs_fpath, skip=qconfig.no_gc)
+        total_GC, GC_distribution, GC_contigs_distribution = collector.total_GC, collector.GC_distribution, collector.GC_contigs_distribution
         list_of_GC_distributions.append(GC_distribution)
         list_of_GC_contigs_distributions.append(GC_contigs_distribution)
         logger.info('    ' + qutils.index_to_str(id) +
@@ -320,7 +341,6 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
         elif reference_length:
             report.add_field(reporting.Fields.ESTREFLEN, int(reference_length))
 
-    import math
     qconfig.min_difference = math.ceil((largest_contig / 1000) / 600)  # divide on height of plot
 
     list_of_GC_distributions_with_ref = list_of_GC_distributions
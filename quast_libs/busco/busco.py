@@ -138,7 +138,7 @@ def _parse_args():
     return vars(parser.parse_args())
 
 
-def main(in_fpath, out_fname):
+def main(in_fpath, out_fname, threads=None):
     """
     This function runs a BUSCO analysis according to the provided parameters.
     See the help for more details:
@@ -152,7 +152,7 @@ def main(in_fpath, out_fname):
         config_file = os.environ.get('BUSCO_CONFIG_FILE')
     else:
         config_file = '%s//config.ini.default' % os.path.dirname(os.path.realpath(__file__))
-    config = BuscoConfig(config_file, args={'in': in_fpath, 'out': out_fname})
+    config = BuscoConfig(config_file, args={'in': in_fpath, 'out': out_fname, 'cpu': threads})
     # Define a logger, the config is passed to tell the logger if you required the quiet mode
 
     assembly_dirpath = os.path.join(config.get('busco', 'out_path'), 'run_%s' % out_fname)
@@ -7,19 +7,30 @@
 
 from __future__ import with_statement
 
+import os
 import re
-from os.path import isfile
+from multiprocessing.pool import ThreadPool
+from os.path import isfile, join
 import datetime
 
-from quast_libs import qconfig, qutils
-from quast_libs.ca_utils.analyze_misassemblies import Mapping
-from quast_libs.ca_utils.misc import minimap_fpath, parse_cs_tag
+from quast_libs import fastaparser, qconfig, qutils
+from quast_libs.ca_utils.analyze_misassemblies import Mapping, intern_name
+from quast_libs.ca_utils.coords_table import CoordsWriter, save_coords, get_text_fpath
+from quast_libs.ca_utils.misc import minimap_fpath, CsTag
 
 from quast_libs.log import get_logger
 from quast_libs.qutils import md5, is_non_empty_file
 
+try:
+    import mappy
+except ImportError:
+    mappy = None
+
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
+cigar_pattern = re.compile(r'(\d+[M=XIDNSH])')
+RAW_IDY_FORMAT = '%.2f'  # identities in text .coords files, as minimap2 output is rounded
+
 
 class AlignerStatus:
     FAILED = 0
@@ -48,6 +59,52 @@ def check_successful_check(fpath, contigs_fpath, ref_fpath):
     return True
 
 
+def get_minimap_preset():
+    if qconfig.is_agb_mode or qconfig.min_IDY < 90:
+        return 'asm20'
+    elif qconfig.min_IDY < 95 or qconfig.is_combined_ref:
+        return 'asm10'
+    return 'asm5'
+
+
+# asm5 and asm10 presets use the same indexing parameters (-k 19 -w 19), so they share the index
+minimap_index_keys = {'asm5': 'k19w19', 'asm10': 'k19w19', 'asm20': 'k19w10'}
+
+MM_F_NO_LJOIN = 0x400  # minimap2 flag for --no-long-join
+# mappy sets scoring only as a whole, so match score and gap extension penalties of the presets
+# are repeated here along with -B5 -O4,16 of run_minimap
+mappy_scoring = {'asm5': [1, 5, 4, 3, 16, 1], 'asm10': [1, 5, 4, 2, 16, 1], 'asm20': [1, 5, 4, 2, 16, 1]}
+_mappy_aligners = dict()  # reference (or its index) fpath --> mappy.Aligner
+
+
+def get_minimap_index(ref_fpath, preset, log_err_fpath=None):
+    """
+        Builds minimap2 index of the reference once and caches it in qconfig.reference_index_dirpath,
+        the index name contains the reference checksum and the indexing parameters of the preset,
+        so the index is shared only by alignment runs which would build exactly the same index.
+        Returns path to the index or, if it can't be built, ref_fpath itself (minimap2 indexes the reference on the fly then)
+    """
+    if not qconfig.reference_index_dirpath:
+        return ref_fpath
+    index_key = minimap_index_keys.get(preset, preset)
+    index_fpath = join(qconfig.reference_index_dirpath,
+                       '%s.%s.%s.mmi' % (qutils.name_from_fpath(ref_fpath), md5(ref_fpath), index_key))
+    if is_non_empty_file(index_fpath):
+        return index_fpath
+
+    logger.info('  Building minimap2 index of the reference...')
+    tmp_index_fpath = index_fpath + '_tmp'
+    cmdline = [minimap_fpath(), '-x', preset, '-t', str(qconfig.max_threads), '-d', tmp_index_fpath, ref_fpath]
+    return_code = qutils.call_subprocess(cmdline, stderr=open(log_err_fpath or os.devnull, 'a'), indent='  ')
+    if return_code != 0 or not is_non_empty_file(tmp_index_fpath):
+        logger.warning('  Failed to build minimap2 index of the reference, it will be indexed for each alignment run.')
+        if isfile(tmp_index_fpath):
+            os.remove(tmp_index_fpath)
+        return ref_fpath
+    os.rename(tmp_index_fpath, index_fpath)
+    return index_fpath
+
+
 def run_minimap_agb(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads):  # run minimap2 for AGB
     mask_level = '1' if qconfig.min_IDY < 95 else '0.9'
     cmdline = [minimap_fpath(), '-cx', 'asm20', '--mask-level', mask_level, '-N', '100',
@@ -58,15 +115,13 @@ def run_minimap_agb(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, m
 
 
 def run_minimap(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads):
+    """
+        ref_fpath can be either the reference FASTA or its minimap2 index built with get_minimap_index
+    """
     if qconfig.is_agb_mode:
         return run_minimap_agb(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads)
 
-    if qconfig.min_IDY < 90:
-        preset = 'asm20'
-    elif qconfig.min_IDY < 95 or qconfig.is_combined_ref:
-        preset = 'asm10'
-    else:
-        preset = 'asm5'
+    preset = get_minimap_preset()
     # -s -- min CIGAR score, -z -- affects how often to stop alignment extension, -B -- mismatch penalty
     # -O -- gap penalty, -r -- max gap size
     mask_level = '1' if qconfig.is_combined_ref else '0.9'
@@ -82,116 +137,203 @@ def run_minimap(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_t
 
 
 def get_aux_out_fpaths(fname):
-    coords_fpath = fname + '.coords'
-    coords_filtered_fpath = fname + '.coords.filtered'
+    coords_fpath = fname + '.coords.bin'
+    coords_filtered_fpath = fname + '.coords.filtered.bin'
     unaligned_fpath = fname + '.unaligned' if not qconfig.space_efficient else '/dev/null'
     used_snps_fpath = fname + '.used_snps' + ('.gz' if not qconfig.no_gzip else '') if not qconfig.space_efficient else '/dev/null'
     return coords_fpath, coords_filtered_fpath, unaligned_fpath, used_snps_fpath
 
 
-def parse_minimap_output(raw_coords_fpath, coords_fpath):
-    cigar_pattern = re.compile(r'(\d+[M=XIDNSH])')
+def get_covered_regions_fpath(fname):
+    return fname + '.covered_regions'
+
+
+def get_hit_mappings(contig, align_start, align_end, strand, ref_name, ref_start, matched_bases, bases_in_mapping,
+                     cigar, cs):
+    """
+        Takes a minimap2 hit with 0-based start positions (as in PAF) and yields its alignments as Mapping objects,
+        hits with identity below --min-identity are split by indels into alignments with higher identity
+    """
+    align_start += 1
+    ref_start += 1
+    strand_direction = 1
+    if strand == '-':
+        align_start, align_end = align_end, align_start
+        strand_direction = -1
+    align_len = 0
+    ref_len = 0
+    for op in cigar_pattern.findall(cigar):
+        n_bases, operation = int(op[:-1]), op[-1]
+        if operation == 'S' or operation == 'H':
+            align_start += n_bases
+        elif operation == 'M' or operation == '=' or operation == 'X':
+            align_len += n_bases
+            ref_len += n_bases
+        elif operation == 'D':
+            ref_len += n_bases
+        elif operation == 'I':
+            align_len += n_bases
 
-    total_aligned_bases = 0
+    align_end = align_start + (align_len - 1) * strand_direction
+    ref_end = ref_start + ref_len - 1
+    idy = float('%.2f' % (matched_bases * 100.0 / bases_in_mapping))
+    if idy >= qconfig.min_IDY:
+        yield Mapping(s1=ref_start, e1=ref_end, s2=align_start, e2=align_end, len1=ref_len, len2=align_len,
+                      idy=idy, ref=intern_name(ref_name), contig=intern_name(contig), cigar=cs)
+    else:
+        for align in split_align(align_start, strand_direction, ref_start, ref_name, contig, cs):
+            yield align
+
+
+def parse_minimap_output(raw_coords_fpath, coords_fpath):
+    coords_writer = CoordsWriter(coords_fpath, idy_format=RAW_IDY_FORMAT)
     with open(raw_coords_fpath) as f:
-        with open(coords_fpath, 'w') as coords_file:
-            for line in f:
-                fs = line.split('\t')
-                if len(fs) < 10:
-                    continue
-                contig, align_start, align_end, strand, ref_name, ref_start = \
-                    fs[0], fs[2], fs[3], fs[4], fs[5], fs[7]
-                align_start, align_end, ref_start = map(int, (align_start, align_end, ref_start))
-                align_start += 1
-                ref_start += 1
-                if fs[-1].startswith('cs'):
-                    cs = fs[-1].strip()
-                    cigar = fs[-2]
-                else:
-                    cs = ''
-                    cigar = fs[-1]
-                cigar = cigar.split(':')[-1]
-
-                strand_direction = 1
-                if strand == '-':
-                    align_start, align_end = align_end, align_start
-                    strand_direction = -1
-                align_len = 0
-                ref_len = 0
-                matched_bases, bases_in_mapping = map(int, (fs[9], fs[10]))
-                operations = cigar_pattern.findall(cigar)
-
-                for op in operations:
-                    n_bases, operation = int(op[:-1]), op[-1]
-                    if operation == 'S' or operation == 'H':
-                        align_start += n_bases
-                    elif operation == 'M' or operation == '=' or operation == 'X':
-                        align_len += n_bases
-                        ref_len += n_bases
-                    elif operation == 'D':
-                        ref_len += n_bases
-                    elif operation == 'I':
-                        align_len += n_bases
-
-                align_end = align_start + (align_len - 1) * strand_direction
-                ref_end = ref_start + ref_len - 1
-                total_aligned_bases += align_len
-
-                idy = '%.2f' % (matched_bases * 100.0 / bases_in_mapping)
-                if ref_name != "*":
-                    if float(idy) >= qconfig.min_IDY:
-                        align = Mapping(s1=ref_start, e1=ref_end, s2=align_start, e2=align_end, len1=ref_len,
-                                        len2=align_len, idy=idy, ref=ref_name, contig=contig, cigar=cs)
-                        coords_file.write(align.coords_str() + '\n')
-                    else:
-                        split_align(coords_file, align_start, strand_direction, ref_start, ref_name, contig, cs)
-
-
-def split_align(coords_file, align_start, strand_direction, ref_start, ref_name, contig, cs):
-    def _write_align():
-        if align_len < qconfig.min_alignment or not ref_len or not align_cs:
-            return
+        for line in f:
+            fs = line.split('\t')
+            if len(fs) < 10:
+                continue
+            contig, align_start, align_end, strand, ref_name, ref_start = \
+                fs[0], fs[2], fs[3], fs[4], fs[5], fs[7]
+            if ref_name == "*":
+                continue
+            if fs[-1].startswith('cs'):
+                cs = fs[-1].strip()
+                cigar = fs[-2]
+            else:
+                cs = ''
+                cigar = fs[-1]
+            cigar = cigar.split(':')[-1]
+            for align in get_hit_mappings(contig, int(align_start), int(align_end), strand, ref_name, int(ref_start),
+                                          int(fs[9]), int(fs[10]), cigar, cs):
+                coords_writer.add(align)
+    coords_writer.close()
+
+
+def split_align(align_start, strand_direction, ref_start, ref_name, contig, cs):
+    def _get_align(segment_end):
+        if align_len < qconfig.min_alignment or not ref_len or segment_start == segment_end:
+            return None
         align_end = align_start + (align_len - 1) * strand_direction
         ref_end = ref_start + ref_len - 1
-        align_idy = '%.2f' % (matched_bases * 100.0 / ref_len)
-        if float(align_idy) >= qconfig.min_IDY:
+        align_idy = float('%.2f' % (matched_bases * 100.0 / ref_len))
+        if align_idy >= qconfig.min_IDY:
+            align_cs_tag = cs_tag.slice(segment_start, segment_end)
             align = Mapping(s1=ref_start, e1=ref_end, s2=align_start, e2=align_end, len1=ref_len,
-                            len2=align_len, idy=align_idy, ref=ref_name, contig=contig, cigar=align_cs)
-            coords_file.write(align.coords_str() + '\n')
+                            len2=align_len, idy=align_idy, ref=intern_name(ref_name), contig=intern_name(contig),
+                            cigar=align_cs_tag.to_str())
+            align.cs_tag = align_cs_tag
+            return align
 
-    ref_len, align_len, align_end = 0, 0, 0
-    align_cs = ''
+    ref_len, align_len = 0, 0
     matched_bases = 0
-    for op in parse_cs_tag(cs):
-        if op.startswith(':'):
-            n_bases = int(op[1:])
-        else:
-            n_bases = len(op) - 1
-        if op.startswith('*'):
-            align_cs += op
+    segment_start = 0  # index of the first operation of the current alignment
+    cs_tag = CsTag.from_string(cs)
+    for i, (op, n_bases) in enumerate(zip(cs_tag.ops, cs_tag.lens)):
+        if op == '*':
             ref_len += 1
             align_len += 1
-        elif op.startswith('+'):
-            _write_align()
-            align_start += (align_len + n_bases) * strand_direction
-            ref_start += ref_len
-            align_len, ref_len, matched_bases = 0, 0, 0
-            align_cs = ''
-        elif op.startswith('-'):
-            _write_align()
-            align_start += align_len * strand_direction
-            ref_start += ref_len + n_bases
+        elif op == '+' or op == '-':
+            align = _get_align(i)
+            if align:
+                yield align
+            if op == '+':
+                align_start += (align_len + n_bases) * strand_direction
+                ref_start += ref_len
+            else:
+                align_start += align_len * strand_direction
+                ref_start += ref_len + n_bases
             align_len, ref_len, matched_bases = 0, 0, 0
-            align_cs = ''
+            segment_start = i + 1
         else:
-            align_cs += op
             ref_len += n_bases
             align_len += n_bases
             matched_bases += n_bases
-    _write_align()
+    align = _get_align(len(cs_tag.ops))
+    if align:
+        yield align
+
+
+def has_existing_alignments(output_fpath, out_basename, ref_fpath, old_contigs_fpath):
+    successful_check_fpath = out_basename + '.sf'
+    return isfile(successful_check_fpath) and isfile(output_fpath) and \
+           check_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath)
+
+
+def get_mappy_options():
+    preset = get_minimap_preset()
+    if qconfig.is_agb_mode:  # see run_minimap_agb
+        return dict(preset=preset, best_n=100, scoring=[1, 4, 6, 1, 26, 0], sc_ambi=0)
+    options = dict(preset=preset, sc_ambi=2)
+    # mappy can't set -z, but asm5, asm10 and asm20 presets already set Z-drop to 200 (as -z 200 of run_minimap)
+    if not qconfig.large_genome:  # see additional options of run_minimap
+        options.update(bw=qconfig.MAX_INDEL_LENGTH, best_n=100 if qconfig.is_combined_ref else 50,
+                       min_dp_score=qconfig.min_alignment, scoring=mappy_scoring[preset], extra_flags=MM_F_NO_LJOIN)
+    return options
+
+
+def is_mappy_supported():
+    """
+        mappy versions which can't set the scoring or output cs tags (e.g. the one shipped with minimap2 2.11) are not used
+    """
+    if mappy is None:
+        return False
+    try:
+        aligner = mappy.Aligner(seq='ACGTTGCA' * 50, **get_mappy_options())
+        list(aligner.map('ACGTTGCA' * 50, cs=True))
+    except TypeError:
+        return False
+    return True
 
 
-def align_contigs(output_fpath, out_basename, ref_fpath, contigs_fpath, old_contigs_fpath, index, threads, log_out_fpath, log_err_fpath):
+def get_mappy_aligner(ref_fpath, threads):
+    if ref_fpath not in _mappy_aligners:
+        aligner = mappy.Aligner(ref_fpath, n_threads=threads, **get_mappy_options())
+        if not aligner:
+            return None
+        _mappy_aligners[ref_fpath] = aligner
+    return _mappy_aligners[ref_fpath]
+
+
+def clear_mappy_aligners():
+    _mappy_aligners.clear()
+
+
+def align_contigs_in_process(ref_fpath, contigs_fpath, threads):
+    """
+        Aligns contigs with minimap2 Python bindings using the options of run_minimap as far as mappy supports them
+        (--mask-level, --min-occ, -g, and -z are not supported, though the presets set the same Z-drop as -z 200).
+        The reference (or its index) is loaded once per process.
+        Returns list of alignments (Mapping objects) or None if the reference can't be loaded
+    """
+    aligner = get_mappy_aligner(ref_fpath, threads)
+    if aligner is None:
+        return None
+
+    def _align_contig(contig):
+        name, seq = contig
+        return [align for hit in aligner.map(seq, cs=True)
+                for align in get_hit_mappings(name, hit.q_st, hit.q_en, '+' if hit.strand == 1 else '-', hit.ctg,
+                                              hit.r_st, hit.mlen, hit.blen, hit.cigar_str, 'cs:Z:' + hit.cs)]
+
+    contigs = ((name.split()[0], seq) for name, seq in fastaparser.read_fasta(contigs_fpath))
+    if threads > 1:  # mappy releases GIL while aligning
+        pool = ThreadPool(threads)
+        contigs_aligns = pool.imap(_align_contig, contigs)
+    else:
+        pool = None
+        contigs_aligns = map(_align_contig, contigs)
+    aligns = [align for contig_aligns in contigs_aligns for align in contig_aligns]
+    if pool:
+        pool.close()
+    return aligns
+
+
+def align_contigs(output_fpath, out_basename, ref_fpath, contigs_fpath, old_contigs_fpath, index, threads,
+                  log_out_fpath, log_err_fpath, ref_index_fpath=None):
+    """
+        Returns aligner status and list of alignments if contigs were aligned in-process (see --use-mappy),
+        otherwise None, and alignments should be read from output_fpath
+    """
     log_out_f = open(log_out_fpath, 'w')
 
     successful_check_fpath = out_basename + '.sf'
@@ -199,28 +341,36 @@ def align_contigs(output_fpath, out_basename, ref_fpath, contigs_fpath, old_cont
 
     # Checking if there are existing previous alignments.
     # If they exist, using them to save time.
-    using_existing_alignments = False
-    if isfile(successful_check_fpath) and isfile(output_fpath):
-        if check_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath):
-            log_out_f.write('\tUsing existing alignments...\n')
-            logger.info('  ' + qutils.index_to_str(index) + 'Using existing alignments... ')
-            using_existing_alignments = True
-
-    if not using_existing_alignments:
-        log_out_f.write('\tAligning contigs to the reference\n')
-        logger.info('  ' + qutils.index_to_str(index) + 'Aligning contigs to the reference')
-
-        tmp_output_fpath = output_fpath + '_tmp'
-        exit_code = run_minimap(tmp_output_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, threads)
-        if exit_code != 0:
-            return AlignerStatus.ERROR
-
-        if not isfile(tmp_output_fpath):
-            return AlignerStatus.FAILED
-        if not is_non_empty_file(tmp_output_fpath):
-            return AlignerStatus.NOT_ALIGNED
-
-        create_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath)
-        log_out_f.write('Filtering alignments...\n')
-        parse_minimap_output(tmp_output_fpath, output_fpath)
-    return AlignerStatus.OK
\ No newline at end of file
+    if has_existing_alignments(output_fpath, out_basename, ref_fpath, old_contigs_fpath):
+        log_out_f.write('\tUsing existing alignments...\n')
+        logger.info('  ' + qutils.index_to_str(index) + 'Using existing alignments... ')
+        return AlignerStatus.OK, None
+
+    log_out_f.write('\tAligning contigs to the reference\n')
+    logger.info('  ' + qutils.index_to_str(index) + 'Aligning contigs to the reference')
+
+    if qconfig.use_mappy:
+        aligns = align_contigs_in_process(ref_index_fpath or ref_fpath, contigs_fpath, threads)
+        if aligns is not None:
+            if not aligns:
+                return AlignerStatus.NOT_ALIGNED, None
+            if not qconfig.space_efficient:  # coords are saved for reusing them in the next runs
+                save_coords(output_fpath, aligns, idy_format=RAW_IDY_FORMAT)
+                create_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath)
+            return AlignerStatus.OK, aligns
+        log_out_f.write('\tFailed to load the reference into mappy, running minimap2...\n')
+
+    tmp_output_fpath = get_text_fpath(output_fpath) + '_tmp'
+    exit_code = run_minimap(tmp_output_fpath, ref_index_fpath or ref_fpath, contigs_fpath, log_err_fpath, index, threads)
+    if exit_code != 0:
+        return AlignerStatus.ERROR, None
+
+    if not isfile(tmp_output_fpath):
+        return AlignerStatus.FAILED, None
+    if not is_non_empty_file(tmp_output_fpath):
+        return AlignerStatus.NOT_ALIGNED, None
+
+    create_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath)
+    log_out_f.write('Filtering alignments...\n')
+    parse_minimap_output(tmp_output_fpath, output_fpath)
+    return AlignerStatus.OK, None
@@ -172,7 +172,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                     ca_output.stdout_f.write('\t\tOne align captures most of this contig: %s\n' % str(top_aligns[0]))
                     ca_output.icarus_out_f.write(top_aligns[0].icarus_report_str() + '\n')
                     ref_aligns.setdefault(top_aligns[0].ref, []).append(top_aligns[0])
-                    ca_output.coords_filtered_f.write(top_aligns[0].coords_str() + '\n')
+                    ca_output.coords_filtered_f.add(top_aligns[0])
                     aligned_lengths.append(top_aligns[0].len2)
                     contigs_aligned_lengths[-1] = top_aligns[0].len2
                 else:
@@ -200,7 +200,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                         ref_aligns.setdefault(top_aligns[0].ref, []).append(top_aligns[0])
                         aligned_lengths.append(top_aligns[0].len2)
                         contigs_aligned_lengths[-1] = top_aligns[0].len2
-                        ca_output.coords_filtered_f.write(top_aligns[0].coords_str() + '\n')
+                        ca_output.coords_filtered_f.add(top_aligns[0])
                         top_aligns = top_aligns[1:]
                         for align in top_aligns:
                             ca_output.stdout_f.write('\t\t\tSkipping alignment ' + str(align) + '\n')
@@ -219,7 +219,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                                 aligned_lengths.append(top_aligns[0].len2)
                                 contigs_aligned_lengths[-1] = top_aligns[0].len2
                             ambiguous_contigs_extra_bases += top_aligns[0].len2
-                            ca_output.coords_filtered_f.write(top_aligns[0].coords_str() + ' ambiguous\n')
+                            ca_output.coords_filtered_f.add(top_aligns[0], ambiguous=True)
                             top_aligns = top_aligns[1:]
             else:
                 # choose appropriate alignments (to maximize total size of contig alignment and reduce # misassemblies)
@@ -268,7 +268,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                                 ca_output.stdout_f.write('\t\tAlignment: %s\n' % str(align))
                                 ref_aligns.setdefault(align.ref, []).append(align)
                                 ambiguous_contigs_extra_bases += align.len2
-                                ca_output.coords_filtered_f.write(align.coords_str() + " ambiguous\n")
+                                ca_output.coords_filtered_f.add(align, ambiguous=True)
                                 if idx not in the_best_set.indexes:
                                     ca_output.icarus_out_f.write(align.icarus_report_str(is_best=False) + '\n')
 
@@ -281,7 +281,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                     the_only_align = real_aligns[0]
 
                     #There is only one alignment of this contig to the reference
-                    ca_output.coords_filtered_f.write(the_only_align.coords_str() + '\n')
+                    ca_output.coords_filtered_f.add(the_only_align)
                     aligned_lengths.append(the_only_align.len2)
                     contigs_aligned_lengths[-1] = the_only_align.len2
 
@@ -347,7 +347,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                             ca_output.stdout_f.write('\t\tAlignment: %s\n' % str(align))
                             ca_output.icarus_out_f.write(align.icarus_report_str() + '\n')
                             ca_output.icarus_out_f.write('unknown\n')
-                            ca_output.coords_filtered_f.write(align.coords_str() + '\n')
+                            ca_output.coords_filtered_f.add(align)
                             aligned_lengths.append(align.len2)
                             ref_aligns.setdefault(align.ref, []).append(align)
 
@@ -7,14 +7,20 @@
 
 from __future__ import with_statement
 from __future__ import division
+import sys
 
 from quast_libs import qconfig
-from quast_libs.ca_utils.misc import is_same_reference, get_ref_by_chromosome, parse_cs_tag
+from quast_libs.ca_utils.misc import is_same_reference, get_ref_by_chromosome, CsTag
 
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 from quast_libs.qutils import correct_name
 
+try:
+    intern_name = sys.intern
+except AttributeError:  # python 2
+    intern_name = intern
+
 
 class Misassembly:
     LOCAL = 0
@@ -47,11 +53,17 @@ class StructuralVariations(object):
 
 
 class Mapping(object):
+    # alignments are created for every line of coords file and cloned many times during best set selection,
+    # so attributes are stored in slots to save memory and speed up attribute access and cloning.
+    # cs_tag is the parsed cigar (cs tag), it is parsed on demand and must be reset whenever cigar is changed
+    __slots__ = ('s1', 'e1', 's2', 'e2', 'len1', 'len2', 'idy', 'ref', 'contig', 'cigar', 'ns_pos', 'sv_type', 'cs_tag')
+
     def __init__(self, s1, e1, s2=None, e2=None, len1=None, len2=None, idy=None, ref=None, contig=None, cigar=None, ns_pos=None, sv_type=None):
         self.s1, self.e1, self.s2, self.e2, self.len1, self.len2, self.idy, self.ref, self.contig = s1, e1, s2, e2, len1, len2, idy, ref, contig
         self.cigar = cigar
         self.ns_pos = ns_pos
         self.sv_type = sv_type
+        self.cs_tag = None
 
     @classmethod
     def from_line(cls, line):
@@ -59,8 +71,9 @@ class Mapping(object):
         # 4324128  4496883  |   112426   285180  |   172755   172756  |  99.9900  | gi|48994873|gb|U00096.2|	NODE_333_length_285180_cov_221082
         line = line.split()
         assert line[2] == line[5] == line[8] == line[10] == '|', line
-        ref = line[11]
-        contig = line[12]
+        # names are shared by all alignments of the same reference/contig instead of being stored for each line
+        ref = intern_name(line[11])
+        contig = intern_name(line[12])
         s1, e1, s2, e2, len1, len2 = [int(line[i]) for i in [0, 1, 3, 4, 6, 7]]
         idy = float(line[9])
         cigar = line[-1]
@@ -70,9 +83,9 @@ class Mapping(object):
         return ' '.join(str(x) for x in [self.s1, self.e1, '|', self.s2, self.e2, '|', self.len1, self.len2, '|',
                                          self.idy, '|', self.ref, self.contig])
 
-    def coords_str(self):
+    def coords_str(self, idy_format='%s'):
         return ' '.join(str(x) for x in [self.s1, self.e1, '|', self.s2, self.e2, '|', self.len1, self.len2, '|',
-                                         self.idy, '|', self.ref, self.contig, '|', self.cigar])
+                                         idy_format % self.idy, '|', self.ref, self.contig, '|', self.cigar])
 
     def short_str(self):
         return ' '.join(str(x) for x in [self.s1, self.e1, '|', self.s2, self.e2, '|', self.len1, self.len2])
@@ -80,8 +93,26 @@ class Mapping(object):
     def icarus_report_str(self, ambiguity='', is_best='True'):
         return '\t'.join(str(x) for x in [self.s1, self.e1, self.s2, self.e2, self.ref, self.contig, self.idy, ambiguity, is_best])
 
+    def __getstate__(self):  # parsed cs tag is not pickled
+        return tuple(getattr(self, attr) for attr in self.__slots__[:-1])
+
+    def __setstate__(self, state):
+        for attr, value in zip(self.__slots__, state):
+            setattr(self, attr, value)
+        self.cs_tag = None
+
     def clone(self):
-        return Mapping(self.s1, self.e1, self.s2, self.e2, self.len1, self.len2, self.idy, self.ref, self.contig, self.cigar)
+        align = Mapping.__new__(Mapping)
+        align.s1, align.e1, align.s2, align.e2, align.len1, align.len2, align.idy, align.ref, align.contig, align.cigar = \
+            self.s1, self.e1, self.s2, self.e2, self.len1, self.len2, self.idy, self.ref, self.contig, self.cigar
+        align.cs_tag = self.get_cs_tag() if self.cigar else None  # parsed once for the alignment and all its clones
+        align.ns_pos = align.sv_type = None
+        return align
+
+    def get_cs_tag(self):
+        if self.cs_tag is None:
+            self.cs_tag = CsTag.from_string(self.cigar or '')
+        return self.cs_tag
 
     def start(self):
         """Return start on contig (always <= end)"""
@@ -328,24 +359,36 @@ def check_is_scaffold_gap(inconsistency, contig_seq, align1, align2):
 def exclude_internal_overlaps(align1, align2, i=None):
     # returns size of align1.len2 decrease (or 0 if not changed). It is important for cur_aligned_len calculation
     def __shift_cigar(align, new_start=None, new_end=None):
-        new_cigar = 'cs:Z:'
-        ctg_pos = align.s2
         strand_direction = 1 if align.s2 < align.e2 else -1
         diff_len = 0
         if not align.cigar:
             return diff_len
 
-        for op in parse_cs_tag(align.cigar):
-            if op.startswith('*'):
+        # only operations near the new alignment start (end) can be changed,
+        # other operations are found by their contig offsets and copied as is
+        cs_tag = align.get_cs_tag()
+        ops_count = len(cs_tag.ops)
+        if not new_start and not new_end:  # e.g. new_end == 0: all operations go through the checks below, as before
+            changed_ops = range(0, ops_count)
+            unchanged_prefix, unchanged_suffix = '', ''
+        elif (new_start and strand_direction == 1) or (new_end and strand_direction == -1):
+            first_unchanged_op = cs_tag.find_first_op_from(new_start - align.s2 if new_start else align.s2 - new_end)
+            changed_ops = range(0, first_unchanged_op)
+            unchanged_prefix, unchanged_suffix = '', cs_tag.substr(first_unchanged_op, ops_count)
+        else:
+            first_changed_op = cs_tag.find_first_op_ending_after(new_end - align.s2 if new_end else align.s2 - new_start)
+            changed_ops = range(first_changed_op, ops_count)
+            unchanged_prefix, unchanged_suffix = cs_tag.substr(0, first_changed_op), ''
+        new_cigar = 'cs:Z:' + unchanged_prefix
+        ctg_pos = align.s2 + cs_tag.get_ctg_offset(changed_ops[0]) * strand_direction if changed_ops else None
+        for op_idx in changed_ops:
+            op, n_bases, seq = cs_tag.ops[op_idx], cs_tag.lens[op_idx], cs_tag.seqs[op_idx]
+            if op == '*':
                 if (new_start and ctg_pos >= new_start) or \
                         (new_end and ctg_pos <= new_end):
-                    new_cigar += op
+                    new_cigar += op + seq
                 ctg_pos += 1 * strand_direction
             else:
-                if op.startswith(':'):
-                    n_bases = int(op[1:])
-                else:
-                    n_bases = len(op) - 1
                 corr_n_bases = n_bases
                 if new_end and (ctg_pos + n_bases * strand_direction > new_end or ctg_pos > new_end):
                     corr_n_bases = new_end - ctg_pos + (n_bases if strand_direction == -1 else 1)
@@ -353,34 +396,36 @@ def exclude_internal_overlaps(align1, align2, i=None):
                     corr_n_bases = ctg_pos + (n_bases if strand_direction == 1 else 1) - new_start
 
                 if corr_n_bases < 1:
-                    if not op.startswith('-'):
+                    if op != '-':
                         ctg_pos += n_bases * strand_direction
-                    if op.startswith('-'):
+                    if op == '-':
                         diff_len -= n_bases
-                    if op.startswith('+'):
+                    if op == '+':
                         diff_len += n_bases
                     continue
-                if op.startswith('+'):
+                if op == '+':
                     ctg_pos += n_bases * strand_direction
                     diff_len += (n_bases - corr_n_bases)
                     if new_start:
-                        new_cigar += '+' + op[1 + (corr_n_bases - n_bases):]
+                        new_cigar += '+' + (op + seq)[1 + (corr_n_bases - n_bases):]
                     elif new_end:
-                        new_cigar += op[:corr_n_bases + 1]
-                elif op.startswith('-'):
+                        new_cigar += (op + seq)[:corr_n_bases + 1]
+                elif op == '-':
                     diff_len -= (n_bases - corr_n_bases)
                     if new_start:
-                        new_cigar += '-' + op[1 + (corr_n_bases - n_bases):]
+                        new_cigar += '-' + (op + seq)[1 + (corr_n_bases - n_bases):]
                     elif new_end:
-                        new_cigar += op[:corr_n_bases + 1]
-                elif op.startswith(':'):
+                        new_cigar += (op + seq)[:corr_n_bases + 1]
+                elif op == ':':
                     ctg_pos += n_bases * strand_direction
                     new_cigar += ':' + str(corr_n_bases)
-        align.cigar = new_cigar
+        align.cigar = new_cigar + unchanged_suffix
+        if changed_ops:
+            align.cs_tag = None
         return diff_len
 
     def __shift_start(align, new_start, diff_len):
-        align_modification = '%s' % align.short_str()
+        align_modification = '%s' % align.short_str() if i is not None else ''  # the message is printed only if i is specified
         if align.s2 < align.e2:
             align.s1 += (new_start - align.s2) - diff_len
             align.s2 = new_start
@@ -390,11 +435,12 @@ def exclude_internal_overlaps(align1, align2, i=None):
             align.e2 = new_start
             align.len2 = align.s2 - align.e2 + 1
         align.len1 = align.e1 - align.s1 + 1
-        align_modification += ' --> %s\n' % align.short_str()
+        if i is not None:
+            align_modification += ' --> %s\n' % align.short_str()
         return align_modification
 
     def __shift_end(align, new_end, diff_len):
-        align_modification = '%s' % align.short_str()
+        align_modification = '%s' % align.short_str() if i is not None else ''  # the message is printed only if i is specified
         if align.s2 < align.e2:
             align.e1 -= (align.e2 - new_end) - diff_len
             align.e2 = new_end
@@ -404,7 +450,8 @@ def exclude_internal_overlaps(align1, align2, i=None):
             align.s2 = new_end
             align.len2 = align.s2 - align.e2 + 1
         align.len1 = align.e1 - align.s1 + 1
-        align_modification += ' --> %s\n' % align.short_str()
+        if i is not None:
+            align_modification += ' --> %s\n' % align.short_str()
         return align_modification
 
     distance_on_contig = align2.start() - align1.end() - 1
@@ -497,7 +544,7 @@ def process_misassembled_contig(sorted_aligns, is_cyclic, aligned_lengths, regio
         ca_output.stdout_f.write('\t\t\tReal Alignment %d: %s\n' % (i+1, str(prev_align)))
 
         ref_aligns.setdefault(prev_align.ref, []).append(prev_align)
-        ca_output.coords_filtered_f.write(prev_align.coords_str() + '\n')
+        ca_output.coords_filtered_f.add(prev_align)
         prev_ref, next_ref = get_ref_by_chromosome(prev_align.ref), get_ref_by_chromosome(next_align.ref)
         if aux_data["is_sv"]:
             ca_output.stdout_f.write('\t\t\t  Not a misassembly (structural variation of the genome) between these two alignments\n')
@@ -623,7 +670,7 @@ def process_misassembled_contig(sorted_aligns, is_cyclic, aligned_lengths, regio
     ca_output.stdout_f.write('\t\t\tReal Alignment %d: %s' % (i + 1, str(next_align)) + '\n')
     ca_output.icarus_out_f.write(next_align.icarus_report_str() + '\n')
     ref_aligns.setdefault(next_align.ref, []).append(next_align)
-    ca_output.coords_filtered_f.write(next_align.coords_str() + '\n')
+    ca_output.coords_filtered_f.add(next_align)
     aligned_lengths.append(cur_aligned_length)
     contig_aligned_length += cur_aligned_length
 
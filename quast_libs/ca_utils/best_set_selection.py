@@ -21,6 +21,41 @@ class ScoredSet(object):
         self.score = score
         self.indexes = indexes
         self.uncovered = uncovered
+        self.tail_aligns = None
+
+    def get_tail_aligns(self, sorted_aligns):
+        """
+            Returns clones of the last two alignments of the set with excluded internal overlap between them.
+            The exclusion does not depend on alignments added to the set later, so it is done only once
+        """
+        if self.tail_aligns is None:
+            self.tail_aligns = [sorted_aligns[i].clone() for i in self.indexes[-2:]]
+            if len(self.tail_aligns) == 2:
+                exclude_internal_overlaps(*self.tail_aligns)
+        return self.tail_aligns
+
+
+class ScoredSetAligns(object):
+    """
+        Alignments of a scored set followed by a new alignment (as a list indexed from the end).
+        Only the last three alignments can differ from sorted_aligns: the overlap between the last two alignments
+        of the set is already excluded, and the last alignment of the set and the new one are cloned
+        since scoring modifies them. Earlier alignments are taken from sorted_aligns on demand
+    """
+    def __init__(self, sorted_aligns, scored_set, new_align):
+        self.sorted_aligns = sorted_aligns
+        self.indexes = scored_set.indexes
+        tail_aligns = scored_set.get_tail_aligns(sorted_aligns)
+        self.tail = tail_aligns[:-1] + [align.clone() for align in tail_aligns[-1:]] + [new_align.clone()]
+
+    def __len__(self):
+        return len(self.indexes) + 1
+
+    def __getitem__(self, idx):
+        assert -len(self) <= idx < 0, 'only negative indexes are supported'
+        if -idx <= len(self.tail):
+            return self.tail[idx]
+        return self.sorted_aligns[self.indexes[idx + 1]]
 
 
 class PutativeBestSet(object):
@@ -189,7 +224,7 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
         for scored_set in reversed(all_scored_sets):
             if scored_set.indexes and scored_set.indexes[-1] < cur_solid_idx:
                 break
-            cur_set_aligns = [sorted_aligns[i].clone() for i in scored_set.indexes] + [align.clone()]
+            cur_set_aligns = ScoredSetAligns(sorted_aligns, scored_set, align)
             score, uncovered = get_score(scored_set.score, cur_set_aligns, ref_lens, is_cyclic, scored_set.uncovered,
                                          seq, region_struct_variations, penalties)
             if score is None:  # incorrect set, i.e. internal overlap excluding resulted in incorrectly short alignment
@@ -252,7 +287,7 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
             # we can enlarge the set with "earlier" alignments only
             if scored_set.indexes and scored_set.indexes[-1] >= putative_set.indexes[0]:
                 break
-            cur_set_aligns = [sorted_aligns[i].clone() for i in scored_set.indexes] + [align.clone()]
+            cur_set_aligns = ScoredSetAligns(sorted_aligns, scored_set, align)
             score, uncovered = get_score(scored_set.score, cur_set_aligns, ref_lens, is_cyclic, scored_set.uncovered,
                                          seq, region_struct_variations, penalties)
             if score is not None:
@@ -300,8 +335,8 @@ def get_score(score, aligns, ref_lens, is_cyclic, uncovered_len, seq, region_str
         align1, align2 = aligns[-2], aligns[-1]
         is_fake_translocation = is_fragmented_ref_fake_translocation(align1, align2, ref_lens)
         overlaped_len = max(0, align1.end() - align2.start() + 1)
-        if len(aligns) > 2:  # does not affect score and uncovered but it is important for further checking on set correctness
-            exclude_internal_overlaps(aligns[-3], align1)
+        # Note: internal overlap between aligns[-3] and align1 should be already excluded (see ScoredSetAligns),
+        # it does not affect score and uncovered but it is important for further checking on set correctness
         reduced_len, _ = exclude_internal_overlaps(align1, align2)  # reduced_len is for align1 only
         # check whether the set is still correct, i.e both alignments are rather large
         if min(align1.len2, align2.len2) < qconfig.min_alignment:
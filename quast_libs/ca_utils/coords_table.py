@@ -0,0 +1,243 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Binary columnar format of alignment coords (.coords.bin and .coords.filtered.bin files).
+# Layout (all numbers are little-endian):
+#   header: magic, format version, number of alignments
+#   sections, each is prefixed with its size in bytes (uint64) and type of its values (array typecode, 's' for strings):
+#     reference names and contig names (UTF-8, separated by newlines),
+#     columns s1, e1, s2, e2, len1, len2 (int32, or int64 if values do not fit), idy (float64),
+#     ref and contig (int32 indices of the names), ambiguous (uint8, 1 for ambiguous alignments in .coords.filtered),
+#     cs (int32 or int64 offsets of cs tags in the next section), cs tags (ASCII, concatenated)
+# Readers load only the sections of requested columns (e.g. Genome analyzer does not load cs tags).
+# Text .coords files (as written by QUAST before) are saved additionally with --text-coords.
+#
+############################################################################
+
+from __future__ import with_statement
+import struct
+import sys
+from array import array
+from collections import defaultdict
+
+from quast_libs import qconfig
+from quast_libs.ca_utils.analyze_misassemblies import Mapping
+
+MAGIC = b'QUASTCRD'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sIQ')
+SECTION_HEADER = struct.Struct('<Qc')  # size in bytes, type of values ('s' for strings)
+
+try:
+    array('q')
+    INT64 = 'q'
+except ValueError:  # python 2, long is 64-bit on all supported platforms
+    INT64 = 'l'
+
+INT_COLUMNS = ['s1', 'e1', 's2', 'e2', 'len1', 'len2']
+COLUMNS = INT_COLUMNS + ['idy', 'ref', 'contig', 'ambiguous', 'cs']
+COLUMN_TYPES = dict([(name, INT64) for name in INT_COLUMNS] +
+                    [('idy', 'd'), ('ref', 'i'), ('contig', 'i'), ('ambiguous', 'B'), ('cs', INT64)])
+# sections in the order of the file
+SECTIONS = ['ref_names', 'contig_names'] + COLUMNS + ['cs_data']
+
+
+def _to_bytes(s):
+    return s if isinstance(s, bytes) else s.encode('utf-8')
+
+
+def _to_str(b):
+    return b if isinstance(b, str) else b.decode('utf-8')
+
+
+def get_text_fpath(coords_fpath):
+    return coords_fpath[:-len('.bin')] if coords_fpath.endswith('.bin') else coords_fpath
+
+
+class CoordsWriter(object):
+    """
+        Collects alignments (Mapping objects) and saves them on close.
+        If text_coords is set, alignments are also written into the text file with the same name without .bin,
+        identities are formatted with idy_format there
+    """
+    def __init__(self, fpath, text_coords=None, idy_format='%s'):
+        self.fpath = fpath
+        self.idy_format = idy_format
+        self.columns = dict((name, array(COLUMN_TYPES[name])) for name in COLUMNS)
+        self.columns['cs'].append(0)
+        self.cs_data = []
+        self.cs_len = 0
+        self.name_indices = {'ref': {}, 'contig': {}}
+        if text_coords is None:
+            text_coords = qconfig.text_coords and not qconfig.space_efficient
+        self.text_f = open(get_text_fpath(fpath), 'w') if text_coords and fpath != '/dev/null' else None
+
+    @staticmethod
+    def _get_name_index(indices, name):
+        index = indices.get(name)
+        if index is None:
+            index = indices[name] = len(indices)
+        return index
+
+    def add(self, align, ambiguous=False):
+        columns = self.columns
+        columns['s1'].append(align.s1)
+        columns['e1'].append(align.e1)
+        columns['s2'].append(align.s2)
+        columns['e2'].append(align.e2)
+        columns['len1'].append(align.len1)
+        columns['len2'].append(align.len2)
+        columns['idy'].append(align.idy)
+        columns['ref'].append(self._get_name_index(self.name_indices['ref'], align.ref))
+        columns['contig'].append(self._get_name_index(self.name_indices['contig'], align.contig))
+        columns['ambiguous'].append(1 if ambiguous else 0)
+        cs = _to_bytes(align.cigar or '')
+        self.cs_data.append(cs)
+        self.cs_len += len(cs)
+        columns['cs'].append(self.cs_len)
+        if self.text_f:
+            self.text_f.write(align.coords_str(self.idy_format) + (' ambiguous\n' if ambiguous else '\n'))
+
+    def close(self):
+        if self.text_f:
+            self.text_f.close()
+        with open(self.fpath, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(self.columns['s1'])))
+            for section in SECTIONS:
+                if section in self.columns:
+                    column = self.columns[section]
+                    if column.typecode == INT64:
+                        try:
+                            column = array('i', column)
+                        except OverflowError:  # values do not fit into int32
+                            pass
+                    if sys.byteorder == 'big':
+                        column = array(column.typecode, column)
+                        column.byteswap()
+                    data = column.tobytes() if hasattr(column, 'tobytes') else column.tostring()
+                    typecode = 'q' if column.typecode == INT64 else column.typecode
+                else:
+                    typecode = 's'
+                    if section == 'cs_data':
+                        data = b''.join(self.cs_data)
+                    else:
+                        indices = self.name_indices['ref' if section == 'ref_names' else 'contig']
+                        data = _to_bytes('\n'.join(sorted(indices, key=indices.get)))
+                f.write(SECTION_HEADER.pack(len(data), typecode.encode('ascii')))
+                f.write(data)
+
+
+def save_coords(fpath, aligns, text_coords=None, idy_format='%s'):
+    writer = CoordsWriter(fpath, text_coords, idy_format)
+    for align in aligns:
+        writer.add(align)
+    writer.close()
+
+
+class CoordsTable(object):
+    """
+        Alignments loaded from a .coords.bin file. Only the given columns are loaded (all if columns is None),
+        reference and contig names are always loaded. Rows are numbered in the order of the file,
+        rows_by_ref() and rows_by_contig() return the rows for slicing the table by chromosomes or contigs.
+    """
+    def __init__(self, fpath, columns=None):
+        self.fpath = fpath
+        self.columns = {}
+        self.cs_data = None
+        self.ref_names = []
+        self.contig_names = []
+        self._rows_by_ref = None
+        self._rows_by_contig = None
+        load_sections = set(COLUMNS if columns is None else columns) | set(['ref_names', 'contig_names'])
+        if 'cs' in load_sections:
+            load_sections.add('cs_data')
+        with open(fpath, 'rb') as f:
+            magic, version, self.size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError('Unsupported format of alignments file ' + fpath)
+            for section in SECTIONS:
+                section_size, typecode = SECTION_HEADER.unpack(f.read(SECTION_HEADER.size))
+                typecode = _to_str(typecode)
+                if section not in load_sections:
+                    f.seek(section_size, 1)
+                elif typecode != 's':
+                    column = array(INT64 if typecode == 'q' else typecode)
+                    column.fromfile(f, section_size // column.itemsize)
+                    if sys.byteorder == 'big':
+                        column.byteswap()
+                    self.columns[section] = column
+                elif section == 'cs_data':
+                    self.cs_data = _to_str(f.read(section_size))
+                else:
+                    data = _to_str(f.read(section_size))
+                    names = data.split('\n') if data else []
+                    if section == 'ref_names':
+                        self.ref_names = names
+                    else:
+                        self.contig_names = names
+
+    def __len__(self):
+        return self.size
+
+    def column(self, name, rows=None):
+        """
+            Returns values of the column for the given rows (all rows by default): ref and contig as names,
+            cs as strings, ambiguous as bool, other columns as numbers
+        """
+        if name not in self.columns:
+            raise KeyError('Column %s is not loaded from %s' % (name, self.fpath))
+        values = self.columns[name]
+        if name == 'cs':
+            cs_data = self.cs_data
+            if rows is None:
+                return [cs_data[start:end] for start, end in zip(values, values[1:])]
+            return [cs_data[values[row]:values[row + 1]] for row in rows]
+        if rows is not None:
+            values = [values[row] for row in rows]
+        if name == 'ref':
+            return [self.ref_names[i] for i in values]
+        if name == 'contig':
+            return [self.contig_names[i] for i in values]
+        if name == 'ambiguous':
+            return [bool(v) for v in values]
+        return values
+
+    def _group_rows(self, name):
+        rows_by_name = defaultdict(list)
+        names = self.ref_names if name == 'ref' else self.contig_names
+        for row, name_idx in enumerate(self.columns[name]):
+            rows_by_name[names[name_idx]].append(row)
+        return dict(rows_by_name)
+
+    def rows_by_ref(self):
+        """
+            Returns dict: reference chromosome name --> list of rows in the file order
+        """
+        if self._rows_by_ref is None:
+            self._rows_by_ref = self._group_rows('ref')
+        return self._rows_by_ref
+
+    def rows_by_contig(self):
+        """
+            Returns dict: contig name --> list of rows in the file order
+        """
+        if self._rows_by_contig is None:
+            self._rows_by_contig = self._group_rows('contig')
+        return self._rows_by_contig
+
+    def iter_rows(self, columns, rows=None):
+        """
+            Returns iterator over tuples with values of the columns (see column()) for the given rows (all rows by default),
+            e.g. iter_rows(['s1', 'e1'], table.rows_by_ref()[chr_name])
+        """
+        return iter(zip(*[self.column(name, rows) for name in columns]))
+
+    def mappings(self, rows=None):
+        """
+            Returns list of Mapping objects for the given rows (all rows by default), all columns should be loaded
+        """
+        return [Mapping(s1, e1, s2, e2, len1, len2, idy, ref, contig, cigar) for s1, e1, s2, e2, len1, len2, idy, ref, contig, cigar
+                in self.iter_rows(INT_COLUMNS + ['idy', 'ref', 'contig', 'cs'], rows)]
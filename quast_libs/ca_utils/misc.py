@@ -13,7 +13,8 @@ from __future__ import with_statement
 import gzip
 import os
 import re
-from itertools import repeat
+from bisect import bisect_left, bisect_right
+from itertools import compress, repeat
 from os.path import isdir, join, basename
 
 try:
@@ -60,9 +61,125 @@ def get_ref_by_chromosome(chrom):
     return ref_labels_by_chromosomes[chrom] if chrom in ref_labels_by_chromosomes else ''
 
 
-def parse_cs_tag(cigar):
-    cs_pattern = re.compile(r':\d+|\*[acgtn]+|\-[acgtn]+|\+[acgtn]+')
-    return cs_pattern.findall(cigar)
+cs_pattern = re.compile(r'([:*+\-])(\d+|[acgtn]+)')
+
+
+class CsTag(object):
+    """
+        Parsed cs tag of an alignment (e.g. cs:Z::10*ag:5+tt-c:7) stored as parallel lists:
+        operation codes (a string with one char per operation: ':', '*', '+', or '-'), operation lengths,
+        and operation sequences (reference and contig letters for mismatches, inserted or deleted bases for indels,
+        empty strings for matches). Tags are not modified after parsing, so alignment clones share them.
+        Offsets of operations and their string representation are computed on demand and cached too
+    """
+    __slots__ = ('ops', 'lens', 'seqs', '_offsets', '_str_offsets')
+
+    def __init__(self, ops, lens, seqs):
+        self.ops, self.lens, self.seqs = ops, lens, seqs
+        self._offsets = None
+        self._str_offsets = None
+
+    @classmethod
+    def from_string(cls, cs):
+        tokens = cs_pattern.findall(cs)
+        return cls(''.join(op for op, _ in tokens),
+                   [int(value) if op == ':' else (1 if op == '*' else len(value)) for op, value in tokens],
+                   ['' if op == ':' else value for op, value in tokens])
+
+    def __getstate__(self):
+        return self.ops, self.lens, self.seqs
+
+    def __setstate__(self, state):
+        self.ops, self.lens, self.seqs = state
+        self._offsets = None
+        self._str_offsets = None
+
+    def slice(self, start, end):
+        return CsTag(self.ops[start:end], self.lens[start:end], self.seqs[start:end])
+
+    def op_to_str(self, i):
+        return self.ops[i] + (str(self.lens[i]) if self.ops[i] == ':' else self.seqs[i])
+
+    def to_str(self):
+        return ''.join(self.op_to_str(i) for i in range(len(self.ops)))
+
+    def substr(self, start, end):
+        """
+            Returns string representation of operations from start to end (not including)
+        """
+        if self._str_offsets is None:
+            str_offsets = [0]
+            for i in range(len(self.ops)):
+                str_offsets.append(str_offsets[-1] + len(self.op_to_str(i)))
+            self._str_offsets = self.to_str(), str_offsets
+        cs_str, str_offsets = self._str_offsets
+        return cs_str[str_offsets[start]:str_offsets[end]]
+
+    def count_mismatches(self):
+        """
+            Mismatches with N in the reference or in the contig are not counted
+        """
+        mismatches = self.ops.count('*')
+        if mismatches and any('n' in seq for seq in self.seqs):
+            mismatches -= sum(1 for op, seq in zip(self.ops, self.seqs) if op == '*' and 'n' in seq)
+        return mismatches
+
+    def count_bases(self, op_code):
+        if op_code not in self.ops:
+            return 0
+        return sum(compress(self.lens, map(op_code.__eq__, self.ops)))
+
+    def get_indel_lens(self):
+        if '+' not in self.ops and '-' not in self.ops:
+            return []
+        return list(compress(self.lens, map('+-'.__contains__, self.ops)))
+
+    def _get_offsets(self):
+        """
+            Returns lists of reference and contig offsets of operations from the alignment start (the last items are
+            offsets of the alignment end) and running maximums of contig offsets of operation ends
+            (deletions are considered to span their length on the contig)
+        """
+        if self._offsets is None:
+            ref_offsets, ctg_offsets, ctg_end_maxes = [0], [0], []
+            ref_offset, ctg_offset, ctg_end_max = 0, 0, 0
+            for op, n_bases in zip(self.ops, self.lens):
+                ctg_end_max = max(ctg_end_max, ctg_offset + n_bases)
+                ctg_end_maxes.append(ctg_end_max)
+                if op != '+':
+                    ref_offset += n_bases
+                if op != '-':
+                    ctg_offset += n_bases
+                ref_offsets.append(ref_offset)
+                ctg_offsets.append(ctg_offset)
+            self._offsets = ref_offsets, ctg_offsets, ctg_end_maxes
+        return self._offsets
+
+    def project(self, ref_start, ctg_start, strand_direction=1):
+        """
+            Returns lists of reference and contig positions of the first base of each operation
+            (for insertions the reference position is the one following the insertion, and vice versa for deletions)
+        """
+        ref_offsets, ctg_offsets, _ = self._get_offsets()
+        return [ref_start + offset for offset in ref_offsets[:-1]], \
+               [ctg_start + offset * strand_direction for offset in ctg_offsets[:-1]]
+
+    def get_ctg_offset(self, i):
+        return self._get_offsets()[1][i]
+
+    def find_first_op_from(self, ctg_offset):
+        """
+            Returns index of the first operation starting at ctg_offset on the contig or later
+            (number of operations if there is no such operation)
+        """
+        return bisect_left(self._get_offsets()[1], ctg_offset, 0, len(self.ops))
+
+    def find_first_op_ending_after(self, ctg_offset):
+        """
+            Returns index of the first operation which ends after ctg_offset on the contig
+            or follows such an operation (number of operations if there is no such operation)
+        """
+        return bisect_right(self._get_offsets()[2], ctg_offset)
 
 
 def print_file(all_rows, fpath, append_to_existing_file=False):
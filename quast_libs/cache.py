@@ -0,0 +1,195 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Result cache shared by QUAST runs (--cache-dir). Results of per-assembly jobs are stored under a key built from
+# checksums of the job input files and values of the options the job depends on, so a rerun with a new assembly
+# added to the old ones recomputes only the new assembly and the combined reports.
+# An entry keeps the value returned by the job and copies of its output files. Paths to the input and output files
+# in the value are saved as placeholders and replaced with the paths of the current run when the entry is loaded.
+#
+############################################################################
+
+from __future__ import with_statement
+import hashlib
+import os
+import pickle
+import shutil
+from os.path import join, isfile, isdir, dirname, abspath
+
+from quast_libs import qconfig, qutils
+from quast_libs.log import get_logger
+
+logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+
+CACHE_FORMAT_VERSION = 2  # increase when the format of entries or of values returned by cached jobs changes
+VALUE_FNAME = 'value.pickle'
+
+
+def _write_atomically(fpath, content):
+    tmp_fpath = fpath + '.tmp%d' % os.getpid()
+    with open(tmp_fpath, 'w') as f:
+        f.write(content)
+    os.rename(tmp_fpath, fpath)
+
+
+def _makedirs(dirpath):
+    try:
+        os.makedirs(dirpath)
+    except OSError:  # created by a concurrent job
+        if not isdir(dirpath):
+            raise
+
+
+def get_checksum(fpath):
+    """
+        Returns MD5 of the file content. Checksums are memoized in the cache directory
+        by the absolute path, size and modification time of the file
+    """
+    if not fpath or not isfile(fpath):
+        return None
+    fpath = abspath(fpath)
+    stat = os.stat(fpath)
+    file_id = '%s\t%d\t%r' % (fpath, stat.st_size, stat.st_mtime)
+    checksums_dirpath = join(qconfig.cache_dirpath, 'checksums')
+    memo_fpath = join(checksums_dirpath, hashlib.md5(fpath.encode('utf-8')).hexdigest())
+    if isfile(memo_fpath):
+        with open(memo_fpath) as f:
+            memo = f.read().split('\n')
+        if len(memo) == 2 and memo[0] == file_id:
+            return memo[1]
+    checksum = qutils.md5(fpath)
+    _makedirs(checksums_dirpath)
+    _write_atomically(memo_fpath, file_id + '\n' + checksum)
+    return checksum
+
+
+def get_key(stage_name, input_fpaths, option_names=(), params=()):
+    """
+        Key of a job result: checksums of the input files, values of qconfig options
+        and other parameters (of simple types) the result depends on
+    """
+    key_values = [CACHE_FORMAT_VERSION, stage_name, [get_checksum(fpath) for fpath in input_fpaths],
+                  [(name, getattr(qconfig, name)) for name in option_names], list(params)]
+    return hashlib.md5(repr(key_values).encode('utf-8')).hexdigest()
+
+
+class _PathsPickler(pickle.Pickler):
+    def __init__(self, f, fpaths):
+        pickle.Pickler.__init__(self, f, pickle.HIGHEST_PROTOCOL)
+        self.fpath_indices = dict((fpath, i) for i, fpath in enumerate(fpaths) if fpath)
+
+    def persistent_id(self, obj):
+        if type(obj) is str and obj in self.fpath_indices:
+            return self.fpath_indices[obj]
+        return None
+
+
+class _PathsUnpickler(pickle.Unpickler):
+    def __init__(self, f, fpaths):
+        pickle.Unpickler.__init__(self, f)
+        self.fpaths = fpaths
+
+    def persistent_load(self, pid):
+        return self.fpaths[pid]
+
+
+class CacheEntry(object):
+    def __init__(self, stage_name, key, label, index=None, input_fpaths=None, output_fpaths=None, files_only=False):
+        """
+            files_only entries keep only output files of jobs which reuse existing output files by themselves
+            (e.g. BUSCO and read alignments): the files are restored before the job is started
+        """
+        self.dirpath = join(qconfig.cache_dirpath, stage_name, key)
+        self.label = label
+        self.index = index
+        self.output_fpaths = output_fpaths or []
+        self.fpaths = (input_fpaths or []) + self.output_fpaths
+        self.files_only = files_only
+
+    def _index_str(self):
+        return qutils.index_to_str(self.index) if self.index is not None else ''
+
+    def exists(self):
+        return isfile(join(self.dirpath, VALUE_FNAME))
+
+    def load(self):
+        """
+            Restores output files of the entry. Returns (True, value) if the entry is found, (False, None) otherwise
+        """
+        if not self.exists():
+            return False, None
+        try:
+            with open(join(self.dirpath, VALUE_FNAME), 'rb') as f:
+                saved_indices, value = _PathsUnpickler(f, self.fpaths).load()
+            for i in saved_indices:
+                fpath = self.output_fpaths[i]
+                _makedirs(dirname(fpath))
+                shutil.copyfile(join(self.dirpath, str(i)), fpath)
+        except Exception:
+            logger.warning('  ' + self._index_str() + 'Failed loading cached results for ' + self.label +
+                           ' from ' + self.dirpath + ', they will be computed again.')
+            shutil.rmtree(self.dirpath, ignore_errors=True)
+            return False, None
+        logger.info('  ' + self._index_str() + 'Using cached results for ' + self.label)
+        return True, value
+
+    def save(self, value=None):
+        """
+            Output files are copied (not linked) since QUAST rewrites existing output files in place
+        """
+        tmp_dirpath = self.dirpath + '.tmp%d' % os.getpid()
+        if isdir(tmp_dirpath):
+            shutil.rmtree(tmp_dirpath)
+        _makedirs(tmp_dirpath)
+        saved_indices = []
+        for i, fpath in enumerate(self.output_fpaths):
+            if isfile(fpath):  # skips also disabled outputs (/dev/null)
+                shutil.copyfile(fpath, join(tmp_dirpath, str(i)))
+                saved_indices.append(i)
+        with open(join(tmp_dirpath, VALUE_FNAME), 'wb') as f:
+            _PathsPickler(f, self.fpaths).dump((saved_indices, value))
+        try:
+            os.rename(tmp_dirpath, self.dirpath)
+        except OSError:  # the entry was saved by a concurrent run
+            shutil.rmtree(tmp_dirpath, ignore_errors=True)
+
+
+def get_entry(stage_name, label, input_fpaths, option_names=(), params=(), output_fpaths=None, index=None,
+              files_only=False):
+    """
+        Returns None if the cache is disabled
+    """
+    if not qconfig.cache_dirpath:
+        return None
+    key = get_key(stage_name, input_fpaths, option_names, params)
+    return CacheEntry(stage_name, key, label, index=index, input_fpaths=list(input_fpaths),
+                      output_fpaths=output_fpaths, files_only=files_only)
+
+
+def is_successful(value):
+    """
+        Jobs return None or tuple of Nones if they failed
+    """
+    if isinstance(value, tuple):
+        return any(item is not None for item in value)
+    return value is not None
+
+
+def run_cached_job(cache_entry, is_successful_fn, fn, *args, **kwargs):
+    """
+        Runs fn(*args, **kwargs) unless its result is in the cache (cache_entry is None if the cache is disabled),
+        successful results (checked with is_successful_fn, or with is_successful if it is None) are saved into the cache.
+        Can be passed to qutils.run_parallel and run_parallel_by_size
+    """
+    if cache_entry is None:
+        return fn(*args, **kwargs)
+    is_found, value = cache_entry.load()
+    if is_found and not cache_entry.files_only:
+        return value
+    value = fn(*args, **kwargs)
+    if not is_found and (is_successful_fn or is_successful)(value):
+        cache_entry.save(None if cache_entry.files_only else value)
+    return value
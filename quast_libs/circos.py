@@ -20,7 +20,8 @@ except ImportError:
 
 from quast_libs import qutils, qconfig
 from quast_libs.ca_utils.align_contigs import get_aux_out_fpaths
-from quast_libs.ca_utils.misc import create_minimap_output_dir, parse_cs_tag
+from quast_libs.ca_utils.coords_table import CoordsTable
+from quast_libs.ca_utils.misc import create_minimap_output_dir, CsTag
 from quast_libs.fastaparser import get_chr_lengths_from_fastafile
 from quast_libs.icarus_utils import get_assemblies, check_misassembled_blocks, Alignment
 from quast_libs.qutils import get_path_to_program, is_non_empty_file, relpath
@@ -276,19 +277,15 @@ def create_mismatches_plot(assembly, window_size, ref_len, root_dir, output_dir)
 
     mismatches_fpath = join(output_dir, assembly_label + '.mismatches.txt')
     mismatch_density_by_chrom = defaultdict(lambda : [0] * (ref_len // window_size + 1))
-    with open(coords_filtered_fpath) as coords_file:
-        for line in coords_file:
-            s1 = int(line.split('|')[0].split()[0])
-            chrom = line.split()[11].strip()
-            cigar = line.split()[-1].strip()
-            ref_pos = s1
-            for op in parse_cs_tag(cigar):
-                n_bases = len(op) - 1
-                if op.startswith('*'):
-                    mismatch_density_by_chrom[chrom][int(ref_pos) // window_size] += 1
-                    ref_pos += 1
-                elif not op.startswith('+'):
-                    ref_pos += n_bases
+    coords_table = CoordsTable(coords_filtered_fpath, columns=['s1', 'ref', 'cs'])
+    for s1, chrom, cigar in coords_table.iter_rows(['s1', 'ref', 'cs']):
+        if '*' not in cigar:
+            continue
+        cs_tag = CsTag.from_string(cigar)
+        ref_positions, _ = cs_tag.project(s1, 0)
+        for op, ref_pos in zip(cs_tag.ops, ref_positions):
+            if op == '*':
+                mismatch_density_by_chrom[chrom][ref_pos // window_size] += 1
     with open(mismatches_fpath, 'w') as out_f:
         for chrom, density_list in mismatch_density_by_chrom.items():
             start, end = 0, 0
@@ -21,25 +21,41 @@ import os
 import sys
 import re
 from collections import defaultdict
+try:
+   from collections import OrderedDict
+except ImportError:
+   from quast_libs.site_packages.ordered_dict import OrderedDict
 from os.path import join, dirname
 
-from quast_libs import reporting, qconfig, qutils, fastaparser
+from quast_libs import reporting, qconfig, qutils, fastaparser, cache
 from quast_libs.ca_utils import misc
 from quast_libs.ca_utils.analyze_contigs import analyze_contigs
-from quast_libs.ca_utils.analyze_misassemblies import Mapping, IndelsInfo
+from quast_libs.ca_utils.analyze_misassemblies import IndelsInfo
+from quast_libs.ca_utils.coords_table import CoordsTable, CoordsWriter, get_text_fpath
 from quast_libs.ca_utils.misc import ref_labels_by_chromosomes, compile_aligner, \
-    create_minimap_output_dir, close_handlers, parse_cs_tag
+    create_minimap_output_dir, close_handlers
 
-from quast_libs.ca_utils.align_contigs import align_contigs, get_aux_out_fpaths, AlignerStatus
+from quast_libs.ca_utils.align_contigs import align_contigs, get_aux_out_fpaths, get_covered_regions_fpath, AlignerStatus, \
+    get_minimap_index, get_minimap_preset, has_existing_alignments, is_mappy_supported, clear_mappy_aligners
 from quast_libs.ca_utils.save_results import print_results, save_result, save_result_for_unaligned, \
     save_combined_ref_stats
 from quast_libs.fastaparser import get_genome_stats
+from quast_libs.intervals import merge_intervals, subtract_intervals, intervals_length, get_aligned_intervals, \
+    save_intervals
 
 from quast_libs.log import get_logger
-from quast_libs.qutils import is_python2, run_parallel
+from quast_libs.qutils import is_python2, run_parallel_by_size
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
+# options affecting alignments and their analysis, results are cached for each combination of their values
+CACHE_KEY_OPTIONS = ['min_alignment', 'min_IDY', 'ambiguity_usage', 'ambiguity_score', 'extensive_misassembly_threshold',
+                     'fragmented_max_indent', 'check_for_fragmented_ref', 'unaligned_part_size', 'unaligned_mis_threshold',
+                     'large_genome', 'is_agb_mode', 'is_combined_ref', 'use_mappy', 'show_snps', 'no_gzip', 'strict_NA', 'text_coords',
+                     'space_efficient',
+                     'BSS_MAX_SETS_NUMBER', 'BSS_critical_number_of_aligns', 'BSS_EXTENSIVE_PENALTY', 'BSS_LOCAL_PENALTY',
+                     'MAX_INDEL_LENGTH', 'SHORT_INDEL_THRESHOLD', 'Ns_break_threshold', 'scaffolds_gap_threshold']
+
 
 class CAOutput():
     def __init__(self, stdout_f, misassembly_f=None, coords_filtered_f=None, used_snps_f=None, icarus_out_f=None):
@@ -50,64 +66,72 @@ class CAOutput():
         self.icarus_out_f = icarus_out_f
 
 
+def write_used_snps(used_snps_f, chr_name, align, cs_tag):
+    strand_direction = 1 if align.s2 < align.e2 else -1
+    ref_positions, ctg_positions = cs_tag.project(align.s1, align.s2, strand_direction)
+    for op, n_bases, seq, ref_pos, ctg_pos in zip(cs_tag.ops, cs_tag.lens, cs_tag.seqs, ref_positions, ctg_positions):
+        if op == ':':
+            continue
+        if op == '*':
+            ref_nucl, ctg_nucl = seq[0].upper(), seq[1].upper()
+            if ctg_nucl == 'N' or ref_nucl == 'N':
+                continue
+        elif n_bases >= qconfig.MAX_INDEL_LENGTH:
+            continue
+        elif op == '+':
+            ref_nucl, ctg_nucl = '.', seq.upper()
+        else:
+            ref_nucl, ctg_nucl = seq.upper(), '.'
+        used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, ref_nucl, ctg_nucl, ctg_pos))
+
+
 def analyze_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes, used_snps_fpath):
     indels_info = IndelsInfo()
-    genome_mapping = {}
-    for chr_name, chr_len in reference_chromosomes.items():
-        genome_mapping[chr_name] = [0] * (chr_len + 1)
+    covered_regions = OrderedDict()
     with open(used_snps_fpath, 'w') as used_snps_f:
         for chr_name, aligns in ref_aligns.items():
             for align in aligns:
-                ref_pos, ctg_pos = align.s1, align.s2
-                strand_direction = 1 if align.s2 < align.e2 else -1
-                for op in parse_cs_tag(align.cigar):
-                    if op.startswith(':'):
-                        n_bases = int(op[1:])
-                    else:
-                        n_bases = len(op) - 1
-                    if op.startswith('*'):
-                        ref_nucl, ctg_nucl = op[1].upper(), op[2].upper()
-                        if ctg_nucl != 'N' and ref_nucl != 'N':
-                            indels_info.mismatches += 1
-                            if qconfig.show_snps:
-                                used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, ref_nucl, ctg_nucl, ctg_pos))
-                        ref_pos += 1
-                        ctg_pos += 1 * strand_direction
-                    elif op.startswith('+'):
-                        indels_info.indels_list.append(n_bases)
-                        indels_info.insertions += n_bases
-                        if qconfig.show_snps and n_bases < qconfig.MAX_INDEL_LENGTH:
-                            ref_nucl, ctg_nucl = '.', op[1:].upper()
-                            used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, ref_nucl, ctg_nucl, ctg_pos))
-                        ctg_pos += n_bases * strand_direction
-                    elif op.startswith('-'):
-                        indels_info.indels_list.append(n_bases)
-                        indels_info.deletions += n_bases
-                        if qconfig.show_snps and n_bases < qconfig.MAX_INDEL_LENGTH:
-                            ref_nucl, ctg_nucl = op[1:].upper(), '.'
-                            used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, ref_nucl, ctg_nucl, ctg_pos))
-                        ref_pos += n_bases
-                    else:
-                        ref_pos += n_bases
-                        ctg_pos += n_bases * strand_direction
-                if align.s1 < align.e1:
-                    for pos in range(align.s1, align.e1 + 1):
-                        genome_mapping[align.ref][pos] = 1
-                else:
-                    for pos in range(align.s1, len(genome_mapping[align.ref])):
-                        genome_mapping[align.ref][pos] = 1
-                    for pos in range(1, align.e1 + 1):
-                        genome_mapping[align.ref][pos] = 1
-            for i in ns_by_chromosomes[align.ref]:
-                genome_mapping[align.ref][i] = 0
-
-    covered_bases = sum([sum(genome_mapping[chrom]) for chrom in genome_mapping])
-    return covered_bases, indels_info
+                cs_tag = align.get_cs_tag()
+                indels_info.mismatches += cs_tag.count_mismatches()
+                indels_info.insertions += cs_tag.count_bases('+')
+                indels_info.deletions += cs_tag.count_bases('-')
+                indels_info.indels_list += cs_tag.get_indel_lens()
+                if qconfig.show_snps and cs_tag.ops.count(':') < len(cs_tag.ops):
+                    write_used_snps(used_snps_f, chr_name, align, cs_tag)
+            aligned_intervals = merge_intervals(get_aligned_intervals(aligns, reference_chromosomes[chr_name]))
+            covered_regions[chr_name] = subtract_intervals(aligned_intervals, ns_by_chromosomes[chr_name])
+
+    covered_bases = sum(intervals_length(intervals) for intervals in covered_regions.values())
+    return covered_bases, indels_info, covered_regions
+
+
+def get_output_fpaths(contigs_fpath, output_dirpath):
+    """
+        Returns paths to files saved by align_and_analyze
+    """
+    corr_assembly_label = qutils.label_from_fpath_for_fname(contigs_fpath)
+    report_basename = join(output_dirpath, qconfig.contig_report_fname_pattern % corr_assembly_label)
+    out_basename = join(create_minimap_output_dir(output_dirpath), corr_assembly_label)
+    coords_fpath, coords_filtered_fpath, unaligned_fpath, used_snps_fpath = get_aux_out_fpaths(out_basename)
+    output_fpaths = [report_basename + '.stdout', report_basename + '.stderr', report_basename + '.mis_contigs.info',
+                     report_basename + '.unaligned.info', join(output_dirpath, qconfig.icarus_report_fname_pattern % corr_assembly_label),
+                     join(output_dirpath, qutils.name_from_fpath(contigs_fpath) + '.mis_contigs.fa'),
+                     out_basename + '.sf', get_covered_regions_fpath(out_basename), coords_fpath, coords_filtered_fpath,
+                     get_text_fpath(coords_fpath), get_text_fpath(coords_filtered_fpath), unaligned_fpath, used_snps_fpath]
+    if qconfig.is_combined_ref:
+        output_fpaths += [join(output_dirpath, 'alignments_' + corr_assembly_label + '.tsv'),
+                          join(output_dirpath, qconfig.unique_contigs_fname_pattern % corr_assembly_label)]
+    return output_fpaths
+
+
+def is_analysis_finished(results):
+    status = results[0]
+    return status in [AlignerStatus.OK, AlignerStatus.NOT_ALIGNED]
 
 
 # former plantagora and plantakolya
 def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath,
-                      reference_chromosomes, ns_by_chromosomes, old_contigs_fpath, bed_fpath, threads=1):
+                      reference_chromosomes, ns_by_chromosomes, old_contigs_fpath, bed_fpath, ref_index_fpath=None, threads=1):
     tmp_output_dirpath = create_minimap_output_dir(output_dirpath)
     assembly_label = qutils.label_from_fpath(contigs_fpath)
     corr_assembly_label = qutils.label_from_fpath_for_fname(contigs_fpath)
@@ -140,8 +164,8 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
         logger.info('  ' + qutils.index_to_str(index) + 'Logging is disabled.')
 
     coords_fpath, coords_filtered_fpath, unaligned_fpath, used_snps_fpath = get_aux_out_fpaths(out_basename)
-    status = align_contigs(coords_fpath, out_basename, ref_fpath, contigs_fpath, old_contigs_fpath, index, threads,
-                           log_out_fpath, log_err_fpath)
+    status, mappings = align_contigs(coords_fpath, out_basename, ref_fpath, contigs_fpath, old_contigs_fpath, index,
+                                     threads, log_out_fpath, log_err_fpath, ref_index_fpath=ref_index_fpath)
     if status != AlignerStatus.OK:
         with open(log_err_fpath, 'a') as log_err_f:
             if status == AlignerStatus.ERROR:
@@ -160,11 +184,11 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
     log_out_f = open(log_out_fpath, 'a')
     # Loading the alignment files
     log_out_f.write('Parsing coords...\n')
+    if mappings is None:
+        mappings = CoordsTable(coords_fpath).mappings()
     aligns = {}
-    with open(coords_fpath) as coords_file:
-        for line in coords_file:
-            mapping = Mapping.from_line(line)
-            aligns.setdefault(mapping.contig, []).append(mapping)
+    for mapping in mappings:
+        aligns.setdefault(mapping.contig, []).append(mapping)
 
     # Loading the reference sequences
     log_out_f.write('Loading reference...\n') # TODO: move up
@@ -185,7 +209,7 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
     log_out_f.write('\tTotal Regions: %d\n' % total_regions)
     log_out_f.write('\tTotal Region Length: %d\n' % total_reg_len)
 
-    ca_output = CAOutput(stdout_f=log_out_f, misassembly_f=misassembly_f, coords_filtered_f=open(coords_filtered_fpath, 'w'),
+    ca_output = CAOutput(stdout_f=log_out_f, misassembly_f=misassembly_f, coords_filtered_f=CoordsWriter(coords_filtered_fpath),
                          icarus_out_f=icarus_out_f)
 
     log_out_f.write('Analyzing contigs...\n')
@@ -195,7 +219,9 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
     log_out_f.write('Analyzing coverage...\n')
     if qconfig.show_snps:
         log_out_f.write('Writing SNPs into ' + used_snps_fpath + '\n')
-    total_aligned_bases, indels_info = analyze_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes, used_snps_fpath)
+    total_aligned_bases, indels_info, covered_regions = analyze_coverage(ref_aligns, reference_chromosomes,
+                                                                         ns_by_chromosomes, used_snps_fpath)
+    save_intervals(get_covered_regions_fpath(out_basename), covered_regions)
     total_indels_info += indels_info
     cov_stats = {'SNPs': total_indels_info.mismatches, 'indels_list': total_indels_info.indels_list, 'total_aligned_bases': total_aligned_bases}
     result.update(cov_stats)
@@ -203,8 +229,7 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
 
     if not qconfig.space_efficient:
         ## outputting misassembled contigs to separate file
-        fasta = [(name, seq) for name, seq in fastaparser.read_fasta(contigs_fpath)
-                 if name in misassembled_contigs.keys()]
+        fasta = list(fastaparser.read_fasta_by_names(contigs_fpath, misassembled_contigs))
         fastaparser.write_fasta(join(output_dirpath, qutils.name_from_fpath(contigs_fpath) + '.mis_contigs.fa'), fasta)
 
     if qconfig.is_combined_ref:
@@ -258,16 +283,34 @@ def do(reference, contigs_fpaths, is_cyclic, output_dir, old_contigs_fpaths, bed
         return dict(zip(contigs_fpaths, [AlignerStatus.FAILED] * len(contigs_fpaths))), None
 
     num_nf_errors = logger._num_nf_errors
-    create_minimap_output_dir(output_dir)
-    n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
-    threads = max(1, qconfig.max_threads // n_jobs)
-
+    minimap_output_dirpath = create_minimap_output_dir(output_dir)
     genome_size, reference_chromosomes, ns_by_chromosomes = get_genome_stats(reference, skip_ns=True)
-    threads = qconfig.max_threads if qconfig.memory_efficient else threads
-    args = [(is_cyclic, i, contigs_fpath, output_dir, reference, reference_chromosomes, ns_by_chromosomes,
-            old_contigs_fpath, bed_fpath, threads)
-            for i, (contigs_fpath, old_contigs_fpath) in enumerate(zip(contigs_fpaths, old_contigs_fpaths))]
-    statuses, results, aligned_lengths, misassemblies_in_contigs, aligned_lengths_by_contigs = run_parallel(align_and_analyze, args, n_jobs)
+    if qconfig.use_mappy and not is_mappy_supported():
+        logger.warning('  mappy (minimap2 Python bindings) supporting cs tags is not installed, running minimap2 instead.')
+        qconfig.use_mappy = False
+    cache_entries = [cache.get_entry('contigs_analyzer', qutils.label_from_fpath(contigs_fpath), [contigs_fpath, reference, qconfig.bed],
+                                     CACHE_KEY_OPTIONS, [is_cyclic, qutils.label_from_fpath_for_fname(contigs_fpath)],
+                                     get_output_fpaths(contigs_fpath, output_dir), index=i)
+                     for i, contigs_fpath in enumerate(contigs_fpaths)]
+    # the reference is indexed once for all assemblies instead of indexing it in each minimap2 run
+    ref_index_fpath = None
+    for contigs_fpath, old_contigs_fpath, cache_entry in zip(contigs_fpaths, old_contigs_fpaths, cache_entries):
+        out_basename = join(minimap_output_dirpath, qutils.label_from_fpath_for_fname(contigs_fpath))
+        if not has_existing_alignments(get_aux_out_fpaths(out_basename)[0], out_basename, reference, old_contigs_fpath) and \
+                not (cache_entry and cache_entry.exists()):
+            ref_index_fpath = get_minimap_index(reference, get_minimap_preset())
+            break
+    # reference data are large for fragmented references, so they are not copied for each assembly
+    shared_chromosomes, shared_ns = qutils.SharedValue(reference_chromosomes), qutils.SharedValue(ns_by_chromosomes)
+    args = [(cache_entry, is_analysis_finished, align_and_analyze, is_cyclic, i, contigs_fpath, output_dir, reference,
+             shared_chromosomes, shared_ns, old_contigs_fpath, bed_fpath, ref_index_fpath)
+            for i, (contigs_fpath, old_contigs_fpath, cache_entry) in enumerate(zip(contigs_fpaths, old_contigs_fpaths, cache_entries))]
+    # each minimap2 run loads the reference index and the contigs into memory
+    contigs_sizes = [os.path.getsize(contigs_fpath) for contigs_fpath in contigs_fpaths]
+    index_size = os.path.getsize(ref_index_fpath) if ref_index_fpath else 0
+    statuses, results, aligned_lengths, misassemblies_in_contigs, aligned_lengths_by_contigs = \
+        run_parallel_by_size(cache.run_cached_job, args, contigs_sizes, [index_size + size for size in contigs_sizes])
+    clear_mappy_aligners()
     reports = []
 
     aligner_statuses = dict(zip(contigs_fpaths, statuses))
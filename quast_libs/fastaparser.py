@@ -7,6 +7,7 @@
 
 from __future__ import with_statement
 import os
+import re
 import sys
 import gzip
 import zipfile
@@ -20,9 +21,8 @@ try:
     import bz2
 except ImportError:
     from quast_libs.site_packages import bz2
-if sys.version_info[0] == 3:
-    import io
 from quast_libs import qconfig
+from quast_libs.intervals import intervals_length
 # There is a pyfasta package -- http://pypi.python.org/pypi/pyfasta/
 # Use it!
 
@@ -30,7 +30,42 @@ from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
 
-def _get_fasta_file_handler(fpath):
+FASTA_CHUNK_SIZE = 4 * 1024 * 1024  # bytes
+FASTA_LINE_BREAKS = b'\r\n'
+FASTA_INLINE_WHITESPACES = (b' ', b'\t', b'\x0b', b'\x0c')  # stripped only at the ends of lines
+FASTA_LINE_WIDTH = 60  # number of bases per line in FASTA-files written by QUAST
+FASTA_INDEX_EXT = '.qfai'
+
+
+class FastaIndexEntry(object):
+    """
+        Sequence summary stored in the FASTA index: five standard .fai columns
+        (name, length, offset, bases per line, bytes per line) followed by number of Ns
+    """
+    def __init__(self, name, length, offset, line_bases, line_width, ns=0):
+        self.name = name
+        self.length = length
+        self.offset = offset
+        self.line_bases = line_bases
+        self.line_width = line_width
+        self.ns = ns
+
+    def fai_fields(self):
+        return [self.name, self.length, self.offset, self.line_bases, self.line_width]
+
+    def index_fields(self):
+        return self.fai_fields() + [self.ns]
+
+    @staticmethod
+    def from_fields(fields):
+        return FastaIndexEntry(fields[0], *[int(field) for field in fields[1:]])
+
+
+def _open_fasta_file(fpath):
+    """
+        Returns binary file-like object for reading (possibly compressed) FASTA-file,
+        compressed files are decompressed on the fly
+    """
     fasta_file = None
 
     _, ext = os.path.splitext(fpath)
@@ -39,11 +74,10 @@ def _get_fasta_file_handler(fpath):
         logger.error('Permission denied accessing ' + fpath, to_stderr=True, exit_with_code=1)
 
     if ext in ['.gz', '.gzip']:
-        fasta_file = gzip.open(fpath, mode="rt")
+        fasta_file = gzip.open(fpath, mode="rb")
 
     elif ext in ['.bz2', '.bzip2']:
-        fasta_file = bz2.BZ2File(fpath, mode="r")
-        fasta_file = _read_compressed_file(fasta_file)
+        fasta_file = bz2.BZ2File(fpath, mode="rb")
 
     elif ext in ['.zip']:
         try:
@@ -61,12 +95,11 @@ def _get_fasta_file_handler(fpath):
 
             try:
                 fasta_file = zfile.open(names[0])
-                fasta_file = _read_compressed_file(fasta_file)
             except AttributeError:
                 logger.error('Use python 2.6 or newer to work with contigs directly in zip.', exit_with_code=20)
     else:
         try:
-            fasta_file = open(fpath)
+            fasta_file = open(fpath, 'rb')
         except IOError:
             exc_type, exc_value, _ = sys.exc_info()
             logger.exception(exc_value, exit_code=1)
@@ -74,10 +107,98 @@ def _get_fasta_file_handler(fpath):
     return fasta_file
 
 
-def _read_compressed_file(compressed_file):
-    if sys.version_info[0] == 3:
-        return io.TextIOWrapper(io.BytesIO(compressed_file.read()))  # return string instead of binary data
-    return compressed_file
+def _find_newline(data, start):
+    newline_pos = data.find(b'\n', start)
+    carriage_return_pos = data.find(b'\r', start, newline_pos if newline_pos != -1 else len(data))
+    return carriage_return_pos if carriage_return_pos != -1 else newline_pos
+
+
+def _find_entry_start(data, start):
+    """
+        Returns position of the next '>' located at the beginning of a line or -1
+    """
+    entry_pos = data.find(b'\n>', max(0, start - 1))
+    carriage_return_pos = data.find(b'\r>', max(0, start - 1), entry_pos if entry_pos != -1 else len(data))
+    if carriage_return_pos != -1:
+        entry_pos = carriage_return_pos
+    return entry_pos + 1 if entry_pos != -1 else -1
+
+
+def _read_fasta_entries(fpath, chunk_size=FASTA_CHUNK_SIZE):
+    """
+        Generator that reads FASTA-file by large binary chunks and returns entries in tuples (header, seq_chunks):
+        header is the binary entry line without '>' (None for the sequence before the first entry line),
+        seq_chunks is a list of binary chunks of the sequence which may contain line breaks
+    """
+    fasta_file = _open_fasta_file(fpath)
+    header_chunks = None
+    seq_chunks = []
+    is_header_incomplete = False
+    is_empty = True
+    tail = b'\n'  # line breaks at the end of the previous chunk (an entry line can start right after them)
+    while True:
+        chunk = fasta_file.read(chunk_size)
+        if not chunk:
+            break
+        data = tail + chunk
+        pos = 1 if is_empty else 0  # the first line break is not a part of the file
+        is_empty = False
+        data_end = len(data)
+        while data_end > 0 and data[data_end - 1:data_end] in (b'\n', b'\r'):
+            data_end -= 1
+        tail = data[data_end:]
+        while pos < data_end:
+            if is_header_incomplete:
+                line_end = _find_newline(data, pos)
+                if line_end == -1 or line_end >= data_end:
+                    header_chunks.append(data[pos:data_end])
+                    break
+                header_chunks.append(data[pos:line_end])
+                is_header_incomplete = False
+                pos = line_end
+            else:
+                entry_start = _find_entry_start(data, pos)
+                if entry_start == -1 or entry_start >= data_end:
+                    seq_chunks.append(data[pos:data_end])
+                    break
+                seq_chunks.append(data[pos:entry_start])
+                if header_chunks is not None or any(seq_chunks):
+                    yield (b''.join(header_chunks) if header_chunks is not None else None), seq_chunks
+                header_chunks = []
+                seq_chunks = []
+                is_header_incomplete = True
+                pos = entry_start + 1
+        if tail:  # entry line can't continue after a line break
+            is_header_incomplete = False
+    if header_chunks is not None or not is_empty:  # a non-empty file without entry lines is a single sequence
+        yield (b''.join(header_chunks) if header_chunks is not None else None), seq_chunks
+    fasta_file.close()
+
+
+def _has_inline_whitespaces(seq):
+    return any(c in seq for c in FASTA_INLINE_WHITESPACES)
+
+
+def _get_seq_len(seq_chunks):
+    if any(_has_inline_whitespaces(chunk) for chunk in seq_chunks):
+        return len(_join_seq(seq_chunks))
+    return sum(len(chunk) - chunk.count(b'\r') - chunk.count(b'\n') for chunk in seq_chunks)
+
+
+def _join_seq(seq_chunks):
+    """
+        Joins sequence lines, whitespaces are stripped at the ends of lines only (inside lines they are kept)
+    """
+    seq = b''.join(seq_chunks)
+    if not _has_inline_whitespaces(seq):
+        return seq.translate(None, FASTA_LINE_BREAKS)
+    return b''.join(line.strip() for line in seq.replace(b'\r', b'\n').split(b'\n'))
+
+
+def _to_str(binary_str, encoding='utf-8'):
+    if sys.version_info[0] == 2:
+        return binary_str
+    return binary_str.decode(encoding)
 
 
 def __get_entry_name(line):
@@ -93,31 +214,36 @@ def get_chr_lengths_from_fastafile(fpath):
         Takes filename of FASTA-file
         Returns list of lengths of sequences in FASTA-file
     """
+    fasta_index = get_fasta_index(fpath)
+    if fasta_index is not None:
+        entries = list(fasta_index.values())
+        # zero-length sequences are skipped (except the last one) as in parsing below
+        return OrderedDict((entry.name, entry.length) for entry in entries
+                           if entry.length or entry is entries[-1])
+
     chr_lengths = OrderedDict()
     l = 0
     chr_name = None
-    fasta_file = _get_fasta_file_handler(fpath)
-    for raw_line in fasta_file:
-        if raw_line.find('\r') != -1:
-            lines = raw_line.split('\r')
-        else:
-            lines = [raw_line]
-        for line in lines:
-            if not line:
-                continue
-            if line[0] == '>':
-                if l:  # not the first sequence in FASTA
-                    chr_lengths[chr_name] = l
-                    l = 0
-                chr_name = __get_entry_name(line)
-            else:
-                l += len(line.strip())
+    for header, seq_chunks in _read_fasta_entries(fpath):
+        if header is None:
+            l = _get_seq_len(seq_chunks)
+            continue
+        if l:  # not the first sequence in FASTA
+            chr_lengths[chr_name] = l
+        chr_name = _to_str(header).split()[0]
+        l = _get_seq_len(seq_chunks)
 
     chr_lengths[chr_name] = l
-    fasta_file.close()
     return chr_lengths
 
 
+def get_ns_intervals(seq):
+    """
+        Returns sorted list of [start, end] intervals (1-based, inclusive) of N stretches in the sequence
+    """
+    return [[match.start() + 1, match.end()] for match in re.finditer('N+', seq)]
+
+
 def get_genome_stats(fasta_fpath, skip_ns=False):
     genome_size = 0
     reference_chromosomes = {}
@@ -126,9 +252,9 @@ def get_genome_stats(fasta_fpath, skip_ns=False):
         chr_name = name.split()[0]
         chr_len = len(seq)
         genome_size += chr_len
-        ns_by_chromosomes[chr_name] = set(x + 1 for x, s in enumerate(seq) if s == 'N')
+        ns_by_chromosomes[chr_name] = get_ns_intervals(seq)
         if skip_ns:
-            genome_size -= len(ns_by_chromosomes[chr_name])
+            genome_size -= intervals_length(ns_by_chromosomes[chr_name])
         reference_chromosomes[chr_name] = chr_len
     return genome_size, reference_chromosomes, ns_by_chromosomes
 
@@ -139,6 +265,11 @@ def create_fai_file(fasta_fpath):
     chr_offset = 0
     chr_name = None
     fai_fpath = fasta_fpath + '.fai'
+    fasta_index = get_fasta_index(fasta_fpath)
+    if fasta_index is not None:
+        _write_index_file(fai_fpath, [entry.fai_fields() for entry in fasta_index.values()])
+        return
+
     fai_fields = []
     with open(fasta_fpath) as in_f:
         for raw_line in in_f:
@@ -163,11 +294,39 @@ def create_fai_file(fasta_fpath):
                     l += len(line.strip())
                     chr_offset += len(line)
     fai_fields.append([chr_name, l, total_offset, len(chr_line.strip()), len(chr_line)])
-    with open(fai_fpath, 'w') as out_f:
-        for fields in fai_fields:
+    _write_index_file(fai_fpath, fai_fields)
+
+
+def _write_index_file(index_fpath, index_fields):
+    with open(index_fpath, 'w') as out_f:
+        for fields in index_fields:
             out_f.write('\t'.join([str(fs) for fs in fields]) + '\n')
 
 
+def get_fasta_index_fpath(fasta_fpath):
+    return fasta_fpath + FASTA_INDEX_EXT
+
+
+def get_fasta_index(fasta_fpath):
+    """
+        Returns OrderedDict: sequence name --> FastaIndexEntry, built when the FASTA-file was written by QUAST,
+        or None if the index does not exist or is older than the FASTA-file
+    """
+    index_fpath = get_fasta_index_fpath(fasta_fpath)
+    if not os.path.isfile(index_fpath) or not os.path.isfile(fasta_fpath) or \
+            os.path.getmtime(index_fpath) < os.path.getmtime(fasta_fpath):
+        return None
+    fasta_index = OrderedDict()
+    with open(index_fpath) as in_f:
+        for line in in_f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 6:
+                return None
+            entry = FastaIndexEntry.from_fields(fields)
+            fasta_index[entry.name] = entry
+    return fasta_index or None
+
+
 def split_fasta(fpath, output_dirpath):
     """
         Takes filename of FASTA-file and directory to output
@@ -189,35 +348,59 @@ def split_fasta(fpath, output_dirpath):
         outFile.close()
 
 
-def read_fasta(fpath):
+def read_fasta(fpath, binary=False):
     """
         Generator that returns FASTA entries in tuples (name, seq)
+        If binary is True, sequences are returned as bytes (without decoding)
+    """
+    seq_without_name = None
+    for header, seq_chunks in _read_fasta_entries(fpath):
+        seq = _join_seq(seq_chunks)
+        if not binary:
+            seq = _to_str(seq, 'latin-1')
+        if header is None:  # the sequence without an entry line is returned only if there are no entries at all
+            seq_without_name = seq
+            continue
+        seq_without_name = None
+        yield _to_str(header).split()[0], seq
+    if seq_without_name is not None:
+        yield '', seq_without_name
+
+
+def get_seq_summaries(fpath):
+    """
+        Generator that returns tuples (name, length, number of Ns) for FASTA entries,
+        values are taken from the FASTA index if it exists
     """
-    first = True
-    seq = []
-    name = ''
+    fasta_index = get_fasta_index(fpath)
+    if fasta_index is not None:
+        for entry in fasta_index.values():
+            yield entry.name, entry.length, entry.ns
+    else:
+        for name, seq in read_fasta(fpath):
+            yield name, len(seq), seq.count('N')
 
-    fasta_file = _get_fasta_file_handler(fpath)
 
-    for raw_line in fasta_file:
-        lines = raw_line.split('\r')
-        for line in lines:
-            if not line:
+def read_fasta_by_names(fpath, names):
+    """
+        Generator that returns FASTA entries (name, seq) with the specified names in the order of the file,
+        sequences are read by offsets from the FASTA index if it exists
+    """
+    fasta_index = get_fasta_index(fpath)
+    if fasta_index is None:
+        for name, seq in read_fasta(fpath):
+            if name in names:
+                yield name, seq
+        return
+
+    with open(fpath, 'rb') as in_f:
+        for name, entry in fasta_index.items():
+            if name not in names:
                 continue
-            if line[0] == '>':
-                if not first:
-                    yield name, "".join(seq)
-
-                first = False
-                name = __get_entry_name(line)
-                seq = []
-            else:
-                seq.append(line.strip())
-
-    if name or seq:
-        yield name, "".join(seq)
-
-    fasta_file.close()
+            in_f.seek(entry.offset)
+            lines_count = (entry.length + entry.line_bases - 1) // entry.line_bases if entry.line_bases else 0
+            seq_chunk = in_f.read(entry.length + lines_count * (entry.line_width - entry.line_bases))
+            yield name, _to_str(_join_seq([seq_chunk]), 'latin-1')
 
 
 def read_fasta_one_time(fpath):
@@ -234,20 +417,8 @@ def read_fasta_str(fpath):
     """
         Returns string
     """
-    fasta_file = _get_fasta_file_handler(fpath)
-    list_seq = []
-
-    for raw_line in fasta_file:
-        lines = raw_line.split('\r')
-        for line in lines:
-            if not line:
-                continue
-            if line[0] != '>':
-                list_seq.append(line.strip())
-
-    fasta_file.close()
-    fasta_str = ''.join(list_seq)
-    return fasta_str
+    fasta_str = b''.join(_join_seq(seq_chunks) for _, seq_chunks in _read_fasta_entries(fpath))
+    return _to_str(fasta_str, 'latin-1')
 
 
 def print_fasta(fasta):
@@ -257,15 +428,33 @@ def print_fasta(fasta):
             print(seq[i:i + 60])
 
 
-def write_fasta(fpath, fasta, mode='w'):
-    outfile = open(fpath, mode)
+def write_fasta(fpath, fasta, mode='w', create_index=False):
+    """
+        If create_index is True, saves FASTA index with sequence lengths, offsets and number of Ns
+        (see get_fasta_index), so the file can be summarized or randomly accessed without parsing
+    """
+    outfile = open(fpath, mode) if sys.version_info[0] == 2 else open(fpath, mode, encoding='utf-8')
 
+    fasta_index = []
+    offset = 0
     for name, seq in fasta:
-        outfile.write('>%s\n' % name)
-        for i in range(0, len(seq), 60):
-            outfile.write(seq[i:i + 60] + '\n')
+        entry_line = '>%s\n' % name
+        outfile.write(entry_line)
+        offset += len(entry_line) if sys.version_info[0] == 2 else len(entry_line.encode('utf-8'))
+        if create_index:
+            line_bases = min(len(seq), FASTA_LINE_WIDTH)
+            fasta_index.append(FastaIndexEntry(name, len(seq), offset, line_bases, line_bases + 1, ns=seq.count('N')))
+        for i in range(0, len(seq), FASTA_LINE_WIDTH):
+            outfile.write(seq[i:i + FASTA_LINE_WIDTH] + '\n')
+        offset += len(seq) + (len(seq) + FASTA_LINE_WIDTH - 1) // FASTA_LINE_WIDTH
     outfile.close()
 
+    index_fpath = get_fasta_index_fpath(fpath)
+    if create_index and mode == 'w':
+        _write_index_file(index_fpath, [entry.index_fields() for entry in fasta_index])
+    elif os.path.isfile(index_fpath):  # the index does not match the file anymore
+        os.remove(index_fpath)
+
 
 def comp(letter):
     return {'A': 'T', 'T': 'A', 'C': 'G', 'G': 'C', 'N': 'N'}[letter.upper()]
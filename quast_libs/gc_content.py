@@ -0,0 +1,113 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Counting GC content in non-overlapping windows of sequences.
+# NumPy is used if it is installed, otherwise counting is done in pure Python.
+# Both ways give the same results.
+#
+############################################################################
+
+from __future__ import division
+from functools import reduce
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BLOCKS_PER_SEGMENT = 2 ** 16  # sequence is converted to NumPy arrays by segments to limit memory usage
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+def _count_blocks_python(seq, block_size):
+    acgt_counts = []
+    gc_counts = []
+    for i in range(0, len(seq), block_size):
+        block = seq[i:i + block_size]
+        acgt_counts.append(len(block) - block.count(b'N'))
+        gc_counts.append(block.count(b'G') + block.count(b'C'))
+    return acgt_counts, gc_counts
+
+
+def _count_blocks_numpy(seq, block_size):
+    gc_table = numpy.zeros(256, dtype=numpy.uint8)
+    gc_table[[ord('G'), ord('C')]] = 1
+    acgt_table = numpy.ones(256, dtype=numpy.uint8)
+    acgt_table[ord('N')] = 0
+
+    bases = numpy.frombuffer(seq, dtype=numpy.uint8)
+    blocks_count = (len(bases) + block_size - 1) // block_size
+    acgt_counts = numpy.empty(blocks_count, dtype=numpy.int64)
+    gc_counts = numpy.empty(blocks_count, dtype=numpy.int64)
+    segment_size = block_size * BLOCKS_PER_SEGMENT
+    for segment_start in range(0, len(bases), segment_size):
+        segment = bases[segment_start:segment_start + segment_size]
+        first_block = segment_start // block_size
+        full_blocks = len(segment) // block_size
+        full_len = full_blocks * block_size
+        if full_blocks:
+            acgt_counts[first_block:first_block + full_blocks] = \
+                acgt_table[segment[:full_len]].reshape(full_blocks, block_size).sum(axis=1)
+            gc_counts[first_block:first_block + full_blocks] = \
+                gc_table[segment[:full_len]].reshape(full_blocks, block_size).sum(axis=1)
+        if full_len < len(segment):  # last incomplete block
+            acgt_counts[-1] = int(acgt_table[segment[full_len:]].sum())
+            gc_counts[-1] = int(gc_table[segment[full_len:]].sum())
+    return acgt_counts, gc_counts
+
+
+def _merge_blocks(counts, factor):
+    if factor == 1:
+        return counts
+    if numpy is not None:
+        padded_len = (len(counts) + factor - 1) // factor * factor
+        padded = numpy.zeros(padded_len, dtype=numpy.int64)
+        padded[:len(counts)] = counts
+        return padded.reshape(-1, factor).sum(axis=1)
+    return [sum(counts[i:i + factor]) for i in range(0, len(counts), factor)]
+
+
+def count_GC_in_windows(seq, window_sizes):
+    """
+        Takes binary sequence and list of window sizes
+        Returns dict: window size --> (ACGT counts, GC counts) of consecutive non-overlapping windows
+        (the last window can be shorter). The sequence is scanned once by blocks of
+        the greatest common divisor of window sizes, larger windows are summed up from blocks
+    """
+    block_size = reduce(_gcd, window_sizes)
+    if numpy is not None:
+        acgt_counts, gc_counts = _count_blocks_numpy(seq, block_size)
+    else:
+        acgt_counts, gc_counts = _count_blocks_python(seq, block_size)
+    return dict((window_size, (_merge_blocks(acgt_counts, window_size // block_size),
+                               _merge_blocks(gc_counts, window_size // block_size)))
+                for window_size in set(window_sizes))
+
+
+def get_GC_percents(acgt_counts, gc_counts, window_size):
+    """
+        Returns list of GC % of windows, windows having less than half of ACGT letters
+        (it also helps with "ends of contigs") get 0
+    """
+    min_acgt_len = window_size // 2
+    if numpy is not None:
+        percents = (100.0 * gc_counts / numpy.maximum(acgt_counts, 1)).tolist()
+        acgt_counts = acgt_counts.tolist()
+    else:
+        percents = [100.0 * gc_len / acgt_len if acgt_len else 0 for acgt_len, gc_len in zip(acgt_counts, gc_counts)]
+    return [percent if acgt_len >= min_acgt_len else 0 for acgt_len, percent in zip(acgt_counts, percents)]
+
+
+def get_total_counts(acgt_counts, gc_counts):
+    if numpy is not None:
+        return int(acgt_counts.sum()), int(gc_counts.sum())
+    return sum(acgt_counts), sum(gc_counts)
@@ -16,13 +16,13 @@ try:
 except ImportError:
    from quast_libs.site_packages.ordered_dict import OrderedDict
 
-from quast_libs import reporting, qconfig, qutils
+from quast_libs import reporting, qconfig, qutils, cache
 from quast_libs.ca_utils.misc import open_gzipsafe
 from quast_libs.fastaparser import write_fasta, get_chr_lengths_from_fastafile
 from quast_libs.genes_parser import Gene
 
 from quast_libs.log import get_logger
-from quast_libs.qutils import run_parallel
+from quast_libs.qutils import run_parallel_by_size
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
@@ -239,7 +239,7 @@ def gm_es(tool_dirpath, fasta_fpath, err_fpath, index, tmp_dirpath, num_threads)
 
 
 def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tmp_dirpath, gmhmm_p_function,
-                  prokaryote, num_threads):
+                  prokaryote, threads=1):
     assembly_label = qutils.label_from_fpath(contigs_fpath)
     corr_assembly_label = qutils.label_from_fpath_for_fname(contigs_fpath)
 
@@ -247,7 +247,7 @@ def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath,
 
     err_fpath = os.path.join(out_dirpath, corr_assembly_label + '_genemark.stderr')
 
-    genes = gmhmm_p_function(tool_dirpath, contigs_fpath, err_fpath, index, tmp_dirpath, num_threads)
+    genes = gmhmm_p_function(tool_dirpath, contigs_fpath, err_fpath, index, tmp_dirpath, threads)
     contig_lengths = get_chr_lengths_from_fastafile(contigs_fpath)
 
     if not genes:
@@ -278,6 +278,22 @@ def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath,
     return genes, unique_count, full_cnt, partial_cnt
 
 
+def is_prediction_finished(result):
+    genes, unique_count, full_cnt, partial_cnt = result
+    return unique_count is not None
+
+
+def get_cache_entry(index, contigs_fpath, gene_lengths, out_dirpath, gmhmm_p_function, prokaryote):
+    corr_assembly_label = qutils.label_from_fpath_for_fname(contigs_fpath)
+    out_basename = os.path.join(out_dirpath, corr_assembly_label + '_genemark')
+    output_fpaths = [out_basename + '.stderr', out_basename + '_genes.gff' + ('.gz' if not qconfig.no_gzip else ''),
+                     out_basename + '_genes.fasta']
+    return cache.get_entry('genemark', qutils.label_from_fpath(contigs_fpath), [contigs_fpath],
+                           ['metagenemark', 'is_fungus', 'no_gzip', 'platform_name'],
+                           [corr_assembly_label, gmhmm_p_function.__name__, prokaryote, list(gene_lengths), OUTPUT_FASTA],
+                           output_fpaths, index=index)
+
+
 def do(fasta_fpaths, gene_lengths, out_dirpath, prokaryote, meta):
     logger.print_timestamp()
     if LICENSE_LIMITATIONS_MODE:
@@ -311,12 +327,12 @@ def do(fasta_fpaths, gene_lengths, out_dirpath, prokaryote, meta):
         if not os.path.isdir(tmp_dirpath):
             os.mkdir(tmp_dirpath)
 
-        n_jobs = min(len(fasta_fpaths), qconfig.max_threads)
-        num_threads = max(1, qconfig.max_threads // n_jobs)
-        parallel_run_args = [(index, fasta_fpath, gene_lengths, out_dirpath, tool_dirpath, tmp_dirpath,
-                              gmhmm_p_function, prokaryote, num_threads)
+        parallel_run_args = [(get_cache_entry(index, fasta_fpath, gene_lengths, out_dirpath, gmhmm_p_function, prokaryote),
+                              is_prediction_finished, predict_genes, index, fasta_fpath, gene_lengths, out_dirpath,
+                              tool_dirpath, tmp_dirpath, gmhmm_p_function, prokaryote)
                              for index, fasta_fpath in enumerate(fasta_fpaths)]
-        genes_list, unique_count, full_genes, partial_genes = run_parallel(predict_genes, parallel_run_args, n_jobs)
+        fasta_sizes = [os.path.getsize(fasta_fpath) for fasta_fpath in fasta_fpaths]
+        genes_list, unique_count, full_genes, partial_genes = run_parallel_by_size(cache.run_cached_job, parallel_run_args, fasta_sizes)
         if not is_license_valid(out_dirpath, fasta_fpaths):
             return
 
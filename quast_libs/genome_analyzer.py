@@ -6,11 +6,16 @@
 ############################################################################
 
 from __future__ import with_statement
+import heapq
 import logging
 import os
+from bisect import bisect_left
 from collections import defaultdict
 
-from quast_libs import fastaparser, genes_parser, reporting, qconfig, qutils
+from quast_libs import fastaparser, genes_parser, reporting, qconfig, qutils, cache
+from quast_libs.ca_utils.align_contigs import get_aux_out_fpaths, get_covered_regions_fpath
+from quast_libs.ca_utils.coords_table import CoordsTable
+from quast_libs.intervals import merge_intervals, subtract_intervals, get_gaps, intervals_length, load_intervals
 from quast_libs.log import get_logger
 from quast_libs.qutils import run_parallel
 
@@ -31,6 +36,28 @@ def get_ref_aligned_lengths():
     return ref_lengths_by_contigs
 
 
+def get_gaps_fpath(genome_stats_dirpath, corr_assembly_label):
+    return os.path.join(genome_stats_dirpath, corr_assembly_label + '_gaps.txt')
+
+
+def get_found_features_fpath(genome_stats_dirpath, corr_assembly_label, container):
+    return os.path.join(genome_stats_dirpath, corr_assembly_label + '_genomic_features_' + container.kind.lower() + '.txt')
+
+
+def get_cache_entry(contigs_fpath, index, ref_fpath, coords_dirpath, genome_stats_dirpath, containers):
+    corr_assembly_label = qutils.label_from_fpath_for_fname(contigs_fpath)
+    coords_fpath, coords_filtered_fpath, _, _ = get_aux_out_fpaths(os.path.join(coords_dirpath, corr_assembly_label))
+    input_fpaths = [contigs_fpath, ref_fpath, coords_fpath, coords_filtered_fpath,
+                    get_covered_regions_fpath(os.path.join(coords_dirpath, corr_assembly_label))] + \
+                   [fpath for container in containers for fpath in container.fpaths]
+    output_fpaths = [get_gaps_fpath(genome_stats_dirpath, corr_assembly_label)] + \
+                    [get_found_features_fpath(genome_stats_dirpath, corr_assembly_label, container) for container in containers]
+    return cache.get_entry('genome_analyzer', qutils.label_from_fpath(contigs_fpath), input_fpaths,
+                           ['use_all_alignments', 'analyze_gaps', 'min_gap_size', 'min_gene_overlap', 'space_efficient'],
+                           [corr_assembly_label] + [(container.kind, len(container.fpaths)) for container in containers],
+                           output_fpaths, index=index)
+
+
 def chromosomes_names_dict(feature, regions, chr_names):
     """
     returns dictionary to translate chromosome name in list of features (genes or operons) to
@@ -63,6 +90,56 @@ def chromosomes_names_dict(feature, regions, chr_names):
     return region_2_chr_name
 
 
+def find_features(regions, aligned_blocks_by_contig_name, sorted_contigs_names):
+    """
+    finds genomic features (genes or operons) in the aligned blocks.
+    Returns list of (contig_id, block) for each region: the first block (in the order of sorted_contigs_names
+    and alignments of each contig) containing the whole region, or None if there is no such block,
+    and list of blocks covering at least qconfig.min_gene_overlap bases of each region which is not fully found.
+    Regions and blocks of each chromosome are matched in one sweep: only blocks covering the start of a region
+    and blocks starting inside the region are checked.
+    """
+    blocks_by_chr = defaultdict(list)  # chr_name --> list of (contig_id, block) in the order of checking
+    for contig_id, name in enumerate(sorted_contigs_names):
+        for block in aligned_blocks_by_contig_name[name]:
+            blocks_by_chr[block.seqname].append((contig_id, block))
+    regions_by_chr = defaultdict(list)
+    for i, region in enumerate(regions):
+        regions_by_chr[region.seqname].append(i)
+
+    full_blocks = [None] * len(regions)
+    partial_blocks = [[] for _ in regions]
+    for chr_name, region_indices in regions_by_chr.items():
+        # rank is the order of checking the block, it is used for choosing the first block containing the region
+        ranked_blocks = sorted(enumerate(blocks_by_chr.get(chr_name, [])), key=lambda ranked_block: ranked_block[1][1].start)
+        block_starts = [block.start for _, (_, block) in ranked_blocks]
+        active_blocks = []  # heap of (end, index in ranked_blocks) of blocks started before the current region
+        next_block_idx = 0
+        for i in sorted(region_indices, key=lambda i: regions[i].start):
+            region = regions[i]
+            while next_block_idx < len(ranked_blocks) and block_starts[next_block_idx] <= region.start:
+                heapq.heappush(active_blocks, (ranked_blocks[next_block_idx][1][1].end, next_block_idx))
+                next_block_idx += 1
+            while active_blocks and active_blocks[0][0] <= region.start:  # regions are sorted, so the block is not needed anymore
+                heapq.heappop(active_blocks)
+            candidate_indices = sorted([block_idx for _, block_idx in active_blocks] +
+                                       list(range(next_block_idx, bisect_left(block_starts, region.end, next_block_idx))))
+            full_rank = None
+            for block_idx in candidate_indices:
+                rank, (contig_id, block) = ranked_blocks[block_idx]
+                if region.end <= block.start or block.end <= region.start:
+                    continue
+                elif block.start <= region.start and region.end <= block.end:
+                    if full_rank is None or rank < full_rank:
+                        full_rank = rank
+                        full_blocks[i] = (contig_id, block)
+                elif min(region.end, block.end) - max(region.start, block.start) >= qconfig.min_gene_overlap:
+                    partial_blocks[i].append(block)  # candidates are sorted by start and rank
+            if full_blocks[i] is not None:
+                partial_blocks[i] = []
+    return full_blocks, partial_blocks
+
+
 def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpath,
                         reference_chromosomes, ns_by_chromosomes, containers):
     assembly_label = qutils.label_from_fpath(contigs_fpath)
@@ -71,27 +148,23 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
     ref_lengths = defaultdict(int)
     logger.info('  ' + qutils.index_to_str(index) + assembly_label)
 
-    coords_base_fpath = os.path.join(coords_dirpath, corr_assembly_label + '.coords')
+    all_coords_fpath, filtered_coords_fpath, _, _ = get_aux_out_fpaths(os.path.join(coords_dirpath, corr_assembly_label))
     if qconfig.use_all_alignments:
-        coords_fpath = coords_base_fpath
+        coords_fpath = all_coords_fpath
     else:
-        coords_fpath = coords_base_fpath + '.filtered'
+        coords_fpath = filtered_coords_fpath
+
+    gene_searching_enabled = len(containers)
+    covered_regions_fpath = get_covered_regions_fpath(os.path.join(coords_dirpath, corr_assembly_label))
+    covered_regions = None
+    if not qconfig.use_all_alignments and os.path.isfile(covered_regions_fpath):
+        covered_regions = load_intervals(covered_regions_fpath)
 
-    if not os.path.isfile(coords_fpath):
+    if (covered_regions is None or gene_searching_enabled) and not os.path.isfile(coords_fpath):
         logger.error('File with alignment coords (' + coords_fpath + ') not found! Try to restart QUAST.',
             indent='  ')
         return None, None
 
-    # EXAMPLE:
-    #    [S1]     [E1]  |     [S2]     [E2]  |  [LEN 1]  [LEN 2]  |  [% IDY]  | [TAGS]
-    #=====================================================================================
-    #  338980   339138  |     2298     2134  |      159      165  |    79.76  | gi|48994873|gb|U00096.2|	NODE_0_length_6088
-    #  374145   374355  |     2306     2097  |      211      210  |    85.45  | gi|48994873|gb|U00096.2|	NODE_0_length_6088
-
-    genome_mapping = {}
-    for chr_name, chr_len in reference_chromosomes.items():
-        genome_mapping[chr_name] = [0] * (chr_len + 1)
-
     contig_tuples = fastaparser.read_fasta(contigs_fpath)  # list of FASTA entries (in tuples: name, seq)
     sorted_contig_tuples = sorted(enumerate(contig_tuples), key=lambda x: len(x[1][1]), reverse=True)
     sorted_contigs_names = []
@@ -104,59 +177,52 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
     operons_in_contigs = [0] * len(sorted_contigs_names)
     aligned_blocks_by_contig_name = {} # for gene finding: contig_name --> list of AlignedBlock
 
-    gene_searching_enabled = len(containers)
     if qconfig.memory_efficient and gene_searching_enabled:
         logger.warning('Run QUAST without genes and operons files to reduce memory consumption.')
     if gene_searching_enabled:
         for name in sorted_contigs_names:
             aligned_blocks_by_contig_name[name] = []
-    with open(coords_fpath) as coordfile:
-        for line in coordfile:
-            s1 = int(line.split('|')[0].split()[0])
-            e1 = int(line.split('|')[0].split()[1])
-            s2 = int(line.split('|')[1].split()[0])
-            e2 = int(line.split('|')[1].split()[1])
-            contig_name = line.split()[12].strip()
-            chr_name = line.split()[11].strip()
-
-            if chr_name not in genome_mapping:
-                logger.error("Something went wrong and chromosome names in your coords file (" + coords_base_fpath + ") " \
-                             "differ from the names in the reference. Try to remove the file and restart QUAST.")
-                return None
-
+    if covered_regions is None or gene_searching_enabled:
+        aligned_intervals = defaultdict(list)
+        coords_table = CoordsTable(coords_fpath, columns=['s1', 'e1', 's2', 'e2', 'ref', 'contig'])
+        if any(chr_name not in reference_chromosomes for chr_name in coords_table.ref_names):
+            logger.error("Something went wrong and chromosome names in your coords file (" + coords_fpath + ") " \
+                         "differ from the names in the reference. Try to remove the file and restart QUAST.")
+            return None
+
+        for s1, e1, s2, e2, chr_name, contig_name in coords_table.iter_rows(['s1', 'e1', 's2', 'e2', 'ref', 'contig']):
             if gene_searching_enabled:
                 aligned_blocks_by_contig_name[contig_name].append(AlignedBlock(seqname=chr_name, start=s1, end=e1,
                                                                                contig=contig_name, start_in_contig=s2, end_in_contig=e2))
-            for i in range(s1, e1 + 1):
-                genome_mapping[chr_name][i] = 1
-
-    for chr_name in genome_mapping.keys():
-        for i in ns_by_chromosomes[chr_name]:
-            genome_mapping[chr_name][i] = 0
-        ref_lengths[chr_name] = sum(genome_mapping[chr_name])
-
-    if qconfig.space_efficient and coords_fpath.endswith('.filtered'):
-        os.remove(coords_fpath)
+            if s1 <= e1:
+                aligned_intervals[chr_name].append((s1, e1))
+            else:  # alignment passes over the end of a circular chromosome
+                aligned_intervals[chr_name].append((s1, reference_chromosomes[chr_name]))
+                aligned_intervals[chr_name].append((1, e1))
+
+    if covered_regions is None:
+        covered_regions = dict((chr_name, subtract_intervals(merge_intervals(aligned_intervals[chr_name]), ns_by_chromosomes[chr_name]))
+                               for chr_name in reference_chromosomes)
+    for chr_name in reference_chromosomes:
+        ref_lengths[chr_name] = intervals_length(covered_regions.get(chr_name, []))
+
+    if qconfig.space_efficient and coords_fpath == filtered_coords_fpath:
+        if os.path.isfile(coords_fpath):
+            os.remove(coords_fpath)
+        if os.path.isfile(covered_regions_fpath):
+            os.remove(covered_regions_fpath)
 
     # counting genome coverage and gaps number
     gaps_count = 0
     if qconfig.analyze_gaps:
-        gaps_fpath = os.path.join(genome_stats_dirpath, corr_assembly_label + '_gaps.txt') if not qconfig.space_efficient else '/dev/null'
+        gaps_fpath = get_gaps_fpath(genome_stats_dirpath, corr_assembly_label) if not qconfig.space_efficient else '/dev/null'
         with open(gaps_fpath, 'w') as gaps_file:
             for chr_name, chr_len in reference_chromosomes.items():
                 gaps_file.write(chr_name + '\n')
-                cur_gap_size = 0
-                for i in range(1, chr_len + 1):
-                    if genome_mapping[chr_name][i] == 1 or i in ns_by_chromosomes[chr_name]:
-                        if cur_gap_size >= qconfig.min_gap_size:
-                            gaps_count += 1
-                            gaps_file.write(str(i - cur_gap_size) + ' ' + str(i - 1) + '\n')
-                        cur_gap_size = 0
-                    else:
-                        cur_gap_size += 1
-                if cur_gap_size >= qconfig.min_gap_size:
-                    gaps_count += 1
-                    gaps_file.write(str(chr_len - cur_gap_size + 1) + ' ' + str(chr_len) + '\n')
+                gaps = get_gaps(covered_regions.get(chr_name, []), ns_by_chromosomes[chr_name], chr_len, qconfig.min_gap_size)
+                gaps_count += len(gaps)
+                for gap_start, gap_end in gaps:
+                    gaps_file.write(str(gap_start) + ' ' + str(gap_end) + '\n')
 
     results["gaps_count"] = gaps_count
     results[reporting.Fields.GENES + "_full"] = None
@@ -171,53 +237,27 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
 
         total_full = 0
         total_partial = 0
-        found_fpath = os.path.join(genome_stats_dirpath, corr_assembly_label + '_genomic_features_' + container.kind.lower() + '.txt')
+        found_fpath = get_found_features_fpath(genome_stats_dirpath, corr_assembly_label, container)
         found_file = open(found_fpath, 'w')
         found_file.write('%s\t\t%s\t%s\t%s\t%s\n' % ('ID or #', 'Start', 'End', 'Type', 'Contig'))
         found_file.write('=' * 50 + '\n')
 
-        # 0 - gene is not found,
-        # 1 - gene is found,
-        # 2 - part of gene is found
-        found_list = [0] * len(container.region_list)
+        full_blocks, partial_blocks = find_features(container.region_list, aligned_blocks_by_contig_name, sorted_contigs_names)
         for i, region in enumerate(container.region_list):
-            found_list[i] = 0
-            gene_blocks = []
             if region.id is None:
                 region.id = '# ' + str(region.number + 1)
-            for contig_id, name in enumerate(sorted_contigs_names):
-                cur_feature_is_found = False
-                for cur_block in aligned_blocks_by_contig_name[name]:
-                    if cur_block.seqname != region.seqname:
-                        continue
-                    if region.end <= cur_block.start or cur_block.end <= region.start:
-                        continue
-                    elif cur_block.start <= region.start and region.end <= cur_block.end:
-                        if found_list[i] == 2:  # already found as partial gene
-                            total_partial -= 1
-                        found_list[i] = 1
-                        total_full += 1
-                        contig_info = cur_block.format_gene_info(region)
-                        found_file.write('%s\t\t%d\t%d\tcomplete\t%s\n' % (region.id, region.start, region.end, contig_info))
-                        if container.kind == 'operon':
-                            operons_in_contigs[contig_id] += 1  # inc number of found genes/operons in id-th contig
-                        else:
-                            features_in_contigs[contig_id] += 1
-
-                        cur_feature_is_found = True
-                        break
-                    elif min(region.end, cur_block.end) - max(region.start, cur_block.start) >= qconfig.min_gene_overlap:
-                        if found_list[i] == 0:
-                            found_list[i] = 2
-                            total_partial += 1
-                        gene_blocks.append(cur_block)
-                    if cur_feature_is_found:
-                        break
-                if cur_feature_is_found:
-                    break
-            # adding info about partially found genes/operons
-            if found_list[i] == 2:  # partial gene/operon
-                contig_info = ','.join([block.format_gene_info(region) for block in sorted(gene_blocks, key=lambda block: block.start)])
+            if full_blocks[i] is not None:
+                contig_id, block = full_blocks[i]
+                total_full += 1
+                contig_info = block.format_gene_info(region)
+                found_file.write('%s\t\t%d\t%d\tcomplete\t%s\n' % (region.id, region.start, region.end, contig_info))
+                if container.kind == 'operon':
+                    operons_in_contigs[contig_id] += 1  # inc number of found genes/operons in id-th contig
+                else:
+                    features_in_contigs[contig_id] += 1
+            elif partial_blocks[i]:  # partial gene/operon
+                total_partial += 1
+                contig_info = ','.join([block.format_gene_info(region) for block in partial_blocks[i]])
                 found_file.write('%s\t\t%d\t%d\tpartial\t%s\n' % (region.id, region.start, region.end, contig_info))
 
         if container.kind == 'operon':
@@ -321,10 +361,14 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath, features_dict, operons
     num_nf_errors = logger._num_nf_errors
     n_jobs = min(len(aligned_contigs_fpaths), qconfig.max_threads)
 
-    parallel_run_args = [(contigs_fpath, index, coords_dirpath, genome_stats_dirpath,
-                          reference_chromosomes, ns_by_chromosomes, containers)
+    # reference data and genomic features are not copied for each assembly
+    shared_chromosomes, shared_ns, shared_containers = \
+        qutils.SharedValue(reference_chromosomes), qutils.SharedValue(ns_by_chromosomes), qutils.SharedValue(containers)
+    parallel_run_args = [(get_cache_entry(contigs_fpath, index, ref_fpath, coords_dirpath, genome_stats_dirpath, containers),
+                          None, process_single_file, contigs_fpath, index, coords_dirpath, genome_stats_dirpath,
+                          shared_chromosomes, shared_ns, shared_containers)
                         for index, contigs_fpath in enumerate(aligned_contigs_fpaths)]
-    ref_lengths, results_genes_operons_tuples = run_parallel(process_single_file, parallel_run_args, n_jobs, filter_results=True)
+    ref_lengths, results_genes_operons_tuples = run_parallel(cache.run_cached_job, parallel_run_args, n_jobs, filter_results=True)
     num_nf_errors += len(aligned_contigs_fpaths) - len(ref_lengths)
     logger._num_nf_errors = num_nf_errors
     if not ref_lengths:
@@ -338,7 +382,7 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath, features_dict, operons
     for chr_name, chr_len in reference_chromosomes.items():
         aligned_len = max(ref_lengths_by_contigs[chr_name])
         res_file.write('\t' + chr_name + ' (total length: ' + str(chr_len) + ' bp, ' +
-                       'total length without N\'s: ' + str(chr_len - len(ns_by_chromosomes[chr_name])) +
+                       'total length without N\'s: ' + str(chr_len - intervals_length(ns_by_chromosomes[chr_name])) +
                        ' bp, maximal covered length: ' + str(aligned_len) + ' bp)\n')
     res_file.write('\n')
     res_file.write('total genome size: ' + str(genome_size) + '\n\n')
@@ -12,14 +12,14 @@ import itertools
 import csv
 import shutil
 
-from quast_libs import reporting, qconfig, qutils
+from quast_libs import reporting, qconfig, qutils, cache
 from quast_libs.ca_utils.misc import open_gzipsafe
 from quast_libs.fastaparser import read_fasta, write_fasta, rev_comp
 from quast_libs.genemark import add_genes_to_fasta
 from quast_libs.genes_parser import Gene
 
 from quast_libs.log import get_logger
-from quast_libs.qutils import compile_tool, get_path_to_program, run_parallel
+from quast_libs.qutils import compile_tool, get_path_to_program, run_parallel_by_size
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
@@ -108,7 +108,7 @@ def glimmerHMM(tool_dir, tool_exec_fpath, fasta_fpath, out_fpath, gene_lengths,
     return out_gff_path, genes, len(unique), total, full_cnt, partial_cnt
 
 
-def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath):
+def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath, threads=1):
     assembly_label = qutils.label_from_fpath(contigs_fpath)
     corr_assembly_label = qutils.label_from_fpath_for_fname(contigs_fpath)
 
@@ -130,6 +130,15 @@ def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath,
     return genes, unique, full_genes, partial_genes
 
 
+def get_cache_entry(index, contigs_fpath, gene_lengths, out_dirpath, tool_exec_fpath):
+    corr_assembly_label = qutils.label_from_fpath_for_fname(contigs_fpath)
+    out_fpath = os.path.join(out_dirpath, corr_assembly_label + '_glimmer')
+    output_fpaths = [out_fpath + '.stderr', out_fpath + '_genes.gff' + ('.gz' if not qconfig.no_gzip else ''),
+                     out_fpath + '_genes.fasta']
+    return cache.get_entry('glimmer', qutils.label_from_fpath(contigs_fpath), [contigs_fpath, tool_exec_fpath], ['no_gzip'],
+                           [corr_assembly_label, list(gene_lengths), OUTPUT_FASTA], output_fpaths, index=index)
+
+
 def compile_glimmer(logger, only_clean=False):
     tool_dirpath = os.path.join(qconfig.LIBS_LOCATION, 'glimmer')
     tool_src_dirpath = os.path.join(tool_dirpath, 'src')
@@ -154,10 +163,12 @@ def do(contigs_fpaths, gene_lengths, out_dirpath):
     if not os.path.isdir(tmp_dirpath):
         os.makedirs(tmp_dirpath)
 
-    n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
-    parallel_args = [(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath)
+    parallel_args = [(get_cache_entry(index, contigs_fpath, gene_lengths, out_dirpath, tool_exec_fpath), None, predict_genes,
+                      index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath)
                      for index, contigs_fpath in enumerate(contigs_fpaths)]
-    genes_list, unique, full_genes, partial_genes = run_parallel(predict_genes, parallel_args, n_jobs)
+    # GlimmerHMM is started for each contig, so the jobs are scheduled as runs of external tools
+    genes_list, unique, full_genes, partial_genes = run_parallel_by_size(cache.run_cached_job, parallel_args,
+                                                                         [os.path.getsize(contigs_fpath) for contigs_fpath in contigs_fpaths])
 
     genes_by_labels = dict()
     # saving results
@@ -0,0 +1,135 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Arithmetic on genomic intervals. All intervals are 1-based and inclusive
+# on both ends, i.e. [start, end] covers end - start + 1 bases.
+#
+############################################################################
+
+from __future__ import with_statement
+import struct
+
+try:
+   from collections import OrderedDict
+except ImportError:
+   from quast_libs.site_packages.ordered_dict import OrderedDict
+
+INTERVALS_FILE_SIGNATURE = b'QINTV1'
+
+
+def merge_intervals(intervals):
+    """
+        Takes iterable of (start, end) pairs
+        Returns sorted list of non-overlapping [start, end] intervals covering the same positions
+    """
+    merged = []
+    for start, end in sorted(intervals, key=lambda interval: interval[0]):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def subtract_intervals(intervals, excluded):
+    """
+        Takes two sorted lists of non-overlapping intervals
+        Returns list of intervals covering positions from the first list which are absent in the second one
+    """
+    result = []
+    excluded_idx = 0
+    for start, end in intervals:
+        while excluded_idx < len(excluded) and excluded[excluded_idx][1] < start:
+            excluded_idx += 1
+        cur_idx = excluded_idx
+        while cur_idx < len(excluded) and excluded[cur_idx][0] <= end:
+            excl_start, excl_end = excluded[cur_idx]
+            if excl_start > start:
+                result.append([start, excl_start - 1])
+            start = max(start, excl_end + 1)
+            if start > end:
+                break
+            cur_idx += 1
+        if start <= end:
+            result.append([start, end])
+    return result
+
+
+def complement_intervals(intervals, region_start, region_end):
+    """
+        Takes sorted list of non-overlapping intervals
+        Returns list of intervals covering positions of [region_start, region_end] absent in the list
+    """
+    return subtract_intervals([[region_start, region_end]], intervals)
+
+
+def get_gaps(covered_intervals, ns_intervals, chr_len, min_gap_size):
+    """
+        Takes sorted lists of non-overlapping intervals covered by alignments and consisting of N's
+        Returns list of gaps in [1, chr_len]: intervals of at least min_gap_size positions absent in both lists.
+        Time is proportional to the number of intervals, not to the chromosome length
+    """
+    non_gap_intervals = merge_intervals(covered_intervals + ns_intervals)
+    return [[start, end] for start, end in complement_intervals(non_gap_intervals, 1, chr_len)
+            if end - start + 1 >= min_gap_size]
+
+
+def intervals_length(intervals):
+    return sum(end - start + 1 for start, end in intervals)
+
+
+def get_aligned_intervals(aligns, chr_len):
+    """
+        Returns list of reference intervals covered by alignments,
+        alignments passing over the end of a circular chromosome (s1 > e1) are split into two intervals
+    """
+    intervals = []
+    for align in aligns:
+        if align.s1 <= align.e1:
+            intervals.append((align.s1, align.e1))
+        else:
+            intervals.append((align.s1, chr_len))
+            intervals.append((1, align.e1))
+    return intervals
+
+
+def save_intervals(fpath, intervals_by_chr):
+    """
+        Saves intervals grouped by chromosomes into a compact binary file:
+        signature, number of chromosomes, and for each chromosome: name length, number of intervals,
+        name, and all interval borders as little-endian 64-bit integers
+    """
+    with open(fpath, 'wb') as out_f:
+        out_f.write(INTERVALS_FILE_SIGNATURE)
+        out_f.write(struct.pack('<I', len(intervals_by_chr)))
+        for chr_name, intervals in intervals_by_chr.items():
+            encoded_name = chr_name.encode('utf-8')
+            out_f.write(struct.pack('<II', len(encoded_name), len(intervals)))
+            out_f.write(encoded_name)
+            out_f.write(struct.pack('<%dQ' % (2 * len(intervals)), *[pos for interval in intervals for pos in interval]))
+
+
+def load_intervals(fpath):
+    """
+        Reads file created by save_intervals
+        Returns OrderedDict: chromosome name --> list of [start, end] intervals, or None if the file is corrupted
+    """
+    intervals_by_chr = OrderedDict()
+    with open(fpath, 'rb') as in_f:
+        if in_f.read(len(INTERVALS_FILE_SIGNATURE)) != INTERVALS_FILE_SIGNATURE:
+            return None
+        try:
+            chr_count = struct.unpack('<I', in_f.read(4))[0]
+            for _ in range(chr_count):
+                name_len, intervals_count = struct.unpack('<II', in_f.read(8))
+                chr_name = in_f.read(name_len).decode('utf-8')
+                borders = struct.unpack('<%dQ' % (2 * intervals_count), in_f.read(16 * intervals_count))
+                intervals_by_chr[str(chr_name)] = [[borders[i], borders[i + 1]] for i in range(0, len(borders), 2)]
+        except struct.error:
+            return None
+    return intervals_by_chr
@@ -7,6 +7,7 @@
 from __future__ import with_statement
 import os
 import sys
+import threading
 from datetime import datetime
 from quast_libs import qconfig
 
@@ -29,6 +30,63 @@ def get_logger(name):
         return _loggers[name]
 
 
+class StageLogBuffer(logging.Filter):
+    """
+        Keeps messages logged by a thread of a pipeline stage running in the background (see stages.run_stages)
+        until the stage is finished, so messages of stages running at the same time don't interleave.
+        Buffered records don't reach the handlers, so background threads don't take their locks
+        while other threads fork worker processes
+    """
+    def __init__(self):
+        logging.Filter.__init__(self)
+        self.records = dict()  # (process id, thread id) --> list of records
+
+    def filter(self, record):
+        records = self.records.get((os.getpid(), threading.current_thread().ident))
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+    def start(self):
+        self.records[(os.getpid(), threading.current_thread().ident)] = []
+
+    def is_started(self):
+        return (os.getpid(), threading.current_thread().ident) in self.records
+
+    def add(self, records):
+        """
+            Adds records logged by a worker process into the buffer of the current thread (if it is buffered)
+        """
+        thread_records = self.records.get((os.getpid(), threading.current_thread().ident))
+        if thread_records is None:
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+        else:
+            thread_records.extend(records)
+
+    def pop(self, thread_ident=None, picklable=False):
+        """
+            Stops buffering of the thread (the current one by default) and returns its records
+        """
+        records = self.records.pop((os.getpid(), thread_ident or threading.current_thread().ident), [])
+        if picklable:
+            for record in records:
+                record.msg = record.getMessage()
+                record.args = None
+                if record.exc_info:
+                    record.exc_text = logging.Formatter().formatException(record.exc_info)
+                    record.exc_info = None
+        return records
+
+    def flush(self, thread_ident):
+        for record in self.pop(thread_ident):
+            logging.getLogger(record.name).handle(record)
+
+
+stage_log_buffer = StageLogBuffer()
+
+
 class MetaQErrorFormatter(logging.Formatter):
     def __init__(self, indent_val=None, ref_name=None, log_fpath=None):
         self._indent_val = indent_val
@@ -59,6 +117,7 @@ class QLogger(object):
         self._name = name
         self._logger = logging.getLogger(name)
         self._logger.setLevel(logging.DEBUG)
+        self._logger.addFilter(stage_log_buffer)
 
     def set_up_metaquast(self, is_parallel_run=False, ref_name=None):
         self._is_metaquast = True
@@ -13,11 +13,12 @@ from collections import defaultdict
 from os.path import join, basename, dirname, exists, isdir
 
 from quast_libs import fastaparser, qconfig, qutils, reads_analyzer
+from quast_libs.ca_utils.align_contigs import get_minimap_index
 from quast_libs.ca_utils.misc import minimap_fpath
 from quast_libs.log import get_logger
 from quast_libs.qutils import splitext_for_fasta_file, is_non_empty_file, download_external_tool, \
     add_suffix, get_dir_for_download
-from quast_libs.ra_utils.misc import sort_bam, bam_to_bed, bedtools_fpath, sambamba_view, calculate_read_len
+from quast_libs.ra_utils.misc import sort_bam, bam_to_bed, bedtools_fpath, sambamba_view, calculate_read_pairs_stats
 from quast_libs.reads_analyzer import calculate_insert_size
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
@@ -95,7 +96,7 @@ def remove_repeat_regions(ref_fpath, repeats_fpath, uncovered_fpath):
 
 
 
-def get_joiners(ref_name, sam_fpath, bam_fpath, output_dirpath, err_fpath, using_reads):
+def get_joiners(ref_name, sam_fpath, bam_fpath, output_dirpath, err_fpath, using_reads, read_pairs_stats=None):
     bam_filtered_fpath = add_suffix(bam_fpath, 'filtered')
     if not is_non_empty_file(bam_filtered_fpath):
         filter_rule = 'not unmapped and not supplementary and not secondary_alignment'
@@ -106,7 +107,8 @@ def get_joiners(ref_name, sam_fpath, bam_fpath, output_dirpath, err_fpath, using
     bed_fpath = bam_to_bed(output_dirpath, using_reads, bam_sorted_fpath, err_fpath, logger, bedpe=using_reads == 'mp')
     intervals = defaultdict(list)
     if using_reads == 'mp':
-        _, min_is, max_is = calculate_insert_size(sam_fpath, output_dirpath, ref_name, reads_suffix='mp')
+        _, min_is, max_is = calculate_insert_size(sam_fpath, output_dirpath, ref_name, reads_suffix='mp',
+                                                  read_pairs_stats=read_pairs_stats)
     with open(bed_fpath) as bed:
         for l in bed:
             fs = l.split()
@@ -389,7 +391,8 @@ def get_unique_covered_regions(ref_fpath, tmp_dir, log_fpath, binary_fpath, inse
                                     long_repeats_fpath, '-fo', repeats_fasta_fpath],
                                     stderr=open(log_fpath, 'w'), indent='    ')
             cmdline = [minimap_fpath(), '-c', '-x', 'asm10', '-N', '50', '--mask-level', '1', '--no-long-join', '-r', '100',
-                       '-t', str(qconfig.max_threads), '-z', '200', ref_fpath, repeats_fasta_fpath]
+                       '-t', str(qconfig.max_threads), '-z', '200', get_minimap_index(ref_fpath, 'asm10', log_fpath),
+                       repeats_fasta_fpath]
             qutils.call_subprocess(cmdline, stdout=open(coords_fpath, 'w'), stderr=open(log_fpath, 'a'))
         filtered_repeats_fpath, repeats_regions = check_repeats_instances(coords_fpath, long_repeats_fpath, use_long_reads)
         unique_covered_regions = remove_repeat_regions(ref_fpath, filtered_repeats_fpath, uncovered_fpath)
@@ -487,9 +490,11 @@ def do(ref_fpath, original_ref_fpath, output_dirpath):
         else:
             join_reads = 'mp'
         sam_fpath, bam_fpath, _ = reads_analyzer.align_reference(ref_fpath, reads_analyzer_dir, using_reads=join_reads)
-        joiners = get_joiners(qutils.name_from_fpath(ref_fpath), sam_fpath, bam_fpath, tmp_dir, log_fpath, join_reads)
+        read_pairs_stats = calculate_read_pairs_stats(sam_fpath) if join_reads == 'mp' else None
+        joiners = get_joiners(qutils.name_from_fpath(ref_fpath), sam_fpath, bam_fpath, tmp_dir, log_fpath, join_reads,
+                              read_pairs_stats)
         uncovered_regions = parse_bed(uncovered_fpath) if join_reads == 'mp' else defaultdict(list)
-        mp_len = calculate_read_len(sam_fpath) if join_reads == 'mp' else None
+        mp_len = read_pairs_stats.avg_read_len() if join_reads == 'mp' else None
         for chrom, seq in reference:
             region_pairing = get_regions_pairing(unique_covered_regions[chrom], joiners[chrom], mp_len)
             ref_coords_to_output = scaffolding(unique_covered_regions[chrom], region_pairing)
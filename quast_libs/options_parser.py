@@ -70,7 +70,7 @@ def ensure_value(values, attr, value):
 def check_output_dir(option, opt_str, value, parser, logger):
     output_dirpath = os.path.abspath(value)
     setattr(qconfig, option.dest, output_dirpath)
-    check_dirpath(qconfig.output_dirpath, 'You have specified ' + str(output_dirpath) + ' as an output path.\n'
+    check_dirpath(output_dirpath, 'You have specified ' + str(output_dirpath) + ' as an output path.\n'
                      'Please, use a different directory.')
 
 
@@ -664,6 +664,10 @@ def parse_options(logger, quast_args):
              dest='memory_efficient',
              action='store_true')
          ),
+        (['--use-mappy'], dict(
+             dest='use_mappy',
+             action='store_true')
+         ),
         (['--space-efficient'], dict(
              dest='space_efficient',
              action='callback',
@@ -671,6 +675,17 @@ def parse_options(logger, quast_args):
              callback_kwargs={'store_true_values': ['space_efficient'],
                               'store_false_values': ['show_snps', 'create_icarus_html']},)
          ),
+        (['--text-coords'], dict(
+             dest='text_coords',
+             action='store_true')
+         ),
+        (['--cache-dir'], dict(
+             dest='cache_dirpath',
+             type='string',
+             action='callback',
+             callback=check_output_dir,
+             callback_args=(logger,))
+         ),
         (['--silent'], dict(
              dest='silent',
              action='store_true')
@@ -844,6 +859,13 @@ def parse_options(logger, quast_args):
 
     qconfig.set_max_threads(logger)
 
+    if qconfig.cache_dirpath:
+        if qconfig.space_efficient:
+            logger.notice("--cache-dir is ignored because --space-efficient was specified")
+            qconfig.cache_dirpath = None
+        elif not isdir(qconfig.cache_dirpath):
+            os.makedirs(qconfig.cache_dirpath)
+
     if parser.values.ambiguity_score:
         if qconfig.ambiguity_usage != 'all':
             qconfig.ambiguity_usage = 'all'
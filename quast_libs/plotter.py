@@ -41,7 +41,7 @@ logarithmic_x_scale = False  # for cumulative plots only
 import math
 import sys
 
-from quast_libs import fastaparser, qconfig, reporting
+from quast_libs import fastaparser, qconfig, reporting, N50
 from quast_libs.log import get_logger, get_main_logger
 from quast_libs.qutils import label_from_fpath, parse_str_to_num, run_parallel
 from quast_libs.plotter_data import get_color_and_ls, colors
@@ -366,7 +366,6 @@ def Nx_plot(results_dir, reduce_points, contigs_fpaths, lists_of_lengths, plot_f
         # calculate values for the plot
         vals_Nx = [0.0]
         vals_l = [lengths[0]]
-        lcur = 0
         # if Nx-plot then we just use sum of contigs lengths, else use reference_length
         lsum = sum(lengths)
         if reference_lengths:
@@ -374,9 +373,7 @@ def Nx_plot(results_dir, reduce_points, contigs_fpaths, lists_of_lengths, plot_f
         min_difference = 0
         if reduce_points:
             min_difference = qconfig.min_difference
-        for l in lengths:
-            lcur += l
-            x = lcur * 100.0 / lsum
+        for l, x in zip(lengths, N50.cumulative_percents(lengths, lsum)):
             if can_draw_plots:
                 vals_Nx.append(vals_Nx[-1] + 1e-10) # eps
                 vals_l.append(l)
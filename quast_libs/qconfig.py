@@ -197,6 +197,8 @@ DEFAULT_MAX_THREADS = 4  # this value is used if QUAST fails to determine number
 assemblies_num = 1
 memory_efficient = False
 space_efficient = False
+use_mappy = False
+text_coords = False  # save alignments also in the text .coords files
 
 # genome analyzer
 analyze_gaps = True
@@ -237,6 +239,8 @@ supported_plot_extensions = ['emf', 'eps', 'pdf', 'png', 'ps', 'raw', 'rgba', 's
 
 ###
 output_dirpath = None
+reference_index_dirpath = None  # minimap2 indexes of the reference are cached here
+cache_dirpath = None  # results of the previous runs are reused from here (see cache.py)
 reference = None
 genes = None
 operons = None
@@ -476,6 +480,9 @@ def usage(show_hidden=False, mode=None, short=True, stream=sys.stdout):
         stream.write("                                      This may significantly reduce memory consumption on large genomes\n")
         stream.write("    --space-efficient                 Create only reports and plots files. Aux files including .stdout, .stderr, .coords will not be created.\n")
         stream.write("                                      This may significantly reduce space consumption on large genomes. Icarus viewers also will not be built\n")
+        stream.write("    --text-coords                     Save alignments also in text .coords files (by default, they are saved only in binary .coords.bin files)\n")
+        stream.write("    --cache-dir <dirname>             Save results of each assembly into this directory and reuse them in subsequent runs\n")
+        stream.write("                                      with the same inputs and options, e.g. when a new assembly is added to the compared ones\n")
         stream.write("-1  --pe1     <filename>              File with forward paired-end reads (in FASTQ format, may be gzipped)\n")
         stream.write("-2  --pe2     <filename>              File with reverse paired-end reads (in FASTQ format, may be gzipped)\n")
         stream.write("    --pe12    <filename>              File with interlaced forward and reverse paired-end reads. (in FASTQ format, may be gzipped)\n")
@@ -521,6 +528,8 @@ def usage(show_hidden=False, mode=None, short=True, stream=sys.stdout):
             stream.write("--cov  <filename>                File with read coverage (for Icarus alignment viewer)\n")
             stream.write("--phys-cov  <filename>           File with physical coverage (for Icarus alignment viewer)\n")
             stream.write("--no-icarus                      Do not create Icarus files\n")
+            stream.write("--use-mappy                      Align contigs in-process with minimap2 Python bindings (mappy) if they are installed.\n")
+            stream.write("                                 Alignments may slightly differ from the ones of minimap2 executable\n")
 
         stream.write("\n")
         stream.write("Other:\n")
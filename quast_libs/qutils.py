@@ -9,12 +9,17 @@ from __future__ import with_statement
 from __future__ import division
 import glob
 import hashlib
+import itertools
+import multiprocessing
 import shutil
 import subprocess
+import threading
+import traceback
 import os
 import stat
 import sys
 import re
+import weakref
 from collections import defaultdict
 from os.path import basename, isfile, isdir, exists, join
 
@@ -26,7 +31,7 @@ except:
     import urllib.request as urllib
 
 from quast_libs import fastaparser, qconfig, plotter_data
-from quast_libs.log import get_logger
+from quast_libs.log import get_logger, stage_log_buffer
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
 MAX_CONTIG_NAME = 1021  # Nucmer's constraint
@@ -34,6 +39,7 @@ MAX_CONTIG_NAME_GLIMMER = 298   # Glimmer's constraint
 
 external_tools_dirpath = os.path.join(qconfig.QUAST_HOME, 'external_tools')
 blast_dirpath = None
+compilation_lock = threading.Lock()
 
 
 def set_up_output_dir(output_dirpath, json_outputpath,
@@ -130,7 +136,7 @@ def correct_fasta(original_fpath, min_contig, corrected_fpath=None, is_reference
         logger.warning('Skipping ' + original_fpath + ' because file is empty.', indent='    ')
         return False
     if corrected_fpath:
-        fastaparser.write_fasta(corrected_fpath, modified_fasta_entries)
+        fastaparser.write_fasta(corrected_fpath, modified_fasta_entries, create_index=True)
     return True
 
 
@@ -285,7 +291,7 @@ def broke_scaffolds(file_counter, labels, contigs_fpath, corrected_dirpath, logs
         total_contigs_for_the_scaf = split_by_ns(seq, name, broken_scaffolds_fasta, qconfig.Ns_break_threshold, qconfig.min_contig)
         contigs_counter += total_contigs_for_the_scaf
     if contigs_counter > scaffold_counter + 1:
-        fastaparser.write_fasta(broken_scaffolds_fpath, broken_scaffolds_fasta)
+        fastaparser.write_fasta(broken_scaffolds_fpath, broken_scaffolds_fasta, create_index=True)
         logs.append("  " + index_to_str(file_counter, force=(len(labels) > 1)) +
                     "    %d scaffolds (%s) were broken into %d contigs (%s)" %
                     (scaffold_counter + 1,
@@ -610,7 +616,7 @@ def label_from_fpath_for_fname(fpath):
 
 def call_subprocess(args, stdin=None, stdout=None, stderr=None,
                     indent='',
-                    only_if_debug=True, env=None, logger=logger):
+                    only_if_debug=True, env=None, logger=logger, cwd=None):
     printed_args = args[:]
     if stdin:
         printed_args += ['<', stdin.name]
@@ -625,7 +631,7 @@ def call_subprocess(args, stdin=None, stdout=None, stderr=None,
 
     logger.print_command_line(printed_args, indent, only_if_debug=only_if_debug)
 
-    return_code = subprocess.call(args, stdin=stdin, stdout=stdout, stderr=stderr, env=env)
+    return_code = subprocess.call(args, stdin=stdin, stdout=stdout, stderr=stderr, env=env, cwd=cwd)
 
     if return_code != 0:
         logger.debug(' ' * len(indent) + 'The tool returned non-zero.' +
@@ -851,36 +857,34 @@ def compile_tool(name, dirpath, requirements, just_notice=False, logger=logger,
         safe_rm(failed_compilation_flag)
         return True
 
-    if not all_required_binaries_exist(dirpath, requirements):
-        if check_prev_compilation_failed(name, failed_compilation_flag, just_notice, logger=logger):
-            return False
-
-        # making
-        logger.main_info('Compiling ' + name + ' (details are in ' + make_logs_basepath +
-                         '.log and make.err)')
-        open(make_logs_basepath + '.log', 'w').close()
-        open(make_logs_basepath + '.err', 'w').close()
-        if configure_args:
-            prev_dir = os.getcwd()
-            os.chdir(dirpath)
-            call_subprocess(['./configure'] + configure_args, stdout=open(make_logs_basepath + '.log', 'a'),
-                            stderr=open(make_logs_basepath + '.err', 'a'))
-            os.chdir(prev_dir)
-        try:
-            return_code = call_subprocess((['make', make_cmd] if make_cmd else ['make']) + ['-C', dirpath],
-                                      stdout=open(make_logs_basepath + '.log', 'a'),
-                                      stderr=open(make_logs_basepath + '.err', 'a'), logger=logger)
-        except IOError:
-            msg = 'Permission denied accessing ' + dirpath + '. Did you forget sudo?'
-            if just_notice:
-                logger.notice(msg)
-            else:
-                logger.warning(msg)
-            return False
+    with compilation_lock:  # stages running at the same time may need the same tool
+        if not all_required_binaries_exist(dirpath, requirements):
+            if check_prev_compilation_failed(name, failed_compilation_flag, just_notice, logger=logger):
+                return False
+
+            # making
+            logger.main_info('Compiling ' + name + ' (details are in ' + make_logs_basepath +
+                             '.log and make.err)')
+            open(make_logs_basepath + '.log', 'w').close()
+            open(make_logs_basepath + '.err', 'w').close()
+            if configure_args:
+                call_subprocess(['./configure'] + configure_args, stdout=open(make_logs_basepath + '.log', 'a'),
+                                stderr=open(make_logs_basepath + '.err', 'a'), cwd=dirpath)
+            try:
+                return_code = call_subprocess((['make', make_cmd] if make_cmd else ['make']) + ['-C', dirpath],
+                                          stdout=open(make_logs_basepath + '.log', 'a'),
+                                          stderr=open(make_logs_basepath + '.err', 'a'), logger=logger)
+            except IOError:
+                msg = 'Permission denied accessing ' + dirpath + '. Did you forget sudo?'
+                if just_notice:
+                    logger.notice(msg)
+                else:
+                    logger.warning(msg)
+                return False
 
-        if return_code != 0 or not all_required_binaries_exist(dirpath, requirements):
-            write_failed_compilation_flag(name, dirpath, failed_compilation_flag, just_notice=just_notice, logger=logger)
-            return False
+            if return_code != 0 or not all_required_binaries_exist(dirpath, requirements):
+                write_failed_compilation_flag(name, dirpath, failed_compilation_flag, just_notice=just_notice, logger=logger)
+                return False
     return True
 
 
@@ -1037,9 +1041,50 @@ def download_external_tool(fname, dirpath, tool, platform_specific=False, is_exe
     return downloaded_fpath
 
 
+shared_values = weakref.WeakValueDictionary()  # id --> SharedValue, inherited by forked worker processes
+
+
+def _get_shared_value(value_id):
+    if value_id not in shared_values:
+        raise KeyError('Shared value %d is not found: it was created after the worker process had been started' % value_id)
+    return shared_values[value_id]
+
+
+def workers_inherit_memory():
+    if not hasattr(multiprocessing, 'get_start_method'):  # Python 2 always forks worker processes on Unix
+        return os.name == 'posix'
+    return multiprocessing.get_start_method() == 'fork'
+
+
+class SharedValue(object):
+    """
+        Wrapper of a large read-only value (e.g. chromosome lengths and Ns of a fragmented reference, genomic features)
+        passed to every job of run_parallel or run_parallel_by_size. Worker processes are forked after the value is
+        wrapped, so they inherit it from the parent process and only the value id is pickled for each job
+        instead of the value itself (unless worker processes are spawned, e.g. on macOS with Python 3.8+).
+        Jobs get the value itself: wrapped arguments are unwrapped before a job is called
+    """
+    _ids = itertools.count()
+
+    def __init__(self, value):
+        self.value = value
+        self.id = next(SharedValue._ids)
+        shared_values[self.id] = self
+
+    def __reduce__(self):
+        if workers_inherit_memory():
+            return _get_shared_value, (self.id,)
+        return SharedValue, (self.value,)
+
+
+def _run_job(_fn, *args, **kwargs):
+    args = [arg.value if isinstance(arg, SharedValue) else arg for arg in args]
+    return _fn(*args, **kwargs)
+
+
 def run_parallel(_fn, fn_args, n_jobs=None, filter_results=False):
     if qconfig.memory_efficient:
-        results_tuples = [_fn(*args) for args in fn_args]
+        results_tuples = [_run_job(_fn, *args) for args in fn_args]
     else:
         n_jobs = n_jobs or qconfig.max_threads
         parallel_args = {'n_jobs': n_jobs}
@@ -1060,7 +1105,207 @@ def run_parallel(_fn, fn_args, n_jobs=None, filter_results=False):
                 from joblib2 import Parallel, delayed
             else:
                 from joblib3 import Parallel, delayed
-        results_tuples = Parallel(**parallel_args)(delayed(_fn)(*args) for args in fn_args)
+        if multiprocessing.current_process().daemon:
+            results_tuples = Parallel(**parallel_args)(delayed(_run_job)(_fn, *args) for args in fn_args)
+        else:
+            # worker processes are counted in the threads shared with other stages running at the same time
+            parallel_args['n_jobs'] = threads_budget.acquire(n_jobs)
+            # joblib forks its worker processes before it takes the first job, so fork_lock is held until then only
+            calling_thread = threading.current_thread()
+            fork_lock.acquire()
+            is_locked = [True]
+
+            def jobs():
+                if is_locked and threading.current_thread() is calling_thread:
+                    fork_lock.release()
+                    is_locked.pop()
+                for args in fn_args:
+                    yield delayed(_run_job)(_fn, *args)
+            try:
+                results_tuples = Parallel(**parallel_args)(jobs())
+            finally:
+                if is_locked:
+                    fork_lock.release()
+                threads_budget.release(parallel_args['n_jobs'])
+    return _unpack_results(results_tuples, filter_results)
+
+
+class ThreadsBudget(object):
+    """
+        Threads available to external tools, shared by pipeline stages running at the same time,
+        so that all of them together use no more than qconfig.max_threads threads
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.used_threads = 0
+
+    def acquire(self, max_count, block=True):
+        """
+            Takes up to max_count free threads. If block is True, waits until at least one thread is free
+            Returns number of taken threads
+        """
+        with self.condition:
+            while block and self.used_threads >= qconfig.max_threads:
+                self.condition.wait()
+            count = max(0, min(max_count, qconfig.max_threads - self.used_threads))
+            self.used_threads += count
+            return count
+
+    def release(self, count):
+        with self.condition:
+            self.used_threads -= count
+            self.condition.notify_all()
+
+
+threads_budget = ThreadsBudget()
+# worker processes are forked by one thread at a time (pipeline stages running in background threads start them too)
+fork_lock = threading.RLock()
+
+
+def split_threads(job_sizes, threads):
+    """
+        Splits threads between jobs proportionally to their sizes, each job gets at least one thread
+        (so the number of jobs shouldn't exceed the number of threads), the rest goes to the largest job
+    """
+    total_size = sum(job_sizes)
+    shares = [max(1, threads * size // total_size if total_size else threads // len(job_sizes)) for size in job_sizes]
+    while sum(shares) > threads:
+        shares[shares.index(max(shares))] -= 1
+    shares[job_sizes.index(max(job_sizes))] += threads - sum(shares)
+    return shares
+
+
+def run_parallel_by_size(_fn, fn_args, job_sizes, job_memory=None, filter_results=False):
+    """
+        Runs _fn(*args, threads=N) for all args from fn_args using no more than qconfig.max_threads threads in total
+        together with other stages running at the same time (see ThreadsBudget).
+        Unlike run_parallel, threads are not split evenly up front: jobs are started from the largest one
+        (job_sizes are usually sizes of input files) as soon as there are free threads, and the free threads are split
+        between the started jobs proportionally to their sizes, so threads released by finished jobs go to the jobs
+        started later.
+        If job_memory (estimated bytes for each job) is specified, jobs are started only while their total estimated
+        memory fits into the budget given by get_free_memory (a single job is always allowed to run)
+    """
+    if multiprocessing.current_process().daemon:  # daemonic processes (e.g. joblib workers) can't have children
+        results_tuples = [_run_job(_fn, *args, threads=qconfig.max_threads) for args in fn_args]
+    elif qconfig.memory_efficient or qconfig.max_threads == 1 or len(fn_args) < 2:
+        results_tuples = []
+        for args in fn_args:
+            threads = threads_budget.acquire(qconfig.max_threads)
+            try:
+                results_tuples.append(_run_job(_fn, *args, threads=threads))
+            finally:
+                threads_budget.release(threads)
+    else:
+        results_tuples = _run_jobs_by_size(_fn, fn_args, job_sizes, job_memory)
+    return _unpack_results(results_tuples, filter_results)
+
+
+def _run_job_in_process(conn, buffer_logs, _fn, args, kwargs):
+    """
+        Target of worker processes started by _run_jobs_by_size: sends (status, value, log records) through the pipe,
+        status is 'ok' (value is the result), 'error' (traceback of the exception) or 'exit' (exit code).
+        A process which dies without sending anything (e.g. after a segfault or OOM kill) is detected by the parent process.
+        If buffer_logs is True (the job is started by a background stage), messages are sent to the parent process
+        instead of being written by the worker
+    """
+    if buffer_logs:
+        stage_log_buffer.start()
+    try:
+        status, value = 'ok', _run_job(_fn, *args, **kwargs)
+    except SystemExit:  # e.g. logger.error with exit_with_code
+        status, value = 'exit', sys.exc_info()[1].code
+    except Exception:
+        status, value = 'error', ''.join(traceback.format_exception(*sys.exc_info()))
+    conn.send((status, value, stage_log_buffer.pop(picklable=True)))
+    conn.close()
+
+
+def _get_job_result(job_idx, process, conn):
+    """
+        Returns (True, result) if the job is finished, (False, None) if it is still running.
+        Fails if the job raised an exception, exited or its process died without sending the result
+    """
+    if not conn.poll() and process.is_alive():
+        return False, None
+    try:
+        status, value, log_records = conn.recv()
+    except EOFError:  # the pipe is closed by the dead process
+        process.join()
+        raise RuntimeError('Worker process running job %d died unexpectedly (exit code %s)' % (job_idx, process.exitcode))
+    stage_log_buffer.add(log_records)
+    if status == 'exit':  # the error is already reported by the job
+        sys.exit(value)
+    if status == 'error':
+        raise RuntimeError('Job %d failed in a worker process:\n%s' % (job_idx, value))
+    return True, value
+
+
+def _run_jobs_by_size(_fn, fn_args, job_sizes, job_memory):
+    """
+        Each job runs in its own worker process, so a worker that dies (e.g. killed by OOM killer) fails the stage
+        instead of leaving the job unfinished forever, as it happens with multiprocessing.Pool
+    """
+    max_threads = qconfig.max_threads
+    memory_budget = max(1, get_free_memory()) * 1024 ** 3
+    pending_jobs = sorted(range(len(fn_args)), key=lambda job_idx: -job_sizes[job_idx])
+    running_jobs = dict()  # job index --> (worker process, connection, threads, estimated memory)
+    results_tuples = [None] * len(fn_args)
+    try:
+        while pending_jobs or running_jobs:
+            free_threads = threads_budget.acquire(max_threads, block=not running_jobs) if pending_jobs else 0
+            used_memory = sum(memory for _, _, _, memory in running_jobs.values())
+            started_jobs = []
+            for job_idx in pending_jobs:
+                if len(started_jobs) == free_threads:
+                    break
+                memory = job_memory[job_idx] if job_memory else 0
+                if (running_jobs or started_jobs) and used_memory + memory > memory_budget:
+                    continue
+                started_jobs.append(job_idx)
+                used_memory += memory
+            if started_jobs:
+                jobs_threads = split_threads([job_sizes[job_idx] for job_idx in started_jobs], free_threads)
+                for job_idx, threads in zip(started_jobs, jobs_threads):
+                    pending_jobs.remove(job_idx)
+                    memory = job_memory[job_idx] if job_memory else 0
+                    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+                    process = multiprocessing.Process(target=_run_job_in_process,
+                                                      args=(child_conn, stage_log_buffer.is_started(), _fn,
+                                                            tuple(fn_args[job_idx]), {'threads': threads}))
+                    process.daemon = True  # as workers of multiprocessing.Pool, so nested jobs run sequentially
+                    with fork_lock:
+                        process.start()
+                        child_conn.close()  # so that processes forked later don't hold the pipe open
+                    running_jobs[job_idx] = (process, parent_conn, threads, memory)
+            elif free_threads:
+                threads_budget.release(free_threads)
+
+            # threads can be released by other stages too, so pending jobs are checked again after a short wait
+            finished_jobs = []
+            for job_idx, (process, conn, _, _) in running_jobs.items():
+                is_finished, result = _get_job_result(job_idx, process, conn)
+                if is_finished:
+                    finished_jobs.append(job_idx)
+                    results_tuples[job_idx] = result
+            if not finished_jobs and running_jobs:
+                next(iter(running_jobs.values()))[1].poll(0.1)
+            for job_idx in finished_jobs:
+                process, conn, threads, _ = running_jobs.pop(job_idx)
+                threads_budget.release(threads)
+                conn.close()
+                process.join()
+    finally:
+        threads_budget.release(sum(threads for _, _, threads, _ in running_jobs.values()))
+        for process, conn, _, _ in running_jobs.values():
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            conn.close()
+    return results_tuples
+
+
+def _unpack_results(results_tuples, filter_results):
     results = []
     if results_tuples:
         if isinstance(results_tuples[0], list) or isinstance(results_tuples[0], tuple):
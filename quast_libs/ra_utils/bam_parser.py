@@ -0,0 +1,327 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Streaming reader of read alignments in BAM and SAM formats (AlignmentsReader) exposing only the fields
+# used by Reads analyzer, and writer of BAM files from raw records of a read BAM file (BamWriter).
+# BAM files are BGZF files: concatenated gzip members (blocks) of at most 64 KB of data each.
+# Blocks are (de)compressed in a thread pool since zlib releases GIL.
+#
+############################################################################
+
+from __future__ import with_statement
+import re
+import struct
+import zlib
+from itertools import chain
+from multiprocessing.pool import ThreadPool
+
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+BGZF_HEADER = struct.Struct('<4sIBBHBBHH')  # gzip header with BC extra subfield: ..., XLEN, SI1, SI2, SLEN, BSIZE
+BGZF_FOOTER = struct.Struct('<II')  # CRC32, ISIZE
+BGZF_EOF = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+BGZF_MAX_BLOCK_DATA_SIZE = 0xff00  # compressed data of a block should fit into 64 KB
+BLOCKS_PER_THREAD = 16  # blocks decompressed by a thread at once
+WRITE_BATCH_BLOCKS = 64  # blocks compressed at once
+
+BAM_MAGIC = b'BAM\x01'
+INT32 = struct.Struct('<i')
+# block_size, refID, pos, l_read_name, mapq, bin, n_cigar_op, flag, l_seq, next_refID, next_pos, tlen
+BAM_RECORD_CORE = struct.Struct('<iiiBBHHHiiii')
+BAM_NAME_CIGAR_LENS = struct.Struct('<B3xH')  # l_read_name, n_cigar_op (at offset 12)
+CIGAR_REF_OPS = (0, 2, 3, 7, 8)  # M, D, N, =, X
+SAM_CIGAR_PATTERN = re.compile(r'(\d+)([MIDNSHP=X])')
+BAM_REF_ID_OFFSET = 4
+BAM_NEXT_REF_ID_OFFSET = 24
+
+FLAG_PROPER_PAIR = 0x2
+FLAG_UNMAPPED = 0x4
+FLAG_SECONDARY = 0x100
+FLAG_SUPPLEMENTARY = 0x800
+FLAG_DUPLICATE = 0x400
+
+
+def is_bam_file(fpath):
+    with open(fpath, 'rb') as f:
+        return f.read(len(BGZF_MAGIC)) == BGZF_MAGIC
+
+
+class AlignmentRecord(object):
+    """
+        Fields of a read alignment used by Reads analyzer: reference index (-1 for unmapped reads),
+        1-based position, mapping quality, flag, reference index of the mate, template length, read length.
+        data is the raw record (SAM line or BAM record with its size) for writing it to another file.
+    """
+    __slots__ = ('ref_id', 'start', 'end', 'mapq', 'flag', 'next_ref_id', 'tlen', 'len', 'data')
+
+    def __init__(self, ref_id, start, mapq, flag, next_ref_id, tlen, length, data):
+        self.ref_id, self.start, self.mapq, self.flag, self.next_ref_id, self.tlen, self.len, self.data = \
+            ref_id, start, mapq, flag, next_ref_id, tlen, length, data
+        self.end = start + length - 1  # actually not always true because of indels
+
+
+class BamRecord(AlignmentRecord):
+    __slots__ = ()
+
+    def ref_len(self):
+        """
+            Length of the alignment on the reference (sum of M, D, N, = and X operations of CIGAR)
+        """
+        l_read_name, n_cigar_op = BAM_NAME_CIGAR_LENS.unpack_from(self.data, 12)
+        cigar = struct.unpack_from('<%dI' % n_cigar_op, self.data, BAM_RECORD_CORE.size + l_read_name)
+        return sum(op >> 4 for op in cigar if (op & 0xf) in CIGAR_REF_OPS)
+
+    def read_name(self):
+        l_read_name = BAM_NAME_CIGAR_LENS.unpack_from(self.data, 12)[0]
+        return self.data[BAM_RECORD_CORE.size:BAM_RECORD_CORE.size + l_read_name - 1].decode('utf-8')
+
+
+class SamRecord(AlignmentRecord):
+    __slots__ = ()
+
+    def ref_len(self):
+        """
+            Length of the alignment on the reference (sum of M, D, N, = and X operations of CIGAR)
+        """
+        cigar = self.data.split('\t', 6)[5]
+        return sum(int(length) for length, op in SAM_CIGAR_PATTERN.findall(cigar) if op in 'MDN=X')
+
+    def read_name(self):
+        return self.data.split('\t', 1)[0]
+
+
+def _inflate(block):
+    return zlib.decompress(block, -15)
+
+
+def _deflate(data):
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    header = BGZF_HEADER.pack(BGZF_MAGIC, 0, 0, 0xff, 6, 66, 67, 2, BGZF_HEADER.size + len(cdata) + BGZF_FOOTER.size - 1)
+    return header + cdata + BGZF_FOOTER.pack(zlib.crc32(data) & 0xffffffff, len(data))
+
+
+def _read_bgzf_blocks(f, fpath):
+    while True:
+        header = f.read(BGZF_HEADER.size)
+        if not header:
+            return
+        if len(header) < BGZF_HEADER.size:
+            raise ValueError('Truncated BGZF block in ' + fpath)
+        magic, _, _, _, xlen, si1, si2, _, bsize = BGZF_HEADER.unpack(header)
+        if magic != BGZF_MAGIC or si1 != 66 or si2 != 67:
+            raise ValueError('Unsupported format of BGZF block in ' + fpath)
+        f.seek(xlen - 6, 1)  # other extra subfields
+        block = f.read(bsize - xlen - 19)
+        f.seek(BGZF_FOOTER.size, 1)
+        yield block
+
+
+def _batches(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _map_in_batches(pool, fn, iterable, batch_size):
+    """
+        Like pool.imap but reads only the next batch of iterable ahead (imap reads the whole iterable)
+    """
+    if pool is None:
+        for item in iterable:
+            yield fn(item)
+        return
+    pending = None
+    for batch in _batches(iterable, batch_size):
+        next_pending = pool.map_async(fn, batch)
+        if pending is not None:
+            for result in pending.get():
+                yield result
+        pending = next_pending
+    if pending is not None:
+        for result in pending.get():
+            yield result
+
+
+class AlignmentsReader(object):
+    """
+        Iterates over AlignmentRecords of a BAM or SAM file. ref_names and ref_lengths are taken from the header
+        (references which are absent in the header of a SAM file are added when met), header_lines are the lines
+        of the text header. BAM files are decompressed in the given number of threads.
+    """
+    def __init__(self, fpath, threads=1):
+        self.fpath = fpath
+        self.threads = threads
+        self.ref_names = []
+        self.ref_lengths = []
+        self.header_lines = []
+        self._ref_ids = {}
+        self._file = None
+        self._pool = None
+        self.is_bam = is_bam_file(fpath)
+        if self.is_bam:
+            self._file = open(fpath, 'rb')
+            if threads > 1:
+                self._pool = ThreadPool(threads)
+            self._chunks = _map_in_batches(self._pool, _inflate, _read_bgzf_blocks(self._file, fpath),
+                                           threads * BLOCKS_PER_THREAD)
+            self._buffer = b''
+            self._read_bam_header()
+        else:
+            self._file = open(fpath)
+            self._first_line = self._read_sam_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._pool:
+            self._pool.terminate()
+            self._pool = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _add_ref(self, name, length=None):
+        self._ref_ids[name] = len(self.ref_names)
+        self.ref_names.append(name)
+        self.ref_lengths.append(length)
+
+    def _read(self, size):
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                raise ValueError('Truncated BAM file ' + self.fpath)
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _read_bam_header(self):
+        if self._read(4) != BAM_MAGIC:
+            raise ValueError('Unsupported format of BAM file ' + self.fpath)
+        l_text = INT32.unpack(self._read(4))[0]
+        text = self._read(l_text).rstrip(b'\0').decode('utf-8')
+        self.header_lines = text.splitlines()
+        n_ref = INT32.unpack(self._read(4))[0]
+        for _ in range(n_ref):
+            l_name = INT32.unpack(self._read(4))[0]
+            name = self._read(l_name)[:-1].decode('utf-8')
+            self._add_ref(name, INT32.unpack(self._read(4))[0])
+
+    def _read_sam_header(self):
+        for line in self._file:
+            if not line.startswith('@'):
+                return line
+            self.header_lines.append(line.rstrip('\n'))
+            if line.startswith('@SQ') and 'SN:' in line and 'LN:' in line:
+                self._add_ref(line.split('\tSN:')[1].split('\t')[0], int(line.split('\tLN:')[1].split('\t')[0]))
+        return None
+
+    def __iter__(self):
+        return self._iter_bam() if self.is_bam else self._iter_sam()
+
+    def _iter_bam(self):
+        data = b''
+        pos = 0
+        core_size = BAM_RECORD_CORE.size
+        unpack_core = BAM_RECORD_CORE.unpack_from
+        for chunk in chain([self._buffer], self._chunks):
+            data = data[pos:] + chunk
+            pos = 0
+            data_len = len(data)
+            while pos + core_size <= data_len:
+                block_size, ref_id, start, _, mapq, _, _, flag, l_seq, next_ref_id, _, tlen = unpack_core(data, pos)
+                record_end = pos + 4 + block_size
+                if record_end > data_len:
+                    break
+                yield BamRecord(ref_id, start + 1, mapq, flag, next_ref_id, tlen,
+                                      l_seq or 1,  # SEQ is '*', as len('*') of a SAM line
+                                      data[pos:record_end])
+                pos = record_end
+        if pos != len(data):
+            raise ValueError('Truncated BAM file ' + self.fpath)
+
+    def _get_sam_ref_id(self, name):
+        if name == '*':
+            return -1
+        if name not in self._ref_ids:
+            self._add_ref(name)
+        return self._ref_ids[name]
+
+    def _iter_sam(self):
+        if self._first_line is None:
+            return
+        for line in chain([self._first_line], self._file):
+            fs = line.split('\t')
+            if len(fs) < 11:  # not valid line
+                continue
+            ref_id = self._get_sam_ref_id(fs[2])
+            next_ref_id = ref_id if fs[6] == '=' else self._get_sam_ref_id(fs[6])
+            yield SamRecord(ref_id, int(fs[3]), int(fs[4]), int(fs[1]), next_ref_id, int(fs[8]), len(fs[9]), line)
+
+
+class BamWriter(object):
+    """
+        Writes a BAM file with the given header lines and references from raw BAM records of AlignmentsReader.
+        Reference indices of records are translated by ref_id_map (index in the source file --> index in this file).
+        Blocks are compressed in the given ThreadPool (may be shared between writers).
+    """
+    def __init__(self, fpath, header_lines, ref_names, ref_lengths, ref_id_map, pool=None):
+        self.fpath = fpath
+        self.ref_id_map = ref_id_map
+        self._file = open(fpath, 'wb')
+        self._pool = pool
+        self._blocks_data = []
+        self._data = []
+        self._data_len = 0
+        text = ''.join(line + '\n' for line in header_lines).encode('utf-8')
+        header = [BAM_MAGIC, INT32.pack(len(text)), text, INT32.pack(len(ref_names))]
+        for name, length in zip(ref_names, ref_lengths):
+            name = name.encode('utf-8') + b'\0'
+            header.extend([INT32.pack(len(name)), name, INT32.pack(length)])
+        self._write(b''.join(header))
+
+    def _write(self, data):
+        self._data.append(data)
+        self._data_len += len(data)
+        if self._data_len >= BGZF_MAX_BLOCK_DATA_SIZE:
+            data = b''.join(self._data)
+            full_blocks_len = len(data) - len(data) % BGZF_MAX_BLOCK_DATA_SIZE
+            for start in range(0, full_blocks_len, BGZF_MAX_BLOCK_DATA_SIZE):
+                self._blocks_data.append(data[start:start + BGZF_MAX_BLOCK_DATA_SIZE])
+            rest = data[full_blocks_len:]
+            self._data = [rest] if rest else []
+            self._data_len = len(rest)
+            if len(self._blocks_data) >= WRITE_BATCH_BLOCKS:
+                self._flush_blocks()
+
+    def _flush_blocks(self):
+        blocks = self._pool.map(_deflate, self._blocks_data) if self._pool else map(_deflate, self._blocks_data)
+        for block in blocks:
+            self._file.write(block)
+        self._blocks_data = []
+
+    def write(self, record):
+        data = record.data
+        ref_id = self.ref_id_map.get(record.ref_id, -1)
+        next_ref_id = self.ref_id_map.get(record.next_ref_id, -1)
+        self._write(data[:BAM_REF_ID_OFFSET] + INT32.pack(ref_id) + data[BAM_REF_ID_OFFSET + 4:BAM_NEXT_REF_ID_OFFSET] +
+                    INT32.pack(next_ref_id) + data[BAM_NEXT_REF_ID_OFFSET + 4:])
+
+    def close(self):
+        if self._data:
+            self._blocks_data.append(b''.join(self._data))
+            self._data = []
+        self._flush_blocks()
+        self._file.write(BGZF_EOF)
+        self._file.close()
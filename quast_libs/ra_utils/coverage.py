@@ -0,0 +1,178 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Depth of coverage of reference chromosomes calculated in one pass over a coordinate-sorted BAM-file
+# (instead of bamToBed and bedtools genomecov). Depth is reported as runs (start, end, depth) of equal depth
+# covering whole chromosomes, as bedtools genomecov -bga does, to handlers with methods add_run and close.
+#
+############################################################################
+
+from __future__ import with_statement
+from __future__ import division
+from collections import defaultdict
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from quast_libs.site_packages.ordered_dict import OrderedDict
+
+from quast_libs.ra_utils.bam_parser import AlignmentsReader, FLAG_UNMAPPED, FLAG_PROPER_PAIR, FLAG_SECONDARY, \
+    FLAG_SUPPLEMENTARY, FLAG_DUPLICATE
+
+CHUNK_SIZE = 65536
+
+
+class DepthRuns(object):
+    """
+        Depth of coverage of a chromosome by intervals (0-based, half-open) added in the order of their starts.
+        Depth changes are collected in a difference map, which is turned into runs of equal depth by chunks:
+        depth before the start of the last added interval cannot change anymore.
+    """
+    def __init__(self, chr_len):
+        self.chr_len = chr_len
+        self.diff = defaultdict(int)
+        self.run_start = 0
+        self.depth = 0
+        self.next_flush = CHUNK_SIZE
+
+    def add(self, start, end):
+        """
+            Returns the list of completed runs or None
+        """
+        if start < self.run_start:
+            raise ValueError('Intervals are not sorted by start')
+        runs = self.flush(start) if start >= self.next_flush else None
+        end = min(end, self.chr_len)
+        if start < end:
+            self.diff[start] += 1
+            self.diff[end] -= 1
+        return runs
+
+    def flush(self, pos):
+        runs = []
+        diff = self.diff
+        for change_pos in sorted(change_pos for change_pos in diff if change_pos < pos):
+            delta = diff.pop(change_pos)
+            if delta:
+                if change_pos > self.run_start:
+                    runs.append((self.run_start, change_pos, self.depth))
+                    self.run_start = change_pos
+                self.depth += delta
+        self.next_flush = pos + CHUNK_SIZE
+        return runs
+
+    def close(self):
+        runs = self.flush(self.chr_len + 1)
+        if self.run_start < self.chr_len:
+            runs.append((self.run_start, self.chr_len, self.depth))
+            self.run_start = self.chr_len
+        return runs
+
+
+class DepthHistogram(object):
+    """
+        Number of bases of the genome by depth of coverage
+    """
+    def __init__(self):
+        self.bases_by_depth = defaultdict(int)
+        self.genome_size = 0
+
+    def add_run(self, chr_name, start, end, depth):
+        self.bases_by_depth[depth] += end - start
+        self.genome_size += end - start
+
+    def close(self):
+        pass
+
+    def avg_depth(self):
+        if not self.genome_size:
+            return 0
+        return sum(depth * bases for depth, bases in self.bases_by_depth.items()) / self.genome_size
+
+    def fraction(self, min_depth):
+        if not self.genome_size:
+            return 0
+        return sum(bases for depth, bases in self.bases_by_depth.items() if depth >= min_depth) / self.genome_size
+
+
+def _pass_runs(chr_name, runs, handlers):
+    for start, end, depth in runs:
+        for handler in handlers:
+            handler.add_run(chr_name, start, end, depth)
+
+
+def calculate_coverage(bam_fpath, read_handlers, fragment_handlers=None, max_fragment_len=None, threads=1):
+    """
+        Calculates depth of coverage by mapped reads (alignment spans on the reference) and, if fragment_handlers
+        are given, physical coverage by fragments of properly paired reads (from the start of the leftmost mate
+        to the end of the rightmost one, shorter than max_fragment_len) in one pass over the coordinate-sorted BAM-file.
+        A fragment is counted only if both mates are not duplicates; supplementary and secondary alignments are skipped.
+        Runs of all chromosomes are passed to the handlers in the order of the BAM header, handlers are closed afterwards.
+    """
+    fragment_handlers = fragment_handlers or []
+    with AlignmentsReader(bam_fpath, threads=threads) as reader:
+        ref_names, ref_lengths = reader.ref_names, reader.ref_lengths
+        cur_ref_id = -1
+        read_depth, fragment_depth, chr_name = None, None, None
+        # read name --> [fragment start, fragment end, True/False if both mates are checked], in the order of starts
+        pending_fragments = OrderedDict()
+
+        def add_fragments(pos=None):
+            # fragments are added in the order of their starts as soon as both mates are checked. The mate of
+            # a fragment starts before its end, so the fragment is dropped if pos is beyond and the mate is not found
+            while pending_fragments:
+                read_name, (frag_start, frag_end, is_passed) = next(iter(pending_fragments.items()))
+                if is_passed is None and pos is not None and pos <= (frag_start if frag_end is None else frag_end):
+                    break
+                del pending_fragments[read_name]
+                if is_passed and frag_end is not None:
+                    runs = fragment_depth.add(frag_start, frag_end)
+                    if runs:
+                        _pass_runs(chr_name, runs, fragment_handlers)
+
+        def finish_chromosomes(last_ref_id):
+            if read_depth:
+                _pass_runs(chr_name, read_depth.close(), read_handlers)
+                if fragment_handlers:
+                    add_fragments()
+                    _pass_runs(chr_name, fragment_depth.close(), fragment_handlers)
+            for ref_id in range(cur_ref_id + 1, last_ref_id):  # chromosomes without reads
+                _pass_runs(ref_names[ref_id], [(0, ref_lengths[ref_id], 0)], read_handlers + fragment_handlers)
+
+        for record in reader:
+            if record.ref_id < 0 or record.flag & FLAG_UNMAPPED:
+                continue
+            if record.ref_id != cur_ref_id:
+                if record.ref_id < cur_ref_id:
+                    raise ValueError('BAM-file is not sorted by coordinates: ' + bam_fpath)
+                finish_chromosomes(record.ref_id)
+                cur_ref_id = record.ref_id
+                chr_name = ref_names[cur_ref_id]
+                read_depth = DepthRuns(ref_lengths[cur_ref_id])
+                fragment_depth = DepthRuns(ref_lengths[cur_ref_id])
+            start = record.start - 1
+            runs = read_depth.add(start, start + record.ref_len())
+            if runs:
+                _pass_runs(chr_name, runs, read_handlers)
+            if fragment_handlers:
+                if pending_fragments:
+                    add_fragments(start)
+                if record.tlen and record.flag & FLAG_PROPER_PAIR and not record.flag & (FLAG_SECONDARY | FLAG_SUPPLEMENTARY):
+                    is_passed = not record.flag & FLAG_DUPLICATE and \
+                                (max_fragment_len is None or abs(record.tlen) < max_fragment_len)
+                    frag_end = start + record.tlen if record.tlen > 0 else None
+                    read_name = record.read_name()
+                    fragment = pending_fragments.get(read_name)
+                    if fragment is None:
+                        pending_fragments[read_name] = [start, frag_end, None if is_passed else False]
+                    else:
+                        if fragment[2] is None:
+                            fragment[2] = is_passed
+                        if fragment[1] is None:
+                            fragment[1] = frag_end
+        finish_chromosomes(len(ref_names))
+    for handler in read_handlers + fragment_handlers:
+        handler.close()
@@ -7,9 +7,12 @@
 
 from __future__ import with_statement
 import gzip
+import math
 import os
 import re
 import shutil
+import subprocess
+from collections import defaultdict
 
 try:
    from collections import OrderedDict
@@ -25,6 +28,7 @@ from os.path import join, isfile, basename, dirname, getsize
 from quast_libs import qconfig, qutils
 from quast_libs.ca_utils.misc import compile_minimap
 from quast_libs.fastaparser import get_chr_lengths_from_fastafile
+from quast_libs.ra_utils.bam_parser import AlignmentsReader
 from quast_libs.qutils import compile_tool, get_dir_for_download, relpath, get_path_to_program, download_file, \
     download_external_tool, is_non_empty_file, correct_name, get_free_memory
 
@@ -204,8 +208,10 @@ def get_correct_names_for_chroms(output_dirpath, fasta_fpath, sam_fpath, err_pat
     if not isfile(sam_fpath) and not isfile(sam_header_fpath):
         return None
     if isfile(sam_fpath):
-        qutils.call_subprocess([sambamba_fpath('sambamba'), 'view', '-H', '-S', sam_fpath],
-                               stdout=open(sam_header_fpath, 'w'), stderr=open(err_path, 'a'), logger=logger)
+        with AlignmentsReader(sam_fpath) as reader:
+            header_lines = reader.header_lines
+        with open(sam_header_fpath, 'w') as out_f:
+            out_f.write(''.join(line + '\n' for line in header_lines))
     chr_name_pattern = 'SN:(\S+)'
     chr_len_pattern = 'LN:(\d+)'
 
@@ -241,14 +247,11 @@ def get_correct_names_for_chroms(output_dirpath, fasta_fpath, sam_fpath, err_pat
 
 
 def all_read_names_correct(sam_fpath):
-    with open(sam_fpath) as sam_in:
-        for i, l in enumerate(sam_in):
+    with AlignmentsReader(sam_fpath) as reader:
+        for i, mapping in enumerate(reader):
             if i > 1000000:
                 return True
-            if not l:
-                continue
-            fs = l.split('\t')
-            read_name = fs[0]
+            read_name = mapping.read_name()
             if read_name[-2:] == '/1' or read_name[-2:] == '/2':
                 return False
     return True
@@ -269,6 +272,50 @@ def clean_read_names(sam_fpath, correct_sam_fpath):
     return correct_sam_fpath
 
 
+def align_to_bam(cmd, bam_fpath, max_threads, err_fpath, logger, read_pairs_stats=None):
+    """
+        Runs the aligner and pipes its output into sambamba view, which writes an unsorted BAM-file, without writing
+        a SAM-file: read names are cleaned on the fly as in clean_read_names. Alignments are also passed
+        to read_pairs_stats (if given). Lines with fewer than 11 mandatory SAM fields are skipped and reported.
+        Returns True if both the aligner and sambamba finished successfully
+    """
+    sambamba_cmd = [sambamba_fpath('sambamba'), 'view', '-t', str(max_threads), '-h', '-S', '-f', 'bam', '/dev/stdin']
+    logger.print_command_line(cmd + ['|'] + sambamba_cmd + ['>', relpath(bam_fpath), '2>>', relpath(err_fpath)],
+                              only_if_debug=True)
+    with open(err_fpath, 'a') as err_f:
+        with open(bam_fpath, 'wb') as bam_f:
+            sambamba = subprocess.Popen(sambamba_cmd, stdin=subprocess.PIPE, stdout=bam_f, stderr=err_f)
+            aligner = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err_f)
+            malformed_lines, first_malformed_line = 0, None
+            try:
+                for line in aligner.stdout:
+                    if not line.startswith(b'@'):
+                        fs = line.split(b'\t', 10)
+                        if len(fs) < 11:
+                            if line.strip():
+                                first_malformed_line = first_malformed_line or line
+                                malformed_lines += 1
+                            continue
+                        if fs[0][-2:] == b'/1' or fs[0][-2:] == b'/2':
+                            line = fs[0][:-2] + line[len(fs[0]):]
+                        if read_pairs_stats:
+                            read_pairs_stats.add(int(fs[1]), int(fs[8]), len(fs[9]))
+                    sambamba.stdin.write(line)
+                sambamba.stdin.close()
+            except IOError:  # sambamba has failed and closed the pipe
+                aligner.kill()
+            aligner.stdout.close()
+            aligner_code, sambamba_code = aligner.wait(), sambamba.wait()
+    if malformed_lines:
+        with open(err_fpath, 'ab') as err_f:
+            err_f.write(b'Malformed SAM line: ' + first_malformed_line.rstrip(b'\n') + b'\n')
+        logger.warning('Skipped ' + str(malformed_lines) + ' malformed SAM lines in the output of ' + basename(cmd[0]) +
+                       '. See ' + relpath(err_fpath) + ' for the first of them.')
+    if aligner_code != 0 or sambamba_code != 0:
+        logger.debug('The tool returned non-zero. See ' + relpath(err_fpath) + ' for stderr.')
+    return aligner_code == 0 and sambamba_code == 0
+
+
 def sort_bam(bam_fpath, sorted_bam_fpath, err_path, logger, threads=None, sort_rule=None):
     if not threads:
         threads = qconfig.max_threads
@@ -359,28 +406,55 @@ def bam_to_bed(output_dirpath, name, bam_fpath, err_path, logger, bedpe=False):
     return sorted_bed_fpath
 
 
-def calculate_read_len(sam_fpath):
-    read_lengths = []
-    mapped_flags = ['99', '147', '83', '163']  # reads mapped in correct order
-    with open(sam_fpath) as sam_in:
-        for i, l in enumerate(sam_in):
-            if i > 1000000:
-                break
-            if l.startswith('@'):
-                continue
-            fs = l.split('\t')
-            flag = fs[1]
-            if flag not in mapped_flags:
-                continue
-            read_lengths.append(len(fs[9]))
-    return sum(read_lengths) * 1.0 / len(read_lengths)
-
-
-def calculate_genome_cov(in_fpath, out_fpath, chr_len_fpath, err_fpath, logger, print_all_positions=True):
-    cmd = [bedtools_fpath('bedtools'), 'genomecov', '-ibam' if in_fpath.endswith('.bam') else '-i', in_fpath, '-g', chr_len_fpath]
-    if print_all_positions:
-        cmd += ['-bga']
-    qutils.call_subprocess(cmd, stdout=open(out_fpath, 'w'), stderr=open(err_fpath, 'a'), logger=logger)
+class ReadPairsStats(object):
+    """
+        Insert sizes and lengths of reads mapped in correct orientation and within insert size, collected
+        over all alignments in one pass. Insert sizes are counted by value (a fixed-bin histogram with bins of width 1),
+        so memory does not depend on the number of reads, while the median and percentiles are the same
+        as qutils.calc_median and qutils.percentile on the sorted list of all values
+    """
+    MAPPED_FLAGS = (99, 147, 83, 163)
+
+    def __init__(self):
+        self.insert_size_counts = defaultdict(int)
+        self.reads_count = 0
+        self.read_lengths_sum = 0
+
+    def add(self, flag, tlen, read_len):
+        if flag in self.MAPPED_FLAGS:
+            self.insert_size_counts[abs(tlen)] += 1
+            self.reads_count += 1
+            self.read_lengths_sum += read_len
+
+    def add_record(self, record):
+        self.add(record.flag, record.tlen, record.len)
+
+    def _insert_size_at(self, idx):
+        values_count = 0
+        for insert_size in sorted(self.insert_size_counts):
+            values_count += self.insert_size_counts[insert_size]
+            if idx < values_count:
+                return insert_size
+
+    def median_insert_size(self):
+        if self.reads_count % 2 == 1:
+            return self._insert_size_at((self.reads_count - 1) // 2)
+        return (self._insert_size_at(self.reads_count // 2) + self._insert_size_at(self.reads_count // 2 - 1)) // 2
+
+    def insert_size_percentile(self, percent):
+        percentile_idx = int(math.ceil((self.reads_count * percent) / 100.0)) - 1
+        return self._insert_size_at(max(0, percentile_idx))
+
+    def avg_read_len(self):
+        return self.read_lengths_sum * 1.0 / self.reads_count
+
+
+def calculate_read_pairs_stats(sam_fpath):
+    stats = ReadPairsStats()
+    with AlignmentsReader(sam_fpath) as reader:
+        for mapping in reader:
+            stats.add_record(mapping)
+    return stats
 
 
 def sambamba_view(in_fpath, out_fpath, max_threads, err_fpath, logger, filter_rule=None):
@@ -12,46 +12,31 @@ import re
 import shutil
 import shlex
 from collections import defaultdict
+from multiprocessing.pool import ThreadPool
 from math import sqrt
 from os.path import isfile, join, basename, abspath, isdir, dirname, exists
 
-from quast_libs import qconfig, qutils
+from quast_libs import qconfig, qutils, cache
 from quast_libs.ca_utils.misc import minimap_fpath, ref_labels_by_chromosomes
 from quast_libs.fastaparser import create_fai_file
-from quast_libs.ra_utils.misc import compile_reads_analyzer_tools, sambamba_fpath, bwa_fpath, bedtools_fpath, \
+from quast_libs.ra_utils.misc import compile_reads_analyzer_tools, sambamba_fpath, bwa_fpath, \
     bwa_dirpath, download_gridss, get_gridss_fpath, get_gridss_memory, \
     paired_reads_names_are_equal, sort_bam, bwa_index, reformat_bedpe, get_correct_names_for_chroms, \
-    all_read_names_correct, clean_read_names, check_cov_file, bam_to_bed, get_safe_fpath, sambamba_view, \
-    calculate_genome_cov
-from quast_libs.qutils import is_non_empty_file, add_suffix, get_chr_len_fpath, run_parallel, \
-    get_path_to_program, check_java_version, percentile, calc_median
+    all_read_names_correct, clean_read_names, check_cov_file, get_safe_fpath, sambamba_view, calculate_read_pairs_stats, \
+    align_to_bam, ReadPairsStats
+from quast_libs.ra_utils.bam_parser import AlignmentsReader, BamWriter, FLAG_PROPER_PAIR, FLAG_UNMAPPED
+from quast_libs.ra_utils.coverage import calculate_coverage, DepthHistogram
+from quast_libs.qutils import is_non_empty_file, add_suffix, run_parallel_by_size, \
+    get_path_to_program, check_java_version
 
 from quast_libs.log import get_logger
 from quast_libs.reporting import save_reads
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
-ref_sam_fpaths = {}
+ref_bam_fpaths = {}
 COVERAGE_FACTOR = 10
 
 
-class Mapping(object):
-    MIN_MAP_QUALITY = 20  # for distiguishing "good" reads and "bad" ones
-
-    def __init__(self, fields):
-        self.ref, self.start, self.mapq, self.ref_next, self.len = \
-            fields[2], int(fields[3]), int(fields[4]), fields[6], len(fields[9])
-        self.end = self.start + self.len - 1  # actually not always true because of indels
-
-    @staticmethod
-    def parse(line):
-        if line.startswith('@'):  # comment
-            return None
-        if len(line.split('\t')) < 11:  # not valid line
-            return None
-        mapping = Mapping(line.split('\t'))
-        return mapping
-
-
 class QuastDeletion(object):
     ''' describes situtations: GGGGBBBBBNNNNNNNNNNNNBBBBBBGGGGGG, where
     G -- "good" read (high mapping quality)
@@ -63,6 +48,7 @@ class QuastDeletion(object):
     '''
 
     MAX_CONFIDENCE_INTERVAL = 150
+    MIN_MAP_QUALITY = 20  # for distiguishing "good" reads and "bad" ones
     MIN_GAP = qconfig.extensive_misassembly_threshold - 2 * MAX_CONFIDENCE_INTERVAL
 
     def __init__(self, ref, prev_good=None, prev_bad=None, next_bad=None, next_good=None, next_bad_end=None):
@@ -110,11 +96,9 @@ class QuastDeletion(object):
                           self.id]))
 
 
-def process_one_ref(cur_ref_fpath, output_dirpath, err_fpath, max_threads, bam_fpath=None, bed_fpath=None):
+def process_one_ref(cur_ref_fpath, output_dirpath, err_fpath, bam_fpath=None, bed_fpath=None, threads=1):
     ref_name = qutils.name_from_fpath(cur_ref_fpath)
-    if not bam_fpath:
-        sam_fpath = join(output_dirpath, ref_name + '.sam')
-        bam_fpath = join(output_dirpath, ref_name + '.bam')
+    if not bam_fpath:  # properly paired reads of the reference are split by search_trivial_deletions
         bam_sorted_fpath = join(output_dirpath, ref_name + '.sorted.bam')
     else:
         sam_fpath = bam_fpath.replace('.bam', '.sam')
@@ -125,8 +109,10 @@ def process_one_ref(cur_ref_fpath, output_dirpath, err_fpath, max_threads, bam_f
         return bed_fpath
 
     if not isfile(bam_sorted_fpath):
+        if not bam_fpath:
+            return None
         sambamba_view(sam_fpath, bam_fpath, qconfig.max_threads, err_fpath, logger,  filter_rule='not unmapped and proper_pair')
-        sort_bam(bam_fpath, bam_sorted_fpath, err_fpath, logger, threads=max_threads)
+        sort_bam(bam_fpath, bam_sorted_fpath, err_fpath, logger, threads=threads)
     if not is_non_empty_file(bam_sorted_fpath + '.bai'):
         qutils.call_subprocess([sambamba_fpath('sambamba'), 'index', bam_sorted_fpath],
                                stderr=open(err_fpath, 'a'), logger=logger)
@@ -145,7 +131,7 @@ def process_one_ref(cur_ref_fpath, output_dirpath, err_fpath, max_threads, bam_f
                                 '-Dsamjdk.use_async_io_write_samtools=true', '-Dsamjdk.use_async_io_write_tribble=true',
                                 '-cp', get_gridss_fpath(), 'gridss.CallVariants', 'I=' + bam_sorted_fpath, 'O=' + vcf_fpath,
                                 'ASSEMBLY=' + join(vcf_output_dirpath, ref_name + '.gridss.bam'), 'R=' + cur_ref_fpath,
-                                'WORKER_THREADS=' + str(max_threads), 'WORKING_DIR=' + vcf_output_dirpath],
+                                'WORKER_THREADS=' + str(threads), 'WORKING_DIR=' + vcf_output_dirpath],
                                 stderr=open(err_fpath, 'a'), logger=logger, env=env)
     if is_non_empty_file(vcf_fpath):
         raw_bed_fpath = add_suffix(bed_fpath, 'raw')
@@ -172,19 +158,42 @@ def search_sv_with_gridss(main_ref_fpath, bam_fpath, meta_ref_fpaths, output_dir
         return None
 
     if meta_ref_fpaths:
-        n_jobs = min(len(meta_ref_fpaths), qconfig.max_threads)
-        threads_per_job = max(1, qconfig.max_threads // n_jobs)
-        parallel_args = [(cur_ref_fpath, output_dirpath, err_fpath, threads_per_job) for cur_ref_fpath in meta_ref_fpaths]
-        bed_fpaths = run_parallel(process_one_ref, parallel_args, n_jobs, filter_results=True)
+        parallel_args = [(cur_ref_fpath, output_dirpath, err_fpath) for cur_ref_fpath in meta_ref_fpaths]
+        ref_sizes = [os.path.getsize(cur_ref_fpath) for cur_ref_fpath in meta_ref_fpaths]
+        bed_fpaths = run_parallel_by_size(process_one_ref, parallel_args, ref_sizes, filter_results=True)
         if bed_fpaths:
             qutils.cat_files(bed_fpaths, final_bed_fpath)
     else:
-        process_one_ref(main_ref_fpath, output_dirpath, err_fpath, qconfig.max_threads, bam_fpath=bam_fpath, bed_fpath=final_bed_fpath)
+        process_one_ref(main_ref_fpath, output_dirpath, err_fpath, bam_fpath=bam_fpath, bed_fpath=final_bed_fpath, threads=qconfig.max_threads)
     logger.info('    Saving to: ' + final_bed_fpath)
     return final_bed_fpath
 
 
-def search_trivial_deletions(temp_output_dir, sam_sorted_fpath, ref_files, ref_labels, seq_lengths, need_ref_splitting):
+def create_ref_writers(reader, ref_labels, split_bam_fpaths, pool):
+    ref_writers = {}
+    header_lines = reader.header_lines
+    for cur_ref_name, ref_bam_fpath in split_bam_fpaths.items():
+        ref_ids = [ref_id for ref_id, seq_name in enumerate(reader.ref_names) if ref_labels.get(seq_name) == cur_ref_name]
+        ref_header_lines = []
+        if header_lines and not header_lines[0].startswith('@SQ'):
+            ref_header_lines.append(header_lines[0])
+        for h in (h for h in header_lines if h.startswith('@SQ') and 'SN:' in h):
+            seq_name = h.split('\tSN:')[1].split('\t')[0]
+            if seq_name in ref_labels and ref_labels[seq_name] == cur_ref_name:
+                ref_header_lines.append(h)
+        if header_lines and header_lines[-1] not in ref_header_lines:
+            ref_header_lines.append(header_lines[-1])
+        ref_writers[cur_ref_name] = BamWriter(ref_bam_fpath, ref_header_lines, [reader.ref_names[ref_id] for ref_id in ref_ids],
+                                              [reader.ref_lengths[ref_id] for ref_id in ref_ids],
+                                              dict((ref_id, i) for i, ref_id in enumerate(ref_ids)), pool=pool)
+    return ref_writers
+
+
+def search_trivial_deletions(temp_output_dir, bam_sorted_fpath, ref_labels, split_bam_fpaths):
+    """
+        Looks for trivial deletions and splits properly paired reads by references (for GRIDSS) in one pass
+        over the sorted BAM-file. split_bam_fpaths: reference name --> path to BAM-file of its reads
+    """
     deletions = []
     trivial_deletions_fpath = join(temp_output_dir, qconfig.trivial_deletions_fname)
     logger.info('  Looking for trivial deletions (long zero-covered fragments)...')
@@ -192,65 +201,70 @@ def search_trivial_deletions(temp_output_dir, sam_sorted_fpath, ref_files, ref_l
     if isfile(trivial_deletions_fpath):
         need_trivial_deletions = False
         logger.info('    Using existing file: ' + trivial_deletions_fpath)
-    if need_trivial_deletions or need_ref_splitting:
-        with open(sam_sorted_fpath) as sam_file:
+    if need_trivial_deletions or split_bam_fpaths:
+        with AlignmentsReader(bam_sorted_fpath, threads=qconfig.max_threads) as reader:
+            ref_names = reader.ref_names
+            seq_lengths = dict(zip(ref_names, reader.ref_lengths))
+            pool = ThreadPool(qconfig.max_threads) if split_bam_fpaths and qconfig.max_threads > 1 else None
+            ref_writers = create_ref_writers(reader, ref_labels, split_bam_fpaths, pool)
+            labels_by_ref_id = [ref_labels.get(seq_name) for seq_name in ref_names]
             cur_deletion = None
-            for line in sam_file:
-                mapping = Mapping.parse(line)
-                if mapping:
-                    if mapping.ref == '*':
-                        continue
-                    # common case: continue current deletion (potential) on the same reference
-                    if cur_deletion and cur_deletion.ref == mapping.ref:
-                        if cur_deletion.next_bad is None:  # previous mapping was in region BEFORE 0-covered fragment
-                            # just passed 0-covered fragment
-                            if mapping.start - cur_deletion.prev_bad > QuastDeletion.MIN_GAP:
-                                cur_deletion.set_next_bad(mapping)
-                                if mapping.mapq >= Mapping.MIN_MAP_QUALITY:
-                                    cur_deletion.set_next_good(mapping)
-                                    if cur_deletion.is_valid():
-                                        deletions.append(cur_deletion)
-                                    cur_deletion = QuastDeletion(mapping.ref).set_prev_good(mapping)
-                            # continue region BEFORE 0-covered fragment
-                            elif mapping.mapq >= Mapping.MIN_MAP_QUALITY:
-                                cur_deletion.set_prev_good(mapping)
-                            else:
-                                cur_deletion.set_prev_bad(mapping)
-                        else:  # previous mapping was in region AFTER 0-covered fragment
-                            # just passed another 0-cov fragment between end of cur_deletion BAD region and this mapping
-                            if mapping.start - cur_deletion.next_bad_end > QuastDeletion.MIN_GAP:
-                                if cur_deletion.is_valid():  # add previous fragment's deletion if needed
-                                    deletions.append(cur_deletion)
-                                cur_deletion = QuastDeletion(mapping.ref).set_prev_bad(position=cur_deletion.next_bad_end)
-                            # continue region AFTER 0-covered fragment (old one or new/another one -- see "if" above)
-                            elif mapping.mapq >= Mapping.MIN_MAP_QUALITY:
+            for mapping in reader:
+                if mapping.ref_id < 0:
+                    continue
+                ref = ref_names[mapping.ref_id]
+                # common case: continue current deletion (potential) on the same reference
+                if cur_deletion and cur_deletion.ref == ref:
+                    if cur_deletion.next_bad is None:  # previous mapping was in region BEFORE 0-covered fragment
+                        # just passed 0-covered fragment
+                        if mapping.start - cur_deletion.prev_bad > QuastDeletion.MIN_GAP:
+                            cur_deletion.set_next_bad(mapping)
+                            if mapping.mapq >= QuastDeletion.MIN_MAP_QUALITY:
                                 cur_deletion.set_next_good(mapping)
                                 if cur_deletion.is_valid():
                                     deletions.append(cur_deletion)
-                                cur_deletion = QuastDeletion(mapping.ref).set_prev_good(mapping)
-                            else:
-                                cur_deletion.set_next_bad_end(mapping)
-                    # special case: just started or just switched to the next reference
-                    else:
-                        if cur_deletion and cur_deletion.ref in seq_lengths:  # switched to the next ref
-                            cur_deletion.set_next_good(position=seq_lengths[cur_deletion.ref])
+                                cur_deletion = QuastDeletion(ref).set_prev_good(mapping)
+                        # continue region BEFORE 0-covered fragment
+                        elif mapping.mapq >= QuastDeletion.MIN_MAP_QUALITY:
+                            cur_deletion.set_prev_good(mapping)
+                        else:
+                            cur_deletion.set_prev_bad(mapping)
+                    else:  # previous mapping was in region AFTER 0-covered fragment
+                        # just passed another 0-cov fragment between end of cur_deletion BAD region and this mapping
+                        if mapping.start - cur_deletion.next_bad_end > QuastDeletion.MIN_GAP:
+                            if cur_deletion.is_valid():  # add previous fragment's deletion if needed
+                                deletions.append(cur_deletion)
+                            cur_deletion = QuastDeletion(ref).set_prev_bad(position=cur_deletion.next_bad_end)
+                        # continue region AFTER 0-covered fragment (old one or new/another one -- see "if" above)
+                        elif mapping.mapq >= QuastDeletion.MIN_MAP_QUALITY:
+                            cur_deletion.set_next_good(mapping)
                             if cur_deletion.is_valid():
                                 deletions.append(cur_deletion)
-                        cur_deletion = QuastDeletion(mapping.ref).set_prev_good(mapping)
-
-                    if need_ref_splitting:
-                        cur_ref = ref_labels[mapping.ref]
-                        if mapping.ref_next.strip() == '=' or cur_ref == ref_labels[mapping.ref_next]:
-                            if ref_files[cur_ref] is not None:
-                                ref_files[cur_ref].write(line)
+                            cur_deletion = QuastDeletion(ref).set_prev_good(mapping)
+                        else:
+                            cur_deletion.set_next_bad_end(mapping)
+                # special case: just started or just switched to the next reference
+                else:
+                    if cur_deletion and cur_deletion.ref in seq_lengths:  # switched to the next ref
+                        cur_deletion.set_next_good(position=seq_lengths[cur_deletion.ref])
+                        if cur_deletion.is_valid():
+                            deletions.append(cur_deletion)
+                    cur_deletion = QuastDeletion(ref).set_prev_good(mapping)
+
+                if ref_writers:
+                    cur_ref = labels_by_ref_id[mapping.ref_id]
+                    if cur_ref in ref_writers and mapping.flag & FLAG_PROPER_PAIR and not mapping.flag & FLAG_UNMAPPED and \
+                            (mapping.next_ref_id == mapping.ref_id or
+                             (mapping.next_ref_id >= 0 and cur_ref == labels_by_ref_id[mapping.next_ref_id])):
+                        ref_writers[cur_ref].write(mapping)
             if cur_deletion and cur_deletion.ref in seq_lengths:  # switched to the next ref
                 cur_deletion.set_next_good(position=seq_lengths[cur_deletion.ref])
                 if cur_deletion.is_valid():
                     deletions.append(cur_deletion)
-    if need_ref_splitting:
-        for ref_handler in ref_files.values():
-            if ref_handler is not None:
-                ref_handler.close()
+            for ref_writer in ref_writers.values():
+                ref_writer.close()
+            if pool:
+                pool.close()
     if need_trivial_deletions:
         logger.info('  Trivial deletions: %d found' % len(deletions))
         logger.info('    Saving to: ' + trivial_deletions_fpath)
@@ -281,9 +295,10 @@ def align_reference(ref_fpath, output_dir, using_reads='all', calculate_coverage
     log_path = join(output_dir, 'reads_stats.log')
     err_fpath = join(output_dir, 'reads_stats.err')
     correct_chr_names, sam_fpath, bam_fpath = align_single_file(ref_fpath, output_dir, temp_output_dir, log_path, err_fpath,
-                                                                qconfig.max_threads, sam_fpath=qconfig.reference_sam,
-                                                                bam_fpath=qconfig.reference_bam, required_files=required_files,
-                                                                is_reference=True, alignment_only=True, using_reads=using_reads)
+                                                                sam_fpath=qconfig.reference_sam, bam_fpath=qconfig.reference_bam,
+                                                                required_files=required_files, is_reference=True,
+                                                                alignment_only=True, using_reads=using_reads,
+                                                                threads=qconfig.max_threads)
     if not qconfig.optimal_assembly_insert_size or qconfig.optimal_assembly_insert_size == 'auto':
         if using_reads == 'pe' and sam_fpath:
             insert_size, _, _ = calculate_insert_size(sam_fpath, output_dir, ref_name)
@@ -358,22 +373,25 @@ def run_processing_reads(contigs_fpaths, main_ref_fpath, meta_ref_fpaths, ref_la
             required_files = []
 
     if not qconfig.no_read_stats:
-        n_jobs = min(qconfig.max_threads, len(contigs_fpaths) + 1)
-        max_threads_per_job = max(1, qconfig.max_threads // n_jobs)
         sam_fpaths = qconfig.sam_fpaths or [None] * len(contigs_fpaths)
         bam_fpaths = qconfig.bam_fpaths or [None] * len(contigs_fpaths)
-        parallel_align_args = [(contigs_fpath, output_dir, temp_output_dir, log_path, err_fpath, max_threads_per_job,
+        parallel_align_args = [(get_cache_entry(contigs_fpath, temp_output_dir, sam_fpaths[index], bam_fpaths[index], index),
+                                None, align_single_file, contigs_fpath, output_dir, temp_output_dir, log_path, err_fpath,
                                 sam_fpaths[index], bam_fpaths[index], index) for index, contigs_fpath in enumerate(contigs_fpaths)]
+        align_fpaths = list(contigs_fpaths)
     else:
-        n_jobs = 1
-        max_threads_per_job = qconfig.max_threads
         parallel_align_args = []
+        align_fpaths = []
 
     if main_ref_fpath:
-        parallel_align_args.append((main_ref_fpath, output_dir, temp_output_dir, log_path, err_fpath,
-                                    max_threads_per_job, qconfig.reference_sam, qconfig.reference_bam, None, required_files, True))
+        parallel_align_args.append((get_cache_entry(main_ref_fpath, temp_output_dir, qconfig.reference_sam, qconfig.reference_bam,
+                                                    is_reference=True),
+                                    None, align_single_file, main_ref_fpath, output_dir, temp_output_dir, log_path, err_fpath,
+                                    qconfig.reference_sam, qconfig.reference_bam, None, required_files, True))
+        align_fpaths.append(main_ref_fpath)
     if parallel_align_args:
-        correct_chr_names, sam_fpaths, bam_fpaths = run_parallel(align_single_file, parallel_align_args, n_jobs)
+        align_sizes = [os.path.getsize(fpath) for fpath in align_fpaths]
+        correct_chr_names, sam_fpaths, bam_fpaths = run_parallel_by_size(cache.run_cached_job, parallel_align_args, align_sizes)
         if not qconfig.no_read_stats:
             qconfig.sam_fpaths = sam_fpaths[:len(contigs_fpaths)]
             qconfig.bam_fpaths = bam_fpaths[:len(contigs_fpaths)]
@@ -392,59 +410,32 @@ def run_processing_reads(contigs_fpaths, main_ref_fpath, meta_ref_fpaths, ref_la
         logger.info('  Failed searching structural variations.')
         return None, None, None
 
-    sam_sorted_fpath = get_safe_fpath(temp_output_dir, add_suffix(sam_fpath, 'sorted'))
     bam_mapped_fpath = get_safe_fpath(temp_output_dir, add_suffix(bam_fpath, 'mapped'))
     bam_sorted_fpath = get_safe_fpath(temp_output_dir, add_suffix(bam_mapped_fpath, 'sorted'))
 
-    if is_non_empty_file(sam_sorted_fpath):
-        logger.info('  Using existing sorted SAM-file: ' + sam_sorted_fpath)
+    if is_non_empty_file(bam_sorted_fpath):
+        logger.info('  Using existing sorted BAM-file: ' + bam_sorted_fpath)
     else:
-        if not is_non_empty_file(bam_sorted_fpath):
-            sambamba_view(bam_fpath, bam_mapped_fpath, qconfig.max_threads, err_fpath, logger,  filter_rule='not unmapped')
-            sort_bam(bam_mapped_fpath, bam_sorted_fpath, err_fpath, logger)
-        sambamba_view(bam_sorted_fpath, sam_sorted_fpath, qconfig.max_threads, err_fpath, logger)
+        sambamba_view(bam_fpath, bam_mapped_fpath, qconfig.max_threads, err_fpath, logger,  filter_rule='not unmapped')
+        sort_bam(bam_mapped_fpath, bam_sorted_fpath, err_fpath, logger)
     if qconfig.create_icarus_html and (not is_non_empty_file(cov_fpath) or not is_non_empty_file(physical_cov_fpath)):
         cov_fpath, physical_cov_fpath = get_coverage(temp_output_dir, main_ref_fpath, ref_name, bam_fpath, bam_sorted_fpath,
                                                      log_path, err_fpath, correct_chr_names, cov_fpath, physical_cov_fpath)
     if not is_non_empty_file(bed_fpath) and not qconfig.no_sv:
+        split_bam_fpaths = {}
         if meta_ref_fpaths:
-            logger.info('  Splitting SAM-file by references...')
-        headers = []
-        seq_lengths = {}
-        with open(sam_fpath) as sam_file:
-            for line in sam_file:
-                if not line.startswith('@'):
-                    break
-                if line.startswith('@SQ') and 'SN:' in line and 'LN:' in line:
-                    seq_name = line.split('\tSN:')[1].split('\t')[0]
-                    seq_length = int(line.split('\tLN:')[1].split('\t')[0])
-                    seq_lengths[seq_name] = seq_length
-                headers.append(line.strip())
-        need_ref_splitting = False
-        ref_files = {}
-        if meta_ref_fpaths:
-            global ref_sam_fpaths
+            logger.info('  Splitting BAM-file by references...')
             for cur_ref_fpath in meta_ref_fpaths:
                 cur_ref_name = qutils.name_from_fpath(cur_ref_fpath)
-                ref_sam_fpath = join(temp_output_dir, cur_ref_name + '.sam')
-                ref_sam_fpaths[cur_ref_fpath] = ref_sam_fpath
-                if is_non_empty_file(ref_sam_fpath):
-                    logger.info('    Using existing split SAM-file for %s: %s' % (cur_ref_name, ref_sam_fpath))
-                    ref_files[cur_ref_name] = None
+                ref_bam_fpath = join(temp_output_dir, cur_ref_name + '.sorted.bam')
+                ref_bam_fpaths[cur_ref_fpath] = ref_bam_fpath
+                if is_non_empty_file(ref_bam_fpath):
+                    logger.info('    Using existing split BAM-file for %s: %s' % (cur_ref_name, ref_bam_fpath))
                 else:
-                    ref_sam_file = open(ref_sam_fpath, 'w')
-                    if not headers[0].startswith('@SQ'):
-                        ref_sam_file.write(headers[0] + '\n')
-                    for h in (h for h in headers if h.startswith('@SQ') and 'SN:' in h):
-                        seq_name = h.split('\tSN:')[1].split('\t')[0]
-                        if seq_name in ref_labels and ref_labels[seq_name] == cur_ref_name:
-                            ref_sam_file.write(h + '\n')
-                    ref_sam_file.write(headers[-1] + '\n')
-                    ref_files[cur_ref_name] = ref_sam_file
-                    need_ref_splitting = True
+                    split_bam_fpaths[cur_ref_name] = ref_bam_fpath
 
         trivial_deletions_fpath = \
-            search_trivial_deletions(temp_output_dir, sam_sorted_fpath, ref_files, ref_labels, seq_lengths, need_ref_splitting)
+            search_trivial_deletions(temp_output_dir, bam_sorted_fpath, ref_labels, split_bam_fpaths)
         if get_gridss_fpath() and isfile(get_gridss_fpath()):
             try:
                 gridss_sv_fpath = search_sv_with_gridss(main_ref_fpath, bam_mapped_fpath, meta_ref_fpaths, temp_output_dir, err_fpath)
@@ -472,8 +463,27 @@ def run_processing_reads(contigs_fpaths, main_ref_fpath, meta_ref_fpaths, ref_la
     return bed_fpath, cov_fpath, physical_cov_fpath
 
 
-def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpath, max_threads, sam_fpath=None, bam_fpath=None,
-                      index=None, required_files=None, is_reference=False, alignment_only=False, using_reads='all'):
+def get_cache_entry(fpath, output_dirpath, sam_fpath=None, bam_fpath=None, index=None, is_reference=False):
+    """
+        Only alignments made by QUAST (SAM/BAM files are not specified) are cached.
+        align_single_file reuses the restored SAM, BAM and flag statistics files
+    """
+    if sam_fpath or bam_fpath:
+        return None
+    filename = qutils.name_from_fpath(fpath)
+    reads_libraries = [qconfig.forward_reads, qconfig.reverse_reads, qconfig.interlaced_reads, qconfig.unpaired_reads,
+                       qconfig.mp_forward_reads, qconfig.mp_reverse_reads, qconfig.mp_interlaced_reads,
+                       qconfig.pacbio_reads, qconfig.nanopore_reads]
+    reads_fpaths = [reads_fpath for lib in reads_libraries for reads_fpath in lib]
+    output_fpaths = [join(output_dirpath, filename + '.sam'), join(output_dirpath, filename + '.bam'),
+                     join(dirname(output_dirpath), filename + '.stat')]
+    label = 'reference' if is_reference else qutils.label_from_fpath(fpath)
+    return cache.get_entry('reads_alignment', label, [fpath] + reads_fpaths, ['coverage_thresholds'],
+                           [filename, [len(lib) for lib in reads_libraries]], output_fpaths, index=index, files_only=True)
+
+
+def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpath, sam_fpath=None, bam_fpath=None,
+                      index=None, required_files=None, is_reference=False, alignment_only=False, using_reads='all', threads=1):
     filename = qutils.name_from_fpath(fpath)
     if not sam_fpath and bam_fpath:
         sam_fpath = get_safe_fpath(output_dirpath, bam_fpath[:-4] + '.sam')
@@ -483,8 +493,10 @@ def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpat
     if using_reads != 'all':
         sam_fpath = join(output_dirpath, filename + '.' + using_reads + '.sam')
         bam_fpath = sam_fpath.replace('.sam', '.bam')
+    if not is_non_empty_file(sam_fpath) and is_non_empty_file(bam_fpath) and all_read_names_correct(bam_fpath):
+        sam_fpath = bam_fpath  # e.g. reads aligned by QUAST are kept only in the BAM-file
     if alignment_only or (is_reference and required_files and any(f.endswith('bed') for f in required_files)):
-        required_files.append(sam_fpath)
+        required_files.append(bam_fpath)
 
     stats_fpath = get_safe_fpath(dirname(output_dirpath), filename + '.stat')
     index_str = qutils.index_to_str(index) if index is not None else ''
@@ -499,15 +511,16 @@ def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpat
             if isfile(stats_fpath):
                 logger.info('  ' + index_str + 'Using existing flag statistics file ' + stats_fpath)
             elif isfile(bam_fpath):
-                qutils.call_subprocess([sambamba_fpath('sambamba'), 'flagstat', '-t', str(max_threads), bam_fpath],
+                qutils.call_subprocess([sambamba_fpath('sambamba'), 'flagstat', '-t', str(threads), bam_fpath],
                                        stdout=open(stats_fpath, 'w'), stderr=open(err_fpath, 'a'))
-                analyse_coverage(output_dirpath, fpath, correct_chr_names, bam_fpath, stats_fpath, err_fpath, logger)
+                analyse_coverage(output_dirpath, bam_fpath, stats_fpath, err_fpath, logger)
         if isfile(stats_fpath) or alignment_only:
             return correct_chr_names, sam_fpath, bam_fpath
 
     logger.info('  ' + index_str + 'Pre-processing reads...')
     if is_non_empty_file(sam_fpath) and can_reuse:
-        logger.info('  ' + index_str + 'Using existing SAM-file: ' + sam_fpath)
+        if sam_fpath != bam_fpath:
+            logger.info('  ' + index_str + 'Using existing SAM-file: ' + sam_fpath)
         correct_chr_names = get_correct_names_for_chroms(output_dirpath, fpath, sam_fpath, err_fpath, reads_fpaths, logger, is_reference)
     elif is_non_empty_file(bam_fpath) and can_reuse:
         logger.info('  ' + index_str + 'Using existing BAM-file: ' + bam_fpath)
@@ -520,50 +533,42 @@ def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpat
             logger.info('  ' + index_str + 'Running BWA...')
         # use absolute paths because we will change workdir
         fpath = abspath(fpath)
-        sam_fpath = abspath(sam_fpath)
+        bam_fpath = abspath(bam_fpath)
 
         prev_dir = os.getcwd()
         os.chdir(output_dirpath)
         bwa_index(fpath, err_fpath, logger)
-        sam_fpaths = align_reads(fpath, sam_fpath, using_reads, main_output_dir, err_fpath, max_threads)
-
-        if len(sam_fpaths) > 1:
-            merge_sam_files(sam_fpaths, sam_fpath, bam_fpath, max_threads, err_fpath)
-        elif len(sam_fpaths) == 1:
-            shutil.move(sam_fpaths[0], sam_fpath)
-            tmp_bam_fpath = sam_fpaths[0].replace('.sam', '.bam')
-            if is_non_empty_file(tmp_bam_fpath):
-                shutil.move(tmp_bam_fpath, bam_fpath)
+        is_aligned = align_reads(fpath, bam_fpath, using_reads, main_output_dir, err_fpath, threads)
 
         logger.info('  ' + index_str + 'Done.')
         os.chdir(prev_dir)
-        if not is_non_empty_file(sam_fpath):
+        if not is_aligned or not is_non_empty_file(bam_fpath):
             logger.error('  Failed running BWA for ' + fpath + '. See ' + log_path + ' for information.')
             return None, None, None
+        sam_fpath = bam_fpath
         correct_chr_names = get_correct_names_for_chroms(output_dirpath, fpath, sam_fpath, err_fpath, reads_fpaths, logger, is_reference)
 
     elif not correct_chr_names or not is_non_empty_file(sam_fpath):
         return None, None, None
-    if is_reference:
-        logger.info('  Sorting SAM-file for reference...')
-    else:
-        logger.info('  ' + index_str + 'Sorting SAM-file...')
-
-    if can_reuse and is_non_empty_file(bam_fpath) and all_read_names_correct(sam_fpath):
+    elif can_reuse and is_non_empty_file(bam_fpath) and all_read_names_correct(sam_fpath):
         logger.info('  ' + index_str + 'Using existing BAM-file: ' + bam_fpath)
     else:
+        if is_reference:
+            logger.info('  Sorting SAM-file for reference...')
+        else:
+            logger.info('  ' + index_str + 'Sorting SAM-file...')
         correct_sam_fpath = join(output_dirpath, filename + '.' + using_reads + '.correct.sam')  # write in output dir
         sam_fpath = clean_read_names(sam_fpath, correct_sam_fpath)
-        sambamba_view(correct_sam_fpath, bam_fpath, max_threads, err_fpath, logger, filter_rule=None)
+        sambamba_view(correct_sam_fpath, bam_fpath, threads, err_fpath, logger, filter_rule=None)
 
     qutils.assert_file_exists(bam_fpath, 'bam file')
     if not alignment_only:
         if isfile(stats_fpath):
             logger.info('  ' + index_str + 'Using existing flag statistics file ' + stats_fpath)
         elif isfile(bam_fpath):
-            qutils.call_subprocess([sambamba_fpath('sambamba'), 'flagstat', '-t', str(max_threads), bam_fpath],
+            qutils.call_subprocess([sambamba_fpath('sambamba'), 'flagstat', '-t', str(threads), bam_fpath],
                                     stdout=open(stats_fpath, 'w'), stderr=open(err_fpath, 'a'))
-            analyse_coverage(output_dirpath, fpath, correct_chr_names, bam_fpath, stats_fpath, err_fpath, logger)
+            analyse_coverage(output_dirpath, bam_fpath, stats_fpath, err_fpath, logger)
         if is_reference:
             logger.info('  Analysis for reference is finished.')
         else:
@@ -571,26 +576,41 @@ def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpat
     return correct_chr_names, sam_fpath, bam_fpath
 
 
-def align_reads(ref_fpath, sam_fpath, using_reads, output_dir, err_fpath, max_threads):
-    out_sam_fpaths = []
+def align_reads(ref_fpath, bam_fpath, using_reads, output_dir, err_fpath, max_threads):
+    """
+        Aligns all libraries of reads into one BAM-file sorted by coordinates. Outputs of the aligners are piped
+        into sambamba, without intermediate SAM-files. Returns True if any library is aligned
+    """
+    out_bam_fpaths = []
 
     if using_reads == 'all' or using_reads == 'pe':
-        run_aligner(qconfig.paired_reads, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type='pe')
+        run_aligner(qconfig.paired_reads, ref_fpath, bam_fpath, out_bam_fpaths, output_dir, err_fpath, max_threads, reads_type='pe')
     if using_reads == 'all' or using_reads == 'mp':
-        run_aligner(qconfig.mate_pairs, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type='mp')
+        run_aligner(qconfig.mate_pairs, ref_fpath, bam_fpath, out_bam_fpaths, output_dir, err_fpath, max_threads, reads_type='mp')
     if using_reads == 'all' or using_reads == 'single':
-        run_aligner(qconfig.unpaired_reads, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type='single')
+        run_aligner(qconfig.unpaired_reads, ref_fpath, bam_fpath, out_bam_fpaths, output_dir, err_fpath, max_threads, reads_type='single')
     if using_reads == 'all' or using_reads == 'pacbio':
-        run_aligner(qconfig.pacbio_reads, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type='pacbio')
+        run_aligner(qconfig.pacbio_reads, ref_fpath, bam_fpath, out_bam_fpaths, output_dir, err_fpath, max_threads, reads_type='pacbio')
     if using_reads == 'all' or using_reads == 'nanopore':
-        run_aligner(qconfig.nanopore_reads, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type='nanopore')
-    return out_sam_fpaths
+        run_aligner(qconfig.nanopore_reads, ref_fpath, bam_fpath, out_bam_fpaths, output_dir, err_fpath, max_threads, reads_type='nanopore')
+
+    if not out_bam_fpaths:
+        return False
+    if len(out_bam_fpaths) == 1:
+        shutil.move(out_bam_fpaths[0], bam_fpath)
+    else:
+        qutils.call_subprocess([sambamba_fpath('sambamba'), 'merge', '-t', str(max_threads), bam_fpath] + out_bam_fpaths,
+                               stderr=open(err_fpath, 'a'), logger=logger)
+    for out_bam_fpath in out_bam_fpaths:
+        for fpath in [out_bam_fpath, out_bam_fpath + '.bai']:
+            if exists(fpath):
+                os.remove(fpath)
+    return True
 
 
-def run_aligner(read_fpaths, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type):
+def run_aligner(read_fpaths, ref_fpath, bam_fpath, out_bam_fpaths, output_dir, err_fpath, max_threads, reads_type):
     bwa_cmd = bwa_fpath('bwa') + ' mem -t ' + str(max_threads)
     insert_sizes = []
-    temp_sam_fpaths = []
     for idx, reads in enumerate(read_fpaths):
         if isinstance(reads, str):
             if reads_type == 'pacbio' or reads_type == 'nanopore':
@@ -604,34 +624,33 @@ def run_aligner(read_fpaths, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, e
         else:
             read1, read2 = reads
             cmdline = bwa_cmd + ' ' + ref_fpath + ' ' + read1 + ' ' + read2
-        output_fpath = add_suffix(sam_fpath, reads_type + str(idx + 1))
-        bam_fpath = output_fpath.replace('.sam', '.bam')
-        if not is_non_empty_file(output_fpath):
-            qutils.call_subprocess(shlex.split(cmdline), stdout=open(output_fpath, 'w'), stderr=open(err_fpath, 'a'), logger=logger)
-        if not is_non_empty_file(bam_fpath):
-            if not is_non_empty_file(bam_fpath):
-                sambamba_view(output_fpath, bam_fpath, max_threads, err_fpath, logger, filter_rule=None)
-            if reads_type == 'pe':
-                bam_dedup_fpath = add_suffix(bam_fpath, 'dedup')
+        lib_bam_fpath = add_suffix(bam_fpath, reads_type + str(idx + 1))
+        read_pairs_stats = None
+        if not is_non_empty_file(lib_bam_fpath):
+            unsorted_bam_fpath = add_suffix(lib_bam_fpath, 'unsorted')
+            read_pairs_stats = ReadPairsStats() if reads_type == 'pe' else None
+            try:
+                if align_to_bam(shlex.split(cmdline), unsorted_bam_fpath, max_threads, err_fpath, logger,
+                                read_pairs_stats=read_pairs_stats):
+                    sort_bam(unsorted_bam_fpath, lib_bam_fpath, err_fpath, logger, threads=max_threads)
+            finally:
+                if exists(unsorted_bam_fpath):
+                    os.remove(unsorted_bam_fpath)
+            if reads_type == 'pe' and is_non_empty_file(lib_bam_fpath):
+                bam_dedup_fpath = add_suffix(lib_bam_fpath, 'dedup')
                 qutils.call_subprocess([sambamba_fpath('sambamba'), 'markdup', '-r', '-t', str(max_threads), '--tmpdir',
-                                        output_dir, bam_fpath, bam_dedup_fpath],
+                                        output_dir, lib_bam_fpath, bam_dedup_fpath],
                                         stderr=open(err_fpath, 'a'), logger=logger)
                 if exists(bam_dedup_fpath):
-                    shutil.move(bam_dedup_fpath, bam_fpath)
+                    shutil.move(bam_dedup_fpath, lib_bam_fpath)
+        if not is_non_empty_file(lib_bam_fpath):
+            continue
         if reads_type == 'pe':
-            insert_size, _, _ = calculate_insert_size(output_fpath, output_dir, qutils.name_from_fpath(sam_fpath))
+            insert_size, _, _ = calculate_insert_size(lib_bam_fpath, output_dir, qutils.name_from_fpath(bam_fpath),
+                                                      read_pairs_stats=read_pairs_stats)
             if insert_size is not None and insert_size < qconfig.optimal_assembly_max_IS:
                 insert_sizes.append(insert_size)
-        temp_sam_fpaths.append(output_fpath)
-
-    if len(temp_sam_fpaths) == 1:
-        final_sam_fpath = add_suffix(sam_fpath, reads_type)
-        final_bam_fpath = final_sam_fpath.replace('.sam', '.bam')
-        shutil.move(temp_sam_fpaths[0], final_sam_fpath)
-        shutil.move(temp_sam_fpaths[0].replace('.sam', '.bam'), final_bam_fpath)
-        out_sam_fpaths.append(final_sam_fpath)
-    else:
-        out_sam_fpaths.extend(temp_sam_fpaths)
+        out_bam_fpaths.append(lib_bam_fpath)
 
     if insert_sizes:
         ref_name = qutils.name_from_fpath(ref_fpath)
@@ -640,21 +659,6 @@ def run_aligner(read_fpaths, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, e
             out.write(str(max(insert_sizes)))
 
 
-def merge_sam_files(tmp_sam_fpaths, sam_fpath, bam_fpath, max_threads, err_fpath):
-    tmp_bam_fpaths = []
-    for tmp_sam_fpath in tmp_sam_fpaths:
-        if is_non_empty_file(tmp_sam_fpath):
-            tmp_bam_fpath = tmp_sam_fpath.replace('.sam', '.bam')
-            tmp_bam_sorted_fpath = add_suffix(tmp_bam_fpath, 'sorted')
-            if not is_non_empty_file(tmp_bam_sorted_fpath):
-                sort_bam(tmp_bam_fpath, tmp_bam_sorted_fpath, err_fpath, logger)
-            tmp_bam_fpaths.append(tmp_bam_sorted_fpath)
-    qutils.call_subprocess([sambamba_fpath('sambamba'), 'merge', '-t', str(max_threads), bam_fpath] + tmp_bam_fpaths,
-                           stderr=open(err_fpath, 'a'), logger=logger)
-    sambamba_view(bam_fpath, sam_fpath, max_threads, err_fpath, logger)
-    return sam_fpath
-
-
 def parse_reads_stats(stats_fpath):
     reads_stats = defaultdict(int)
     reads_stats['coverage_thresholds'] = []
@@ -745,111 +749,105 @@ def add_statistics_to_report(output_dir, contigs_fpaths, ref_fpath):
             report.add_field(reporting.Fields.COVERAGE_1X_THRESHOLD, reads_stats['coverage_thresholds'][0])
 
 
-def analyse_coverage(output_dirpath, fpath, chr_names, bam_fpath, stats_fpath, err_fpath, logger):
-    filename = qutils.name_from_fpath(fpath)
-    bed_fpath = bam_to_bed(output_dirpath, filename, bam_fpath, err_fpath, logger)
-    chr_len_fpath = get_chr_len_fpath(fpath, chr_names)
-    cov_fpath = join(output_dirpath, filename + '.genomecov')
-    calculate_genome_cov(bed_fpath, cov_fpath, chr_len_fpath, err_fpath, logger, print_all_positions=False)
-
-    avg_depth = 0
-    coverage_for_thresholds = [0 for threshold in qconfig.coverage_thresholds]
-    with open(cov_fpath) as f:
-        for line in f:
-            l = line.split()  # genome; depth; number of bases; size of genome; fraction of bases with depth
-            depth, genome_fraction = int(l[1]), float(l[4])
-            if l[0] == 'genome':
-                avg_depth += depth * genome_fraction
-                for i, threshold in enumerate(qconfig.coverage_thresholds):
-                    if depth >= threshold:
-                        coverage_for_thresholds[i] += genome_fraction
+def analyse_coverage(output_dirpath, bam_fpath, stats_fpath, err_fpath, logger):
+    bam_sorted_fpath = get_safe_fpath(output_dirpath, add_suffix(bam_fpath, 'sorted'))
+    if not is_non_empty_file(bam_sorted_fpath):
+        sort_bam(bam_fpath, bam_sorted_fpath, err_fpath, logger)
+    histogram = DepthHistogram()
+    calculate_coverage(bam_sorted_fpath, [histogram])
 
     with open(stats_fpath, 'a') as out_f:
-        out_f.write('%s depth\n' % int(avg_depth))
-        for i, threshold in enumerate(qconfig.coverage_thresholds):
-            out_f.write('%.2f coverage >= %sx\n' % (coverage_for_thresholds[i] * 100, threshold))
-
-
-def get_physical_coverage(output_dirpath, ref_name, bam_fpath, log_path, err_fpath, cov_fpath, chr_len_fpath):
-    if not isfile(bedtools_fpath('bamToBed')):
-        logger.info('  Failed calculating physical coverage...')
-        return None
-    raw_cov_fpath = add_suffix(cov_fpath, 'raw')
-    if not is_non_empty_file(raw_cov_fpath):
-        logger.info('  Calculating physical coverage...')
-        ## keep properly mapped, unique, non-duplicate paired-end reads only
-        bam_filtered_fpath = join(output_dirpath, ref_name + '.physical.bam')
-        sambamba_view(bam_fpath, bam_filtered_fpath, qconfig.max_threads, err_fpath, logger,
-                      filter_rule='proper_pair and not supplementary and not duplicate '
-                                  'and template_length > %d and template_length < %d' %
-                                  (-qconfig.MAX_PE_IS, qconfig.MAX_PE_IS))
-        ## sort by read names
-        bam_filtered_sorted_fpath = join(output_dirpath, ref_name + '.physical.sorted.bam')
-        sort_bam(bam_filtered_fpath, bam_filtered_sorted_fpath, err_fpath, logger, sort_rule='-n')
-        bed_fpath = bam_to_bed(output_dirpath, ref_name + '.physical', bam_filtered_sorted_fpath, err_fpath, logger, bedpe=True)
-        calculate_genome_cov(bed_fpath, raw_cov_fpath, chr_len_fpath, err_fpath, logger)
-    return raw_cov_fpath
+        out_f.write('%s depth\n' % int(histogram.avg_depth()))
+        for threshold in qconfig.coverage_thresholds:
+            out_f.write('%.2f coverage >= %sx\n' % (histogram.fraction(threshold) * 100, threshold))
 
 
 def get_coverage(output_dirpath, ref_fpath, ref_name, bam_fpath, bam_sorted_fpath, log_path, err_fpath, correct_chr_names,
                  cov_fpath, physical_cov_fpath=None, uncovered_fpath=None, create_cov_files=True):
-    raw_cov_fpath = cov_fpath + '_raw'
-    chr_len_fpath = get_chr_len_fpath(ref_fpath, correct_chr_names)
+    read_handlers = []
+    fragment_handlers = []
     if not is_non_empty_file(cov_fpath):
         logger.info('  Calculating reads coverage...')
-        if not is_non_empty_file(raw_cov_fpath):
-            if not is_non_empty_file(bam_sorted_fpath):
-                sort_bam(bam_fpath, bam_sorted_fpath, err_fpath, logger)
-            calculate_genome_cov(bam_sorted_fpath, raw_cov_fpath, chr_len_fpath, err_fpath, logger)
-            qutils.assert_file_exists(raw_cov_fpath, 'coverage file')
         if uncovered_fpath:
-            print_uncovered_regions(raw_cov_fpath, uncovered_fpath, correct_chr_names)
+            read_handlers.append(UncoveredRegions(uncovered_fpath, correct_chr_names))
         if create_cov_files:
-            proceed_cov_file(raw_cov_fpath, cov_fpath, correct_chr_names)
+            read_handlers.append(CoverageTrack(cov_fpath, correct_chr_names))
     if not is_non_empty_file(physical_cov_fpath) and create_cov_files:
-        raw_cov_fpath = get_physical_coverage(output_dirpath, ref_name, bam_fpath, log_path, err_fpath,
-                                              physical_cov_fpath, chr_len_fpath)
-        proceed_cov_file(raw_cov_fpath, physical_cov_fpath, correct_chr_names)
+        logger.info('  Calculating physical coverage...')
+        ## properly mapped, non-supplementary, non-duplicate paired-end reads only
+        fragment_handlers.append(CoverageTrack(physical_cov_fpath, correct_chr_names))
+    if read_handlers or fragment_handlers:
+        if not is_non_empty_file(bam_sorted_fpath):
+            sort_bam(bam_fpath, bam_sorted_fpath, err_fpath, logger)
+        calculate_coverage(bam_sorted_fpath, read_handlers, fragment_handlers, max_fragment_len=qconfig.MAX_PE_IS,
+                           threads=qconfig.max_threads)
     return cov_fpath, physical_cov_fpath
 
 
-def proceed_cov_file(raw_cov_fpath, cov_fpath, correct_chr_names):
-    chr_depth = defaultdict(list)
-    used_chromosomes = dict()
-    chr_index = 0
-    with open(raw_cov_fpath, 'r') as in_coverage:
-        with open(cov_fpath, 'w') as out_coverage:
-            for line in in_coverage:
-                fs = list(line.split())
-                name = fs[0]
-                depth = int(float(fs[-1]))
-                if name not in used_chromosomes:
-                    chr_index += 1
-                    used_chromosomes[name] = str(chr_index)
-                    correct_name = correct_chr_names[name] if correct_chr_names else name
-                    out_coverage.write('#' + correct_name + ' ' + used_chromosomes[name] + '\n')
-                if len(fs) > 3:
-                    start, end = int(fs[1]), int(fs[2])
-                    chr_depth[name].extend([depth] * (end - start))
-                else:
-                    chr_depth[name].append(depth)
-                if len(chr_depth[name]) >= COVERAGE_FACTOR:
-                    max_index = len(chr_depth[name]) - (len(chr_depth[name]) % COVERAGE_FACTOR)
-                    for index in range(0, max_index, COVERAGE_FACTOR):
-                        cur_depth = sum(chr_depth[name][index: index + COVERAGE_FACTOR]) // COVERAGE_FACTOR
-                        out_coverage.write(' '.join([used_chromosomes[name], str(cur_depth) + '\n']))
-                    chr_depth[name] = chr_depth[name][index + COVERAGE_FACTOR:]
-            if not qconfig.debug:
-                os.remove(raw_cov_fpath)
-
-
-def get_max_min_is(insert_sizes):
-    decile_1 = percentile(insert_sizes, 10)
-    decile_9 = percentile(insert_sizes, 90)
-    return decile_1, decile_9
-
-
-def calculate_insert_size(sam_fpath, output_dir, ref_name, reads_suffix=''):
+class CoverageTrack(object):
+    """
+        Writes depth of coverage averaged over windows of COVERAGE_FACTOR bases (for Icarus and Circos).
+        Windows are summed up directly from runs of equal depth, so memory does not depend on lengths of runs
+    """
+    MAX_LINES_PER_WRITE = 10000
+
+    def __init__(self, cov_fpath, correct_chr_names):
+        self.out_coverage = open(cov_fpath, 'w')
+        self.correct_chr_names = correct_chr_names
+        self.windows = dict()  # chromosome --> number of bases and sum of depth in its last incomplete window
+        self.used_chromosomes = dict()
+
+    def add_run(self, name, start, end, depth):
+        used_chromosomes = self.used_chromosomes
+        if name not in used_chromosomes:
+            used_chromosomes[name] = str(len(used_chromosomes) + 1)
+            correct_name = self.correct_chr_names[name] if self.correct_chr_names else name
+            self.out_coverage.write('#' + correct_name + ' ' + used_chromosomes[name] + '\n')
+            self.windows[name] = (0, 0)
+        window_len, window_sum = self.windows[name]
+        run_len = end - start
+        if window_len:  # complete the last window
+            added_len = min(run_len, COVERAGE_FACTOR - window_len)
+            window_len += added_len
+            window_sum += added_len * depth
+            run_len -= added_len
+            if window_len == COVERAGE_FACTOR:
+                self.out_coverage.write(used_chromosomes[name] + ' ' + str(window_sum // COVERAGE_FACTOR) + '\n')
+                window_len, window_sum = 0, 0
+        if run_len >= COVERAGE_FACTOR:  # windows inside the run have its depth
+            line = used_chromosomes[name] + ' ' + str(depth) + '\n'
+            full_windows = run_len // COVERAGE_FACTOR
+            while full_windows:
+                lines_count = min(full_windows, CoverageTrack.MAX_LINES_PER_WRITE)
+                self.out_coverage.write(line * lines_count)
+                full_windows -= lines_count
+            run_len %= COVERAGE_FACTOR
+        if run_len:
+            window_len, window_sum = run_len, run_len * depth
+        self.windows[name] = (window_len, window_sum)
+
+    def close(self):
+        self.out_coverage.close()
+
+
+class UncoveredRegions(object):
+    """
+        Writes regions with zero depth of coverage
+    """
+    def __init__(self, uncovered_fpath, correct_chr_names):
+        self.out_f = open(uncovered_fpath, 'w')
+        self.correct_chr_names = correct_chr_names
+
+    def add_run(self, name, start, end, depth):
+        if depth == 0:
+            correct_name = self.correct_chr_names[name] if self.correct_chr_names else name
+            self.out_f.write('\t'.join([correct_name, str(start), str(end)]) + '\n')
+
+    def close(self):
+        self.out_f.close()
+
+
+def calculate_insert_size(sam_fpath, output_dir, ref_name, reads_suffix='', read_pairs_stats=None):
     insert_size_fpath = join(output_dir, ref_name + ('.' + reads_suffix if reads_suffix else '') + '.is.txt')
     if is_non_empty_file(insert_size_fpath):
         try:
@@ -861,27 +859,12 @@ def calculate_insert_size(sam_fpath, output_dir, ref_name, reads_suffix=''):
                 return insert_size, min_insert_size, max_insert_size
         except:
             pass
-    insert_sizes = []
-    mapped_flags = ['99', '147', '83', '163']  # reads mapped in correct orientation and within insert size
-    with open(sam_fpath) as sam_in:
-        for i, l in enumerate(sam_in):
-            if i > 1000000:
-                break
-            if l.startswith('@'):
-                continue
-            fs = l.split('\t')
-            flag = fs[1]
-            if flag not in mapped_flags:
-                continue
-            insert_size = abs(int(fs[8]))
-            insert_sizes.append(insert_size)
-
-    if insert_sizes:
-        insert_sizes.sort()
-        median_is = calc_median(insert_sizes)
+    stats = read_pairs_stats or calculate_read_pairs_stats(sam_fpath)
+    if stats.reads_count:
+        median_is = stats.median_insert_size()
         if median_is <= 0:
             return None, None, None
-        min_insert_size, max_insert_size = get_max_min_is(insert_sizes)
+        min_insert_size, max_insert_size = stats.insert_size_percentile(10), stats.insert_size_percentile(90)
         insert_size = max(qconfig.optimal_assembly_min_IS, median_is)
         with open(insert_size_fpath, 'w') as out_f:
             out_f.write(str(insert_size) + '\n')
@@ -891,22 +874,6 @@ def calculate_insert_size(sam_fpath, output_dir, ref_name, reads_suffix=''):
     return None, None, None
 
 
-def print_uncovered_regions(raw_cov_fpath, uncovered_fpath, correct_chr_names):
-    uncovered_regions = defaultdict(list)
-    with open(raw_cov_fpath) as in_coverage:
-        for line in in_coverage:
-            fs = list(line.split())
-            name = fs[0]
-            depth = int(float(fs[-1]))
-            correct_name = correct_chr_names[name] if correct_chr_names else name
-            if len(fs) > 3 and depth == 0:
-                uncovered_regions[correct_name].append((fs[1], fs[2]))
-    with open(uncovered_fpath, 'w') as out_f:
-        for chrom, regions in uncovered_regions.items():
-            for start, end in regions:
-                out_f.write('\t'.join([chrom, start, end]) + '\n')
-
-
 def do(ref_fpath, contigs_fpaths, output_dir, meta_ref_fpaths=None, external_logger=None):
     if external_logger:
         global logger
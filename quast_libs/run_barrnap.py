@@ -10,10 +10,10 @@ from os.path import join
 
 from quast_libs import reporting, qconfig, qutils
 from quast_libs.genes_parser import parse_gff
-from quast_libs.qutils import run_parallel, call_subprocess, is_non_empty_file
+from quast_libs.qutils import run_parallel_by_size, call_subprocess, is_non_empty_file
 
 
-def run(contigs_fpath, gff_fpath, log_fpath, threads, kingdom):
+def run(contigs_fpath, gff_fpath, log_fpath, kingdom, threads=1):
     barrnap_fpath = join(qconfig.LIBS_LOCATION, 'barrnap', 'bin', 'barrnap')
     if is_non_empty_file(gff_fpath):
         return
@@ -25,8 +25,6 @@ def do(contigs_fpaths, output_dir, logger):
     logger.print_timestamp()
     logger.info('Running Barrnap...')
 
-    n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
-    threads = max(1, qconfig.max_threads // n_jobs)
     if not os.path.isdir(output_dir):
         os.makedirs(output_dir)
 
@@ -35,8 +33,8 @@ def do(contigs_fpaths, output_dir, logger):
     kingdom = 'bac' if qconfig.prokaryote else 'euk'
     gff_fpaths = [join(output_dir, qutils.label_from_fpath_for_fname(contigs_fpath) + '.rna.gff') for contigs_fpath in contigs_fpaths]
 
-    barrnap_args = [(contigs_fpath, gff_fpath, log_fpath, threads, kingdom) for contigs_fpath, gff_fpath in zip(contigs_fpaths, gff_fpaths)]
-    run_parallel(run, barrnap_args, qconfig.max_threads)
+    barrnap_args = [(contigs_fpath, gff_fpath, log_fpath, kingdom) for contigs_fpath, gff_fpath in zip(contigs_fpaths, gff_fpaths)]
+    run_parallel_by_size(run, barrnap_args, [os.path.getsize(contigs_fpath) for contigs_fpath in contigs_fpaths])
 
     if not any(fpath for fpath in gff_fpaths):
         logger.info('Failed predicting the location of ribosomal RNA genes.')
@@ -12,10 +12,10 @@ import shutil
 
 from quast_libs.ra_utils.misc import download_unpack_compressed_tar
 
-from quast_libs import reporting, qconfig, qutils
+from quast_libs import reporting, qconfig, qutils, cache
 from quast_libs.busco import busco
 from quast_libs.log import get_logger
-from quast_libs.qutils import download_blast_binaries, run_parallel, compile_tool, get_dir_for_download, \
+from quast_libs.qutils import download_blast_binaries, run_parallel_by_size, compile_tool, get_dir_for_download, \
     check_prev_compilation_failed, get_blast_fpath
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
@@ -125,13 +125,23 @@ def make_config(output_dirpath, tmp_dirpath, threads, clade_dirpath, augustus_di
     return config_fpath
 
 
-def busco_main_handler(*busco_args):
+def busco_main_handler(contigs_fpath, label, threads=1):
     try:
-        return busco.main(*busco_args)
+        return busco.main(contigs_fpath, label, threads)
     except SystemExit:
         return None
 
 
+def get_cache_entry(index, contigs_fpath, output_dirpath, clade_dirpath):
+    """
+        BUSCO reuses the existing summary, so only the summary is cached and restored before BUSCO is started
+    """
+    label = qutils.label_from_fpath_for_fname(contigs_fpath)
+    summary_fpath = join(output_dirpath, 'run_' + label, 'short_summary_' + label + '.txt')
+    return cache.get_entry('busco', qutils.label_from_fpath(contigs_fpath), [contigs_fpath], ['prokaryote', 'is_fungus'],
+                           [label, os.path.basename(clade_dirpath)], [summary_fpath], index=index, files_only=True)
+
+
 def copy_augustus_contigs(augustus_dirpath, output_dirpath):
     input_basedir = join(augustus_dirpath, 'config')
     output_basedir = join(output_dirpath, 'config')
@@ -197,23 +207,23 @@ def do(contigs_fpaths, output_dir, logger):
     if not os.path.isdir(tmp_dir):
         os.makedirs(tmp_dir)
 
-    n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
-    busco_threads = max(1, qconfig.max_threads // n_jobs)
-
     clade_dirpath = download_db(logger, is_prokaryote=qconfig.prokaryote, is_fungus=qconfig.is_fungus)
     if not clade_dirpath:
         logger.info('Failed finding conservative genes.')
         return
 
-    config_fpath = make_config(output_dir, tmp_dir, busco_threads, clade_dirpath, augustus_dirpath)
+    config_fpath = make_config(output_dir, tmp_dir, qconfig.max_threads, clade_dirpath, augustus_dirpath)
     logger.info('Logs and results will be saved under ' + output_dir + '...')
 
     os.environ['BUSCO_CONFIG_FILE'] = config_fpath
     os.environ['AUGUSTUS_CONFIG_PATH'] = copy_augustus_contigs(augustus_dirpath, tmp_dir)
     if not os.environ['AUGUSTUS_CONFIG_PATH']:
         logger.error('Augustus configs not found, failed to run BUSCO without them.')
-    busco_args = [[contigs_fpath, qutils.label_from_fpath_for_fname(contigs_fpath)] for contigs_fpath in contigs_fpaths]
-    summary_fpaths = run_parallel(busco_main_handler, busco_args, qconfig.max_threads)
+    busco_args = [(get_cache_entry(index, contigs_fpath, output_dir, clade_dirpath), None, busco_main_handler,
+                   contigs_fpath, qutils.label_from_fpath_for_fname(contigs_fpath))
+                  for index, contigs_fpath in enumerate(contigs_fpaths)]
+    summary_fpaths = run_parallel_by_size(cache.run_cached_job, busco_args,
+                                          [os.path.getsize(contigs_fpath) for contigs_fpath in contigs_fpaths])
     if not any(fpath for fpath in summary_fpaths):
         logger.error('Failed running BUSCO for all the assemblies. See log files in ' + output_dir + ' for information.')
         return
@@ -15,10 +15,10 @@ from collections import defaultdict
 from os.path import isdir, isfile, join
 
 from quast_libs import qconfig, qutils
-from quast_libs.fastaparser import _get_fasta_file_handler
+from quast_libs.fastaparser import _open_fasta_file, FASTA_CHUNK_SIZE
 from quast_libs.log import get_logger
 from quast_libs.qutils import is_non_empty_file, slugify, correct_name, get_dir_for_download, show_progress, \
-    download_blast_binaries, get_blast_fpath, md5, run_parallel
+    download_blast_binaries, get_blast_fpath, md5, run_parallel_by_size
 
 logger = get_logger(qconfig.LOGGER_META_NAME)
 try:
@@ -224,22 +224,22 @@ def download_blastdb(logger=logger, only_clean=False):
     return True
 
 
-def parallel_blast(contigs_fpath, label, corrected_dirpath, err_fpath, blast_res_fpath, blast_check_fpath, blast_threads):
+def parallel_blast(contigs_fpath, label, corrected_dirpath, err_fpath, blast_res_fpath, blast_check_fpath, threads=1):
     logger.info('  ' + 'processing ' + label)
     blast_query_fpath = contigs_fpath
     compress_ext = ['.gz', '.gzip', '.bz2', '.bzip2', '.zip']
     if any(contigs_fpath.endswith(ext) for ext in compress_ext):
         logger.info('  ' + 'unpacking ' + label)
         unpacked_fpath = os.path.join(corrected_dirpath, os.path.basename(contigs_fpath) + '.unpacked')
-        with _get_fasta_file_handler(contigs_fpath) as f_in:
-            with open(unpacked_fpath, 'w') as f_out:
-                for l in f_in:
-                    f_out.write(l)
+        f_in = _open_fasta_file(contigs_fpath)
+        with open(unpacked_fpath, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out, FASTA_CHUNK_SIZE)
+        f_in.close()
         blast_query_fpath = unpacked_fpath
     res_fpath = get_blast_output_fpath(blast_res_fpath, label)
     check_fpath = get_blast_output_fpath(blast_check_fpath, label)
     cmd = get_blast_fpath('blastn') + (' -query %s -db %s -outfmt 7 -num_threads %s' % (
-        blast_query_fpath, db_fpath, blast_threads))
+        blast_query_fpath, db_fpath, threads))
     qutils.call_subprocess(shlex.split(cmd), stdout=open(res_fpath, 'w'), stderr=open(err_fpath, 'a'), logger=logger)
     logger.info('  ' + 'BLAST results for %s are saved to %s...' % (label, res_fpath))
     with open(check_fpath, 'w') as check_file:
@@ -378,12 +378,11 @@ def process_blast(blast_assemblies, downloaded_dirpath, corrected_dirpath, label
 
     if len(blast_assemblies) > 0:
         logger.main_info('Running BlastN..')
-        n_jobs = min(qconfig.max_threads, len(blast_assemblies))
-        blast_threads = max(1, qconfig.max_threads // n_jobs)
         parallel_run_args = [(assembly.fpath, assembly.label, corrected_dirpath,
-                              err_fpath, blast_res_fpath, blast_check_fpath, blast_threads)
+                              err_fpath, blast_res_fpath, blast_check_fpath)
                              for assembly in blast_assemblies]
-        run_parallel(parallel_blast, parallel_run_args, n_jobs, filter_results=True)
+        assembly_sizes = [os.path.getsize(assembly.fpath) for assembly in blast_assemblies]
+        run_parallel_by_size(parallel_blast, parallel_run_args, assembly_sizes, filter_results=True)
 
     logger.main_info()
     species_scores = []
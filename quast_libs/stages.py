@@ -0,0 +1,132 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Pipeline stages with declared inputs and outputs. Stages not depending on each other run at the same time:
+# stages marked as main_thread (e.g. drawing plots, matplotlib is not thread-safe) run in the main thread
+# one by one, other stages run in background threads. External tools and worker processes started by all stages
+# share the threads specified by --threads (see qutils.ThreadsBudget).
+#
+############################################################################
+
+from __future__ import with_statement
+import sys
+import threading
+
+from quast_libs.log import stage_log_buffer
+
+if sys.version_info[0] == 2:
+    exec('def reraise(exc_type, exc_value, exc_traceback):\n'
+         '    raise exc_type, exc_value, exc_traceback\n')
+else:
+    def reraise(exc_type, exc_value, exc_traceback):
+        raise exc_value.with_traceback(exc_traceback)
+
+
+class Stage(object):
+    def __init__(self, name, fn, inputs=None, outputs=None, main_thread=False):
+        """
+            fn takes dict with the initial values and outputs of finished stages, and returns dict with values
+            of the stage outputs (or None). Each stage also provides its name as an output without a value,
+            so it can be used as an input of stages which need only results saved by the stage into reports
+        """
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs or []
+        self.outputs = (outputs or []) + [name]
+        self.main_thread = main_thread
+
+
+def get_dependencies(stages, data):
+    providers = dict()
+    for stage in stages:
+        for output in stage.outputs:
+            if output in providers:
+                raise ValueError('Output %s is provided by stages %s and %s' % (output, providers[output], stage.name))
+            providers[output] = stage.name
+    dependencies = dict()
+    for stage in stages:
+        dependencies[stage.name] = set()
+        for input_name in stage.inputs:
+            if input_name in providers:
+                dependencies[stage.name].add(providers[input_name])
+            elif input_name not in data:
+                raise ValueError('Input %s of stage %s is not provided' % (input_name, stage.name))
+    return dependencies
+
+
+def run_stages(stages, data):
+    """
+        Runs stages as soon as stages providing their inputs are finished. Data is a dict with the initial values,
+        it is updated with the stage outputs. If a stage fails, no more stages are started, stages running
+        in background threads are waited for (unless the run is interrupted by Ctrl-C), and the exception
+        of the failed stage is raised with its original traceback.
+        Messages logged by a background stage are buffered and written by the main thread as one block
+        when the stage is finished (see log.StageLogBuffer)
+    """
+    dependencies = get_dependencies(stages, data)
+    condition = threading.Condition()
+    pending_stages = list(stages)
+    running_stages = set()
+    finished_stages = set()
+    errors = []
+    background_threads = []  # ids of threads of background stages
+    finished_threads = []  # ids of threads of finished background stages with buffered messages
+
+    def run_stage(stage):
+        if not stage.main_thread:
+            stage_log_buffer.start()
+        try:
+            outputs = stage.fn(data)
+        except BaseException:
+            with condition:
+                errors.append(sys.exc_info())
+                running_stages.discard(stage.name)
+                if not stage.main_thread:
+                    finished_threads.append(threading.current_thread().ident)
+                condition.notify_all()
+            return
+        with condition:
+            data.update(outputs or dict())
+            running_stages.discard(stage.name)
+            finished_stages.add(stage.name)
+            if not stage.main_thread:
+                finished_threads.append(threading.current_thread().ident)
+            condition.notify_all()
+
+    def flush_logs(thread_idents):
+        while thread_idents:
+            stage_log_buffer.flush(thread_idents.pop(0))
+
+    while True:
+        with condition:
+            while not errors:
+                flush_logs(finished_threads)
+                ready_stages = [stage for stage in pending_stages if dependencies[stage.name] <= finished_stages]
+                for stage in ready_stages:
+                    if not stage.main_thread:
+                        pending_stages.remove(stage)
+                        running_stages.add(stage.name)
+                        thread = threading.Thread(target=run_stage, args=(stage,), name=stage.name)
+                        thread.daemon = True
+                        thread.start()
+                        background_threads.append(thread.ident)
+                main_thread_stages = [stage for stage in ready_stages if stage.main_thread]
+                if main_thread_stages or not (pending_stages or running_stages):
+                    break
+                if not running_stages:
+                    raise ValueError('Stages %s have cyclic dependencies' % ', '.join(stage.name for stage in pending_stages))
+                condition.wait()
+            if errors:
+                while running_stages and not issubclass(errors[0][0], KeyboardInterrupt):
+                    condition.wait()
+                flush_logs(background_threads)
+                reraise(*errors[0])
+            if not main_thread_stages:
+                return data
+            stage = main_thread_stages[0]
+            pending_stages.remove(stage)
+            running_stages.add(stage.name)
+        run_stage(stage)
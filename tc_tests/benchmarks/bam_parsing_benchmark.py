@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Compares reading alignments of paired reads from a text SAM file line by line (as Reads analyzer did
+# with the sorted SAM-file) with reading the same alignments from a BAM file by AlignmentsReader
+# in one and several decompression threads: file size, reading time and the fields used by Reads analyzer.
+# Usage: bam_parsing_benchmark.py [number_of_read_pairs] [number_of_threads]
+#
+############################################################################
+
+from __future__ import print_function
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from os.path import abspath, dirname, join, getsize
+
+quast_dirpath = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, quast_dirpath)
+
+from quast_libs.ra_utils.bam_parser import AlignmentsReader, BamRecord, BamWriter
+
+READ_LEN = 150
+SEQ_CODES = dict((base, code) for code, base in enumerate('=ACMGRSVTWYHKDBN'))
+
+
+def encode_bam_record(fs, ref_ids):
+    ref_id = ref_ids[fs[2]]
+    next_ref_id = ref_id if fs[6] == '=' else ref_ids.get(fs[6], -1)
+    read_name = fs[0].encode('ascii') + b'\0'
+    cigar = struct.pack('<I', int(fs[5][:-1]) << 4)  # only 'M' operations are generated
+    seq = fs[9]
+    packed_seq = bytearray((SEQ_CODES[seq[i]] << 4) | (SEQ_CODES[seq[i + 1]] if i + 1 < len(seq) else 0)
+                           for i in range(0, len(seq), 2))
+    qual = bytearray(ord(c) - 33 for c in fs[10])
+    core = struct.pack('<iiBBHHHiiii', ref_id, int(fs[3]) - 1, len(read_name), int(fs[4]), 0, 1, int(fs[1]),
+                       len(seq), next_ref_id, int(fs[7]) - 1, int(fs[8]))
+    record = core + read_name + cigar + bytes(packed_seq) + bytes(qual)
+    return BamRecord(ref_id, int(fs[3]), int(fs[4]), int(fs[1]), next_ref_id, int(fs[8]), len(seq),
+                           struct.pack('<i', len(record)) + record)
+
+
+def generate_files(sam_fpath, bam_fpath, pairs_count):
+    random.seed(42)
+    ref_names = ['chr%d' % i for i in range(5)]
+    ref_len = pairs_count * 400 // len(ref_names) + 10000
+    ref_ids = dict((name, i) for i, name in enumerate(ref_names))
+    header_lines = ['@HD\tVN:1.5\tSO:coordinate'] + ['@SQ\tSN:%s\tLN:%d' % (name, ref_len) for name in ref_names] + \
+                   ['@PG\tID:bwa\tPN:bwa']
+    genome = ''.join(random.choice('ACGT') for _ in range(100000))
+    alignments = []
+    for i in range(pairs_count):
+        ref_name = random.choice(ref_names)
+        start = random.randint(1, ref_len - 1000)
+        insert_size = random.randint(300, 600)
+        mate_start = start + insert_size - READ_LEN
+        mapq = random.choice([0, 3, 60, 60, 60])
+        for flag, pos, next_pos, tlen in [(99, start, mate_start, insert_size), (147, mate_start, start, -insert_size)]:
+            seq_start = random.randint(0, len(genome) - READ_LEN)
+            seq = genome[seq_start:seq_start + READ_LEN]
+            alignments.append((ref_ids[ref_name], pos, ['read_%d' % i, str(flag), ref_name, str(pos), str(mapq),
+                                                        '%dM' % READ_LEN, '=', str(next_pos), str(tlen), seq, 'I' * READ_LEN]))
+    alignments.sort(key=lambda alignment: alignment[:2])
+    writer = BamWriter(bam_fpath, header_lines, ref_names, [ref_len] * len(ref_names), dict((i, i) for i in range(len(ref_names))))
+    with open(sam_fpath, 'w') as sam_file:
+        sam_file.write('\n'.join(header_lines) + '\n')
+        for _, _, fs in alignments:
+            sam_file.write('\t'.join(fs) + '\n')
+            writer.write(encode_bam_record(fs, ref_ids))
+    writer.close()
+
+
+def read_sam_lines(fpath):  # as Reads analyzer did with the sorted SAM-file
+    fields = []
+    with open(fpath) as sam_file:
+        for line in sam_file:
+            if line.startswith('@') or len(line.split('\t')) < 11:
+                continue
+            fs = line.split('\t')
+            fields.append((fs[2], int(fs[3]), int(fs[4]), int(fs[1]), fs[6], int(fs[8]), len(fs[9])))
+    return fields
+
+
+def read_alignments(fpath, threads):
+    fields = []
+    with AlignmentsReader(fpath, threads=threads) as reader:
+        ref_names = reader.ref_names
+        for mapping in reader:
+            next_ref = '=' if mapping.next_ref_id == mapping.ref_id else ref_names[mapping.next_ref_id]
+            fields.append((ref_names[mapping.ref_id], mapping.start, mapping.mapq, mapping.flag, next_ref, mapping.tlen, mapping.len))
+    return fields
+
+
+def measure(fn, *args):
+    start_time = time.time()
+    result = fn(*args)
+    return result, time.time() - start_time
+
+
+def main():
+    pairs_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    tmp_dirpath = tempfile.mkdtemp()
+    try:
+        sam_fpath = join(tmp_dirpath, 'reads.sam')
+        bam_fpath = join(tmp_dirpath, 'reads.bam')
+        generate_files(sam_fpath, bam_fpath, pairs_count)
+        print('%d alignments of read pairs, SAM: %.1f MB, BAM: %.1f MB' %
+              (pairs_count * 2, getsize(sam_fpath) / 1024.0 / 1024.0, getsize(bam_fpath) / 1024.0 / 1024.0))
+        sam_fields, elapsed = measure(read_sam_lines, sam_fpath)
+        print('SAM lines:                      %5.2f s' % elapsed)
+        for fpath, name, cur_threads in [(sam_fpath, 'SAM', 1), (bam_fpath, 'BAM', 1), (bam_fpath, 'BAM', threads)]:
+            fields, elapsed = measure(read_alignments, fpath, cur_threads)
+            print('AlignmentsReader, %s, %d thread%s %5.2f s, results are %s' %
+                  (name, cur_threads, 's:' if cur_threads > 1 else ': ', elapsed, 'identical' if fields == sam_fields else 'DIFFERENT'))
+    finally:
+        shutil.rmtree(tmp_dirpath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Compares the incremental best set selection (BSS), which clones only the last alignments of each scored set
+# and excludes overlaps inside the set once, with the former one that cloned all alignments of the set
+# for every candidate, on contigs consisting of repeats.
+# Usage: bss_benchmark.py [number_of_alignments_per_contig] [number_of_contigs]
+#
+############################################################################
+
+from __future__ import print_function
+import os
+import random
+import sys
+import time
+from os.path import abspath, dirname
+
+quast_dirpath = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, quast_dirpath)
+
+from quast_libs import qconfig
+qconfig.extensive_misassembly_threshold = qconfig.DEFAULT_EXT_MIS_SIZE
+qconfig.min_alignment = qconfig.DEFAULT_MIN_ALIGNMENT
+qconfig.ambiguity_usage = 'all'
+
+from quast_libs.ca_utils import best_set_selection
+from quast_libs.ca_utils.analyze_misassemblies import Mapping, exclude_internal_overlaps
+
+
+def clone_all_aligns(sorted_aligns, scored_set, new_align):
+    aligns = [sorted_aligns[i].clone() for i in scored_set.indexes] + [new_align.clone()]
+    if len(aligns) > 2:
+        exclude_internal_overlaps(aligns[-3], aligns[-2])
+    return aligns
+
+
+def generate_repetitive_contig(aligns_count, copies=3, segment_len=1000, ref_len=5000000):
+    """
+        Contig is a chain of slightly overlapping segments, each segment is a repeat aligned to several places
+        of the reference, so the best sets consist of many alignments
+    """
+    segments_count = max(1, aligns_count // copies)
+    ctg_len = segments_count * segment_len
+    aligns = []
+    for i in range(segments_count):
+        s2 = max(1, i * segment_len - random.randint(0, 50))
+        e2 = min(ctg_len, (i + 1) * segment_len + random.randint(0, 50))
+        for copy_idx in range(copies):
+            s1 = (i * segment_len + copy_idx * ref_len // copies) % (ref_len - 2 * segment_len) + 1
+            s1 += random.randint(0, 100)
+            align_len = e2 - s2 + 1
+            idy = random.choice([98.5, 99.0, 99.5, 100.0])
+            aligns.append(Mapping(s1, s1 + align_len - 1, s2, e2, align_len, align_len, idy,
+                                  ref='chr1', contig='contig', cigar=''))
+    return aligns, ctg_len, {'chr1': ref_len}
+
+
+def run_bss(contigs):
+    results = []
+    start_time = time.time()
+    with open(os.devnull, 'w') as devnull:
+        for aligns, ctg_len, ref_lens in contigs:
+            is_ambiguous, too_much_best_sets, sorted_aligns, best_sets = \
+                best_set_selection.get_best_aligns_sets(aligns, ctg_len, devnull, 'A' * ctg_len, ref_lens)
+            results.append((is_ambiguous, too_much_best_sets, [(s.score, s.indexes, s.uncovered) for s in best_sets]))
+    return results, time.time() - start_time
+
+
+def main():
+    aligns_count = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    contigs_count = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    qconfig.BSS_critical_number_of_aligns = max(qconfig.BSS_critical_number_of_aligns, aligns_count)
+    random.seed(42)
+    contigs = [generate_repetitive_contig(aligns_count) for _ in range(contigs_count)]
+
+    results, new_time = run_bss(contigs)
+    incremental_aligns = best_set_selection.ScoredSetAligns
+    best_set_selection.ScoredSetAligns = clone_all_aligns
+    try:
+        former_results, former_time = run_bss(contigs)
+    finally:
+        best_set_selection.ScoredSetAligns = incremental_aligns
+
+    print('%d contigs with %d alignments each' % (contigs_count, aligns_count))
+    print('Cloning all alignments of a set: %.2f s' % former_time)
+    print('Cloning last alignments only:    %.2f s' % new_time)
+    print('Best sets are ' + ('identical' if results == former_results else 'DIFFERENT'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Compares the text .coords files with the binary .coords.bin files: file size, time for writing them,
+# loading all alignments as Contig analyzer does and loading only coordinates and names as Genome analyzer does.
+# Usage: coords_format_benchmark.py [number_of_alignments]
+#
+############################################################################
+
+from __future__ import print_function
+import random
+import shutil
+import sys
+import tempfile
+import time
+from os.path import abspath, dirname, join, getsize
+
+quast_dirpath = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, quast_dirpath)
+
+from quast_libs.ca_utils.analyze_misassemblies import Mapping
+from quast_libs.ca_utils.coords_table import CoordsTable, save_coords
+
+
+def generate_aligns(aligns_count):
+    random.seed(42)
+    aligns = []
+    for i in range(aligns_count):
+        s1 = random.randint(1, 10 ** 7)
+        len1 = random.randint(100, 10000)
+        s2 = random.randint(1, 10 ** 5)
+        mismatch_pos = random.randint(1, len1 - 2)
+        cs = 'cs:Z::%d*ag:%d' % (mismatch_pos, len1 - mismatch_pos - 1)
+        aligns.append(Mapping(s1, s1 + len1 - 1, s2, s2 + len1 - 1, len1, len1, 99.99, 'chr%d' % (i % 10),
+                              'NODE_%d_length_%d' % (i // 10, len1), cs))
+    return aligns
+
+
+def load_text_aligns(fpath):
+    with open(fpath) as coords_file:
+        return [Mapping.from_line(line) for line in coords_file]
+
+
+def load_text_coords(fpath):  # as genome_analyzer.process_single_file did
+    coords = []
+    with open(fpath) as coords_file:
+        for line in coords_file:
+            s1 = int(line.split('|')[0].split()[0])
+            e1 = int(line.split('|')[0].split()[1])
+            s2 = int(line.split('|')[1].split()[0])
+            e2 = int(line.split('|')[1].split()[1])
+            contig_name = line.split()[12].strip()
+            chr_name = line.split()[11].strip()
+            coords.append((s1, e1, s2, e2, chr_name, contig_name))
+    return coords
+
+
+def save_text_aligns(fpath, aligns):
+    with open(fpath, 'w') as coords_file:
+        for align in aligns:
+            coords_file.write(align.coords_str() + '\n')
+
+
+def load_binary_coords(fpath):
+    columns = ['s1', 'e1', 's2', 'e2', 'ref', 'contig']
+    return list(CoordsTable(fpath, columns=columns).iter_rows(columns))
+
+
+def measure(fn, *args):
+    start_time = time.time()
+    result = fn(*args)
+    return result, time.time() - start_time
+
+
+def main():
+    aligns_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    aligns = generate_aligns(aligns_count)
+    tmp_dirpath = tempfile.mkdtemp()
+    try:
+        text_fpath = join(tmp_dirpath, 'aligns.coords')
+        bin_fpath = join(tmp_dirpath, 'aligns.coords.bin')
+        print('%d alignments' % aligns_count)
+        results = []
+        for name, fpath, save_fn, load_aligns_fn, load_coords_fn in \
+                [('text', text_fpath, save_text_aligns, load_text_aligns, load_text_coords),
+                 ('binary', bin_fpath, lambda fpath, aligns: save_coords(fpath, aligns, text_coords=False),
+                  lambda fpath: CoordsTable(fpath).mappings(), load_binary_coords)]:
+            _, save_time = measure(save_fn, fpath, aligns)
+            loaded_aligns, aligns_time = measure(load_aligns_fn, fpath)
+            coords, coords_time = measure(load_coords_fn, fpath)
+            results.append(([align.coords_str() for align in loaded_aligns], coords))
+            print('%-6s size: %6.1f MB, writing: %5.2f s, loading alignments: %5.2f s, loading coordinates: %5.2f s' %
+                  (name, getsize(fpath) / 1024.0 / 1024.0, save_time, aligns_time, coords_time))
+        print('Results are ' + ('identical' if results[0] == results[1] else 'DIFFERENT'))
+    finally:
+        shutil.rmtree(tmp_dirpath)
+
+
+if __name__ == '__main__':
+    main()
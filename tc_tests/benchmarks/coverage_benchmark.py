@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Compares the interval-based genome coverage computation of Contig analyzer
+# with the former per-base implementation.
+# Usage: coverage_benchmark.py [reference] [coords_file]
+# By default, random alignments to the bundled E. coli reference are used.
+#
+############################################################################
+
+from __future__ import print_function
+import os
+import random
+import sys
+import time
+from os.path import abspath, dirname, join
+
+quast_dirpath = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, quast_dirpath)
+
+from quast_libs import fastaparser
+from quast_libs.ca_utils.analyze_misassemblies import Mapping
+from quast_libs.contigs_analyzer import analyze_coverage
+
+
+def per_base_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes):
+    genome_mapping = {}
+    for chr_name, chr_len in reference_chromosomes.items():
+        genome_mapping[chr_name] = [0] * (chr_len + 1)
+    for chr_name, aligns in ref_aligns.items():
+        for align in aligns:
+            for pos in range(align.s1, align.e1 + 1):
+                genome_mapping[chr_name][pos] = 1
+        for ns_start, ns_end in ns_by_chromosomes[chr_name]:
+            for pos in range(ns_start, ns_end + 1):
+                genome_mapping[chr_name][pos] = 0
+    return sum([sum(genome_mapping[chrom]) for chrom in genome_mapping])
+
+
+def random_aligns(reference_chromosomes, aligns_per_mbp=2000, max_align_len=50000):
+    random.seed(42)
+    ref_aligns = {}
+    for chr_name, chr_len in reference_chromosomes.items():
+        for _ in range(max(1, chr_len * aligns_per_mbp // 1000000)):
+            start = random.randint(1, chr_len)
+            end = min(chr_len, start + random.randint(100, max_align_len))
+            ref_aligns.setdefault(chr_name, []).append(Mapping(start, end, 1, end - start + 1, ref=chr_name, cigar=''))
+    return ref_aligns
+
+
+def main():
+    ref_fpath = sys.argv[1] if len(sys.argv) > 1 else join(quast_dirpath, 'tc_tests', 'data', 'reference.fa.gz')
+    genome_size, reference_chromosomes, ns_by_chromosomes = fastaparser.get_genome_stats(ref_fpath, skip_ns=True)
+    if len(sys.argv) > 2:
+        ref_aligns = {}
+        with open(sys.argv[2]) as coords_file:
+            for line in coords_file:
+                align = Mapping.from_line(line)
+                align.cigar = ''
+                ref_aligns.setdefault(align.ref, []).append(align)
+    else:
+        ref_aligns = random_aligns(reference_chromosomes)
+    print('Reference: %s (%d bp), alignments: %d' %
+          (ref_fpath, sum(reference_chromosomes.values()), sum(len(aligns) for aligns in ref_aligns.values())))
+
+    start_time = time.time()
+    expected_bases = per_base_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes)
+    per_base_time = time.time() - start_time
+
+    start_time = time.time()
+    covered_bases, _, _ = analyze_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes, os.devnull)
+    intervals_time = time.time() - start_time
+
+    print('Per-base lists:  %d covered bases, %.3f sec' % (expected_bases, per_base_time))
+    print('Merged intervals: %d covered bases, %.3f sec' % (covered_bases, intervals_time))
+    assert covered_bases == expected_bases, 'Covered bases differ!'
+    print('Genome fraction: %.3f%%' % (covered_bases * 100.0 / genome_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Measures throughput (MB of uncompressed FASTA per second) of
+# fastaparser.read_fasta for plain, gzip, bzip2 and zip inputs and compares
+# it with the former line-based reader.
+# Usage: fasta_reader_benchmark.py [fasta] [number_of_copies]
+#
+############################################################################
+
+from __future__ import print_function
+import bz2
+import gzip
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from os.path import abspath, dirname, join
+
+quast_dirpath = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, quast_dirpath)
+
+from quast_libs import fastaparser
+
+
+def line_based_read_fasta(fpath):
+    if fpath.endswith('.gz'):
+        fasta_file = gzip.open(fpath, mode='rt')
+    elif fpath.endswith('.bz2'):
+        fasta_file = io.TextIOWrapper(io.BytesIO(bz2.BZ2File(fpath).read()))
+    elif fpath.endswith('.zip'):
+        zfile = zipfile.ZipFile(fpath)
+        fasta_file = io.TextIOWrapper(io.BytesIO(zfile.open(zfile.namelist()[0]).read()))
+    else:
+        fasta_file = open(fpath)
+    seq = []
+    name = None
+    for raw_line in fasta_file:
+        for line in raw_line.split('\r'):
+            if not line:
+                continue
+            if line[0] == '>':
+                if name is not None:
+                    yield name, ''.join(seq)
+                name = line[1:].split()[0]
+                seq = []
+            else:
+                seq.append(line.strip())
+    if name is not None:
+        yield name, ''.join(seq)
+    fasta_file.close()
+
+
+def measure(read_fn, fpath, fasta_size):
+    start_time = time.time()
+    total_len = 0
+    for _, seq in read_fn(fpath):
+        total_len += len(seq)
+    elapsed = time.time() - start_time
+    return total_len, fasta_size / 1024.0 / 1024.0 / elapsed
+
+
+def main():
+    src_fpath = sys.argv[1] if len(sys.argv) > 1 else join(quast_dirpath, 'tc_tests', 'data', 'reference.fa.gz')
+    copies = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    tmp_dirpath = tempfile.mkdtemp()
+    try:
+        fasta_fpath = join(tmp_dirpath, 'benchmark.fasta')
+        with open(fasta_fpath, 'w') as out_f:
+            for i in range(copies):
+                for name, seq in fastaparser.read_fasta(src_fpath):
+                    out_f.write('>%s_%d\n' % (name, i))
+                    for pos in range(0, len(seq), 60):
+                        out_f.write(seq[pos:pos + 60] + '\n')
+        fasta_size = os.path.getsize(fasta_fpath)
+        fpaths = [('plain', fasta_fpath)]
+        for fmt, open_fn in [('gzip', gzip.open), ('bzip2', bz2.BZ2File)]:
+            compressed_fpath = fasta_fpath + ('.gz' if fmt == 'gzip' else '.bz2')
+            with open(fasta_fpath, 'rb') as in_f:
+                with open_fn(compressed_fpath, 'wb') as out_f:
+                    shutil.copyfileobj(in_f, out_f)
+            fpaths.append((fmt, compressed_fpath))
+        with zipfile.ZipFile(fasta_fpath + '.zip', 'w', zipfile.ZIP_DEFLATED) as zfile:
+            zfile.write(fasta_fpath, 'benchmark.fasta')
+        fpaths.append(('zip', fasta_fpath + '.zip'))
+
+        print('FASTA size: %.1f MB' % (fasta_size / 1024.0 / 1024.0))
+        print('%-8s %18s %18s' % ('format', 'line-based, MB/s', 'chunked, MB/s'))
+        for fmt, fpath in fpaths:
+            old_len, old_speed = measure(line_based_read_fasta, fpath, fasta_size)
+            new_len, new_speed = measure(fastaparser.read_fasta, fpath, fasta_size)
+            assert old_len == new_len, 'Total sequence lengths differ for %s!' % fmt
+            print('%-8s %18.1f %18.1f' % (fmt, old_speed, new_speed))
+    finally:
+        shutil.rmtree(tmp_dirpath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Compares the sweep-based search of genomic features in aligned blocks of Genome analyzer
+# with the former search checking all blocks of all contigs for each feature
+# on growing numbers of features and alignments of a fragmented assembly (two blocks per feature, ten per contig).
+# Usage: feature_matching_benchmark.py [max_number_of_features] [max_number_of_features_for_former_search]
+#
+############################################################################
+
+from __future__ import print_function
+import random
+import sys
+import time
+from os.path import abspath, dirname
+
+quast_dirpath = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, quast_dirpath)
+
+from quast_libs import qconfig
+from quast_libs.genes_parser import Gene
+from quast_libs.genome_analyzer import AlignedBlock, find_features
+
+
+def generate_data(features_count):
+    random.seed(42)
+    chr_names = ['chr%d' % i for i in range(5)]
+    chr_len = features_count * 2000 // len(chr_names) + 10000
+    regions = []
+    for i in range(features_count):
+        start = random.randint(1, chr_len - 3000)
+        regions.append(Gene(id='gene_%d' % i, seqname=random.choice(chr_names), start=start, end=start + random.randint(300, 3000)))
+    contigs_names = ['NODE_%d' % i for i in range(features_count // 5 + 1)]
+    aligned_blocks_by_contig_name = dict((name, []) for name in contigs_names)
+    for i in range(features_count * 2):
+        contig_name = contigs_names[i // 10]
+        start = random.randint(1, chr_len - 10000)
+        block_len = random.randint(500, 10000)
+        aligned_blocks_by_contig_name[contig_name].append(AlignedBlock(seqname=random.choice(chr_names), start=start, end=start + block_len,
+                                                                       contig=contig_name, start_in_contig=1, end_in_contig=block_len + 1))
+    return regions, aligned_blocks_by_contig_name, contigs_names
+
+
+def find_features_in_all_blocks(regions, aligned_blocks_by_contig_name, sorted_contigs_names):
+    full_blocks = [None] * len(regions)
+    partial_blocks = [[] for _ in regions]
+    for i, region in enumerate(regions):
+        gene_blocks = []
+        for contig_id, name in enumerate(sorted_contigs_names):
+            for cur_block in aligned_blocks_by_contig_name[name]:
+                if cur_block.seqname != region.seqname:
+                    continue
+                if region.end <= cur_block.start or cur_block.end <= region.start:
+                    continue
+                elif cur_block.start <= region.start and region.end <= cur_block.end:
+                    full_blocks[i] = (contig_id, cur_block)
+                    break
+                elif min(region.end, cur_block.end) - max(region.start, cur_block.start) >= qconfig.min_gene_overlap:
+                    gene_blocks.append(cur_block)
+            if full_blocks[i] is not None:
+                break
+        if full_blocks[i] is None:
+            partial_blocks[i] = sorted(gene_blocks, key=lambda block: block.start)
+    return full_blocks, partial_blocks
+
+
+def measure(fn, *args):
+    start_time = time.time()
+    result = fn(*args)
+    return result, time.time() - start_time
+
+
+def main():
+    max_features_count = int(sys.argv[1]) if len(sys.argv) > 1 else 64000
+    max_former_features_count = int(sys.argv[2]) if len(sys.argv) > 2 else 16000
+    features_count = 1000
+    while features_count <= max_features_count:
+        regions, aligned_blocks_by_contig_name, contigs_names = generate_data(features_count)
+        result, elapsed = measure(find_features, regions, aligned_blocks_by_contig_name, contigs_names)
+        line = '%6d features, %6d blocks, %6d contigs: sweep %6.2f s' % \
+               (features_count, features_count * 2, len(contigs_names), elapsed)
+        if features_count <= max_former_features_count:
+            former_result, former_elapsed = measure(find_features_in_all_blocks, regions, aligned_blocks_by_contig_name, contigs_names)
+            line += ', all blocks %7.2f s, results are %s' % (former_elapsed, 'identical' if result == former_result else 'DIFFERENT')
+        print(line)
+        features_count *= 4
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Measures memory and time for loading alignments from coords lines and cloning them
+# (as best set selection does) for the slotted Mapping and the former __dict__-based one.
+# Usage: mapping_benchmark.py [number_of_alignments]
+# Memory is measured with tracemalloc, so Python 3 is needed for memory statistics.
+#
+############################################################################
+
+from __future__ import print_function
+import random
+import sys
+import time
+from os.path import abspath, dirname
+
+quast_dirpath = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, quast_dirpath)
+
+from quast_libs.ca_utils.analyze_misassemblies import Mapping
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class LegacyMapping(object):
+    def __init__(self, s1, e1, s2=None, e2=None, len1=None, len2=None, idy=None, ref=None, contig=None, cigar=None, ns_pos=None, sv_type=None):
+        self.s1, self.e1, self.s2, self.e2, self.len1, self.len2, self.idy, self.ref, self.contig = s1, e1, s2, e2, len1, len2, idy, ref, contig
+        self.cigar = cigar
+        self.ns_pos = ns_pos
+        self.sv_type = sv_type
+
+    @classmethod
+    def from_line(cls, line):
+        line = line.split()
+        assert line[2] == line[5] == line[8] == line[10] == '|', line
+        ref = line[11]
+        contig = line[12]
+        s1, e1, s2, e2, len1, len2 = [int(line[i]) for i in [0, 1, 3, 4, 6, 7]]
+        idy = float(line[9])
+        cigar = line[-1]
+        return LegacyMapping(s1, e1, s2, e2, len1, len2, idy, ref, contig, cigar)
+
+    def clone(self):
+        return LegacyMapping(self.s1, self.e1, self.s2, self.e2, self.len1, self.len2, self.idy, self.ref, self.contig, self.cigar)
+
+
+def generate_coords_lines(aligns_count):
+    random.seed(42)
+    lines = []
+    for i in range(aligns_count):
+        s1 = random.randint(1, 10 ** 7)
+        len1 = random.randint(100, 10000)
+        s2 = random.randint(1, 10 ** 5)
+        lines.append('%d %d | %d %d | %d %d | %.4f | chr%d NODE_%d | %dM' %
+                     (s1, s1 + len1 - 1, s2, s2 + len1 - 1, len1, len1, 99.5, i % 10, i // 10, len1))
+    return lines
+
+
+def measure(mapping_class, lines):
+    start_time = time.time()
+    aligns = [mapping_class.from_line(line) for line in lines]
+    load_time = time.time() - start_time
+    start_time = time.time()
+    clones = [align.clone() for align in aligns]
+    clone_time = time.time() - start_time
+    del aligns, clones
+
+    memory = None
+    if tracemalloc:  # measured separately since tracing slows down allocations
+        tracemalloc.start()
+        aligns = [mapping_class.from_line(line) for line in lines]
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    return load_time, clone_time, memory
+
+
+def main():
+    aligns_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    lines = generate_coords_lines(aligns_count)
+    print('%d alignments' % aligns_count)
+    for name, mapping_class in [('__dict__ Mapping', LegacyMapping), ('slotted Mapping', Mapping)]:
+        load_time, clone_time, memory = measure(mapping_class, lines)
+        print('%-17s loading: %.2f s, cloning: %.2f s, memory: %s' %
+              (name, load_time, clone_time, '%.1f MB' % (memory / 1024.0 / 1024.0) if memory is not None else 'n/a'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Compares alignment of paired reads into a sorted BAM file as Reads analyzer did before (BWA output into a SAM file,
+# cleaning read names into another SAM file, converting it into BAM and sorting with sambamba)
+# with piping BWA output through name cleaning into sambamba view and sorting the BAM file: wall time, size
+# of intermediate files and of all written files. Requires sambamba.
+# Usage: reads_alignment_benchmark.py [reference reads_1 reads_2]
+# By default, aligns the reads from test_data.
+#
+############################################################################
+
+from __future__ import print_function
+import gzip
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import abspath, dirname, join, getsize, isfile
+
+quast_dirpath = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, quast_dirpath)
+
+from quast_libs import qconfig
+qconfig.extensive_misassembly_threshold = 1000
+from quast_libs.log import get_logger
+from quast_libs.qutils import get_path_to_program
+from quast_libs.ra_utils.misc import align_to_bam, bwa_fpath, clean_read_names, sambamba_fpath, sort_bam
+
+logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+
+
+def megabytes(size):
+    return size / 1024.0 / 1024.0
+
+
+def align_with_sam_files(bwa_cmd, tmp_dirpath, err_fpath):
+    sam_fpath = join(tmp_dirpath, 'former.sam')
+    correct_sam_fpath = join(tmp_dirpath, 'former.correct.sam')
+    bam_fpath = join(tmp_dirpath, 'former.bam')
+    sorted_bam_fpath = join(tmp_dirpath, 'former.sorted.bam')
+    with open(sam_fpath, 'w') as out_f:
+        subprocess.call(bwa_cmd, stdout=out_f, stderr=open(err_fpath, 'a'))
+    clean_read_names(sam_fpath, correct_sam_fpath)
+    subprocess.call([sambamba_fpath('sambamba'), 'view', '-t', '4', '-h', '-S', '-f', 'bam', '-o', bam_fpath, correct_sam_fpath],
+                    stderr=open(err_fpath, 'a'))
+    sort_bam(bam_fpath, sorted_bam_fpath, err_fpath, logger, threads=4)
+    temp_size = sum(getsize(fpath) for fpath in [sam_fpath, correct_sam_fpath, bam_fpath])
+    return temp_size, getsize(sorted_bam_fpath)
+
+
+def align_with_pipe(bwa_cmd, tmp_dirpath, err_fpath):
+    bam_fpath = join(tmp_dirpath, 'pipe.bam')
+    sorted_bam_fpath = join(tmp_dirpath, 'pipe.sorted.bam')
+    align_to_bam(bwa_cmd, bam_fpath, 4, err_fpath, logger)
+    sort_bam(bam_fpath, sorted_bam_fpath, err_fpath, logger, threads=4)
+    return getsize(bam_fpath), getsize(sorted_bam_fpath)
+
+
+def measure(fn, *args):
+    start_time = time.time()
+    result = fn(*args)
+    return result, time.time() - start_time
+
+
+def main():
+    if len(sys.argv) >= 4:
+        ref_fpath, reads_fpaths = sys.argv[1], sys.argv[2:4]
+    else:
+        test_data_dirpath = join(quast_dirpath, 'test_data')
+        ref_fpath = join(test_data_dirpath, 'reference.fasta.gz')
+        reads_fpaths = [join(test_data_dirpath, 'reads1.fastq.gz'), join(test_data_dirpath, 'reads2.fastq.gz')]
+    bwa = get_path_to_program('bwa') or bwa_fpath('bwa')
+    if not bwa:
+        print('BWA is not found')
+        return
+    if not isfile(sambamba_fpath('sambamba')):
+        print('Sambamba is not found')
+        return
+    tmp_dirpath = tempfile.mkdtemp()
+    try:
+        tmp_ref_fpath = join(tmp_dirpath, 'reference.fasta')
+        with (gzip.open(ref_fpath) if ref_fpath.endswith('.gz') else open(ref_fpath, 'rb')) as ref_f:
+            with open(tmp_ref_fpath, 'wb') as out_f:
+                shutil.copyfileobj(ref_f, out_f)
+        err_fpath = join(tmp_dirpath, 'err.txt')
+        subprocess.call([bwa, 'index', tmp_ref_fpath], stdout=open(err_fpath, 'a'), stderr=open(err_fpath, 'a'))
+        bwa_cmd = [bwa, 'mem', '-t', '4', tmp_ref_fpath] + reads_fpaths
+        (temp_size, output_size), elapsed = measure(align_with_sam_files, bwa_cmd, tmp_dirpath, err_fpath)
+        print('SAM files: %6.2f s, intermediate files: %7.1f MB, written: %7.1f MB' %
+              (elapsed, megabytes(temp_size), megabytes(temp_size + output_size)))
+        (temp_size, output_size), elapsed = measure(align_with_pipe, bwa_cmd, tmp_dirpath, err_fpath)
+        print('Pipe:      %6.2f s, intermediate files: %7.1f MB, written: %7.1f MB' %
+              (elapsed, megabytes(temp_size), megabytes(temp_size + output_size)))
+    finally:
+        shutil.rmtree(tmp_dirpath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Measures calculation of reads coverage (depth histogram, uncovered regions, Icarus coverage tracks
+# of reads and of fragments) in one pass over a sorted BAM file of paired reads.
+# If bedtools is in PATH, compares the runs of depth with bedtools genomecov -bga (as Reads analyzer did before).
+# Usage: reads_coverage_benchmark.py [number_of_read_pairs]
+#
+############################################################################
+
+from __future__ import print_function
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import abspath, dirname, join, getsize
+
+quast_dirpath = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, quast_dirpath)
+
+from quast_libs import qconfig
+qconfig.extensive_misassembly_threshold = 1000
+from quast_libs.qutils import get_path_to_program
+from quast_libs.ra_utils.coverage import calculate_coverage, DepthHistogram
+from quast_libs.reads_analyzer import CoverageTrack, UncoveredRegions
+from bam_parsing_benchmark import generate_files
+
+
+class RunsCollector(object):
+    def __init__(self):
+        self.runs = []
+
+    def add_run(self, chr_name, start, end, depth):
+        self.runs.append((chr_name, start, end, depth))
+
+    def close(self):
+        pass
+
+
+def run_bedtools(bam_fpath, genome_fpath):
+    output = subprocess.check_output(['bedtools', 'genomecov', '-ibam', bam_fpath, '-g', genome_fpath, '-bga'])
+    runs = []
+    for line in output.decode().splitlines():
+        fs = line.split()
+        runs.append((fs[0], int(fs[1]), int(fs[2]), int(fs[3])))
+    return runs
+
+
+def main():
+    pairs_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    tmp_dirpath = tempfile.mkdtemp()
+    try:
+        bam_fpath = join(tmp_dirpath, 'reads.bam')
+        generate_files(join(tmp_dirpath, 'reads.sam'), bam_fpath, pairs_count)
+        print('%d alignments of read pairs, BAM: %.1f MB' % (pairs_count * 2, getsize(bam_fpath) / 1024.0 / 1024.0))
+        histogram = DepthHistogram()
+        collector = RunsCollector()
+        start_time = time.time()
+        calculate_coverage(bam_fpath, [histogram, collector, UncoveredRegions(join(tmp_dirpath, 'uncovered.bed'), None)])
+        print('Depth histogram and uncovered regions: %6.2f s, %d runs, average depth %.2f, covered %.2f%%' %
+              (time.time() - start_time, len(collector.runs), histogram.avg_depth(), histogram.fraction(1) * 100))
+        start_time = time.time()
+        calculate_coverage(bam_fpath, [DepthHistogram(), UncoveredRegions(join(tmp_dirpath, 'uncovered.bed'), None),
+                                       CoverageTrack(join(tmp_dirpath, 'reads.cov'), None)],
+                           [CoverageTrack(join(tmp_dirpath, 'reads.physical.cov'), None)], max_fragment_len=qconfig.MAX_PE_IS)
+        print('Also coverage tracks of reads and fragments: %6.2f s' % (time.time() - start_time))
+        if get_path_to_program('bedtools'):
+            genome_fpath = join(tmp_dirpath, 'genome.txt')
+            with open(join(tmp_dirpath, 'reads.sam')) as sam_file:
+                with open(genome_fpath, 'w') as out_f:
+                    for line in sam_file:
+                        if line.startswith('@SQ'):
+                            out_f.write(line.split('\tSN:')[1].split('\t')[0] + '\t' + line.split('\tLN:')[1].split('\t')[0])
+            start_time = time.time()
+            runs = run_bedtools(bam_fpath, genome_fpath)
+            print('bedtools genomecov -bga: %.2f s (without post-processing), results are %s' %
+                  (time.time() - start_time, 'identical' if runs == collector.runs else 'DIFFERENT'))
+    finally:
+        shutil.rmtree(tmp_dirpath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Compares passing reference data (chromosome lengths, Ns and genomic features, as Genome analyzer does)
+# to the jobs of run_parallel in the arguments of each job with passing them as qutils.SharedValue,
+# which worker processes inherit on fork. Measures the pickled arguments size, time for running
+# the jobs (which only touch the data) and peak memory of worker processes.
+# Usage: shared_reference_benchmark.py [number_of_assemblies] [number_of_chromosomes] [number_of_genes]
+# Memory of worker processes is read from /proc, so it is measured on Linux only.
+#
+############################################################################
+
+from __future__ import print_function
+import pickle
+import random
+import resource
+import sys
+import time
+from os.path import abspath, dirname, join
+from site import addsitedir
+
+quast_dirpath = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, quast_dirpath)
+
+from quast_libs import qconfig, qutils
+addsitedir(join(qconfig.LIBS_LOCATION, 'site_packages'))
+from quast_libs.genes_parser import Gene
+from quast_libs.genome_analyzer import FeatureContainer
+
+
+def generate_reference_data(chromosomes_count, genes_count):
+    random.seed(42)
+    reference_chromosomes = dict()
+    ns_by_chromosomes = dict()
+    for i in range(chromosomes_count):
+        chr_name = 'scaffold_%d' % i
+        chr_len = random.randint(1000, 100000)
+        reference_chromosomes[chr_name] = chr_len
+        ns_starts = sorted(random.sample(range(1, chr_len - 100), 5))
+        ns_by_chromosomes[chr_name] = [[start, start + random.randint(1, 50)] for start in ns_starts]
+    container = FeatureContainer(['genes.gff'], 'gene')
+    chr_names = list(reference_chromosomes)
+    for i in range(genes_count):
+        chr_name = random.choice(chr_names)
+        start = random.randint(1, reference_chromosomes[chr_name] - 1000)
+        container.region_list.append(Gene(id='gene_%d' % i, seqname=chr_name, start=start, end=start + 900))
+    container.chr_names_dict = dict((chr_name, chr_name) for chr_name in chr_names)
+    return reference_chromosomes, ns_by_chromosomes, [container]
+
+
+def get_private_memory_kb():
+    private_kb = 0
+    with open('/proc/self/smaps') as smaps:
+        for line in smaps:
+            if line.startswith('Private_Clean:') or line.startswith('Private_Dirty:'):
+                private_kb += int(line.split()[1])
+    return private_kb
+
+
+def process_assembly(index, reference_chromosomes, ns_by_chromosomes, containers):
+    total_len = sum(reference_chromosomes.values())
+    ns_len = sum(end - start + 1 for intervals in ns_by_chromosomes.values() for start, end in intervals)
+    genes_len = sum(gene.end - gene.start + 1 for container in containers for gene in container.region_list)
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return total_len - ns_len + genes_len, peak_rss_kb, get_private_memory_kb()
+
+
+def run_jobs(assemblies_count, job_args):
+    parallel_args = [(index,) + job_args for index in range(assemblies_count)]
+    pickled_size = sum(len(pickle.dumps(args, pickle.HIGHEST_PROTOCOL)) for args in parallel_args)
+    start_time = time.time()
+    results, peak_rss_kbs, private_kbs = qutils.run_parallel(process_assembly, parallel_args, qconfig.max_threads)
+    return results, time.time() - start_time, pickled_size, max(peak_rss_kbs), max(private_kbs)
+
+
+def main():
+    assemblies_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    chromosomes_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    genes_count = int(sys.argv[3]) if len(sys.argv) > 3 else 200000
+    qconfig.max_threads = 4
+
+    reference_chromosomes, ns_by_chromosomes, containers = generate_reference_data(chromosomes_count, genes_count)
+    print('%d assemblies, %d chromosomes, %d genes, %d worker processes' %
+          (assemblies_count, chromosomes_count, genes_count, qconfig.max_threads))
+    if not qutils.workers_inherit_memory():
+        print('Worker processes are not forked, shared values are pickled for each job')
+    results = []
+    for name, job_args in [('Arguments of each job', (reference_chromosomes, ns_by_chromosomes, containers)),
+                           ('SharedValue', (qutils.SharedValue(reference_chromosomes), qutils.SharedValue(ns_by_chromosomes),
+                                            qutils.SharedValue(containers)))]:
+        job_results, elapsed, pickled_size, peak_rss_kb, private_kb = run_jobs(assemblies_count, job_args)
+        results.append(job_results)
+        print('%-21s pickled: %7.1f MB, time: %5.2f s, worker peak RSS: %6.1f MB, worker private memory: %6.1f MB' %
+              (name, pickled_size / 1024.0 / 1024.0, elapsed, peak_rss_kb / 1024.0, private_kb / 1024.0))
+    print('Results are ' + ('identical' if results[0] == results[1] else 'DIFFERENT'))
+
+
+if __name__ == '__main__':
+    main()
@@ -74,6 +74,7 @@ combined_output_name = "combined_reference"
 
 common_results_dirpath = 'results'
 data_dirpath = 'data'
+quast_dirpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # for importing quast_libs in tests
 
 os.system('chmod -R 777 ' + data_dirpath)
 
@@ -166,6 +167,16 @@ def assert_metric(name, metric, values=None, fname='report.tsv', absent=False):
     exit(7)
 
 
+def assert_equal(what, value, expected):
+    if value != expected:
+        if isinstance(value, list) and isinstance(expected, list) and len(value) == len(expected):
+            index = next(i for i, (v, e) in enumerate(zip(value, expected)) if v != e)
+            what, value, expected = '%s (element %d)' % (what, index), value[index], expected[index]
+        sys.stderr.write('Assertion of %s failed: "%s" expected, got "%s" instead' % (what, expected, value))
+        exit(8)
+    print('%s is OK' % what)
+
+
 def get_metric_values(name, metric, fname='report.tsv'):
     results_dirpath = get_results_dirpath(name)
 
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+import os
+import re
+import struct
+import zlib
+from common import *
+
+sys.path.insert(0, quast_dirpath)
+from quast_libs.ra_utils.bam_parser import AlignmentsReader, BamWriter, is_bam_file
+
+name = os.path.basename(__file__)[5:-3]
+results_dirpath = get_results_dirpath(name)
+if os.path.exists(results_dirpath):
+    shutil.rmtree(results_dirpath)
+os.makedirs(results_dirpath)
+sam_fpath = os.path.join(results_dirpath, 'reads.sam')
+bam_fpath = os.path.join(results_dirpath, 'reads.bam')
+written_bam_fpath = os.path.join(results_dirpath, 'written.bam')
+
+header_lines = ['@HD\tVN:1.6\tSO:coordinate', '@SQ\tSN:chr1\tLN:1000', '@SQ\tSN:chr2\tLN:500']
+sam_lines = ['r1\t99\tchr1\t10\t60\t5M\t=\t30\t25\tACGTA\tIIIII',
+             'r2\t97\tchr1\t20\t30\t2S3M1I2M2D1M\tchr2\t5\t0\tACGTACGTA\tIIIIIIIII',
+             'r1\t147\tchr1\t30\t60\t5M\t=\t10\t-25\tTTGCA\t*',
+             'r3\t2048\tchr2\t1\t0\t3M\t*\t0\t0\t*\t*',
+             'r4\t4\t*\t0\t0\t*\t*\t0\t0\tACG\tIII']
+# ref name, start, mapq, flag, next ref name, tlen, read length, length on the reference, read name
+expected_records = [('chr1', 10, 60, 99, 'chr1', 25, 5, 5, 'r1'),
+                    ('chr1', 20, 30, 97, 'chr2', 0, 9, 8, 'r2'),
+                    ('chr1', 30, 60, 147, 'chr1', -25, 5, 5, 'r1'),
+                    ('chr2', 1, 0, 2048, None, 0, 1, 3, 'r3'),
+                    (None, 0, 0, 4, None, 0, 3, 0, 'r4')]
+
+
+def encode_bam_record(sam_line, ref_ids):
+    # BAM record as described in the SAM/BAM format specification
+    fs = sam_line.split('\t')
+    read_name = fs[0].encode('utf-8') + b'\0'
+    cigar = [int(length) << 4 | 'MIDNSHP=X'.index(op) for length, op in re.findall(r'(\d+)([MIDNSHP=X])', fs[5])]
+    seq = '' if fs[9] == '*' else fs[9]
+    packed_seq = bytearray(('=ACMGRSVTWYHKDBN'.index(seq[i]) << 4) | ('=ACMGRSVTWYHKDBN'.index(seq[i + 1])
+                                                                       if i + 1 < len(seq) else 0)
+                           for i in range(0, len(seq), 2))
+    qual = bytearray(0xff for _ in seq) if fs[10] == '*' else bytearray(ord(c) - 33 for c in fs[10])
+    ref_id = ref_ids.get(fs[2], -1)
+    next_ref_id = ref_id if fs[6] == '=' else ref_ids.get(fs[6], -1)
+    data = struct.pack('<iiBBHHHiiii', ref_id, int(fs[3]) - 1, len(read_name), int(fs[4]), 4680, len(cigar),
+                       int(fs[1]), len(seq), next_ref_id, int(fs[7]) - 1, int(fs[8])) + \
+           read_name + struct.pack('<%dI' % len(cigar), *cigar) + bytes(packed_seq) + bytes(qual)
+    return struct.pack('<i', len(data)) + data
+
+
+def bgzf_block(data):
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    return struct.pack('<4sIBBHBBHH', b'\x1f\x8b\x08\x04', 0, 0, 0xff, 6, 66, 67, 2, len(cdata) + 25) + cdata + \
+           struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+
+
+def write_bam(fpath, block_size):
+    ref_names = [line.split('\tSN:')[1].split('\t')[0] for line in header_lines if line.startswith('@SQ')]
+    ref_lengths = [int(line.split('\tLN:')[1]) for line in header_lines if line.startswith('@SQ')]
+    text = ''.join(line + '\n' for line in header_lines).encode('utf-8')
+    data = b'BAM\x01' + struct.pack('<i', len(text)) + text + struct.pack('<i', len(ref_names))
+    for ref_name, ref_length in zip(ref_names, ref_lengths):
+        data += struct.pack('<i', len(ref_name) + 1) + ref_name.encode('utf-8') + b'\0' + struct.pack('<i', ref_length)
+    ref_ids = dict((ref_name, i) for i, ref_name in enumerate(ref_names))
+    data += b''.join(encode_bam_record(line, ref_ids) for line in sam_lines)
+    with open(fpath, 'wb') as out_f:
+        for start in range(0, len(data), block_size):  # small blocks: records and header are split between blocks
+            out_f.write(bgzf_block(data[start:start + block_size]))
+        out_f.write(bgzf_block(b''))
+
+
+def read_records(fpath, threads=1):
+    with AlignmentsReader(fpath, threads) as reader:
+        records = [(reader.ref_names[record.ref_id] if record.ref_id >= 0 else None, record.start, record.mapq,
+                    record.flag, reader.ref_names[record.next_ref_id] if record.next_ref_id >= 0 else None,
+                    record.tlen, record.len, record.ref_len() if record.ref_id >= 0 else 0, record.read_name())
+                   for record in reader]
+        return records, reader.header_lines, reader.ref_names, reader.ref_lengths
+
+
+with open(sam_fpath, 'w') as sam_f:
+    sam_f.write(''.join(line + '\n' for line in header_lines + sam_lines))
+write_bam(bam_fpath, block_size=37)
+assert_equal('BAM detection', (is_bam_file(bam_fpath), is_bam_file(sam_fpath)), (True, False))
+
+for threads in [1, 2]:
+    records, bam_header_lines, ref_names, ref_lengths = read_records(bam_fpath, threads)
+    assert_equal('BAM header in %d thread(s)' % threads, (bam_header_lines, ref_names, ref_lengths),
+                 (header_lines, ['chr1', 'chr2'], [1000, 500]))
+    assert_equal('BAM records in %d thread(s)' % threads, records, expected_records)
+assert_equal('SAM records', read_records(sam_fpath)[0], expected_records)
+
+# references are written in the reversed order, so the reference indices of the records are changed
+with AlignmentsReader(bam_fpath) as reader:
+    writer = BamWriter(written_bam_fpath, ['@HD\tVN:1.6'], ['chr2', 'chr1'], [500, 1000], {0: 1, 1: 0})
+    for record in reader:
+        writer.write(record)
+    writer.close()
+records, bam_header_lines, ref_names, ref_lengths = read_records(written_bam_fpath)
+assert_equal('written BAM header', (bam_header_lines, ref_names, ref_lengths), (['@HD\tVN:1.6'], ['chr2', 'chr1'], [500, 1000]))
+assert_equal('written BAM records', records, expected_records)
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+import os
+from common import *
+
+sys.path.insert(0, quast_dirpath)
+from quast_libs import cache, qconfig
+qconfig.extensive_misassembly_threshold = qconfig.DEFAULT_EXT_MIS_SIZE  # set by options_parser
+qconfig.min_contig = qconfig.DEFAULT_MIN_CONTIG
+from quast_libs import reads_analyzer
+
+name = os.path.basename(__file__)[5:-3]
+results_dirpath = os.path.abspath(get_results_dirpath(name))
+if os.path.exists(results_dirpath):
+    shutil.rmtree(results_dirpath)
+os.makedirs(results_dirpath)
+contigs_fpath = os.path.join(results_dirpath, 'contigs.fasta')
+calls = []
+
+
+def count_contigs(contigs_fpath, output_fpath):
+    calls.append(os.path.isfile(output_fpath))  # whether the output file is restored before the call
+    with open(contigs_fpath) as in_f:
+        contigs_count = sum(1 for line in in_f if line.startswith('>'))
+    if not contigs_count:
+        return None
+    with open(output_fpath, 'w') as out_f:
+        out_f.write(str(contigs_count))
+    return contigs_count, output_fpath
+
+
+def run_job(run_name, files_only=False):
+    os.makedirs(os.path.join(results_dirpath, run_name))
+    output_fpath = os.path.join(results_dirpath, run_name, 'contigs.count')
+    entry = cache.get_entry('count_contigs', 'contigs', [contigs_fpath], ['min_contig'], [1],
+                            output_fpaths=[output_fpath], files_only=files_only)
+    del calls[:]
+    value = cache.run_cached_job(entry, None, count_contigs, contigs_fpath, output_fpath)
+    output = None
+    if value:
+        with open(output_fpath) as f:
+            output = f.read()
+    return value, output, list(calls)
+
+
+def write_contigs(contigs_count):
+    # files with different number of contigs differ in size, so memoized checksums are updated
+    # even if the modification time is the same
+    with open(contigs_fpath, 'w') as out_f:
+        out_f.write(''.join('>contig_%d\nACGT\n' % i for i in range(contigs_count)))
+
+
+write_contigs(2)
+qconfig.cache_dirpath = None
+assert_equal('disabled cache', cache.get_entry('count_contigs', 'contigs', [contigs_fpath]), None)
+
+qconfig.cache_dirpath = os.path.join(results_dirpath, 'cache')
+assert_equal('cache miss', run_job('run1'), ((2, os.path.join(results_dirpath, 'run1', 'contigs.count')), '2', [False]))
+# output files and paths in the value are restored into the output directory of the current run
+assert_equal('cache hit', run_job('run2'), ((2, os.path.join(results_dirpath, 'run2', 'contigs.count')), '2', []))
+
+write_contigs(3)
+assert_equal('cache miss after changing the input', run_job('run3'), ((3, os.path.join(results_dirpath, 'run3', 'contigs.count')), '3', [False]))
+qconfig.min_contig += 1
+assert_equal('cache miss after changing an option', run_job('run4'), ((3, os.path.join(results_dirpath, 'run4', 'contigs.count')), '3', [False]))
+qconfig.min_contig -= 1
+assert_equal('cache hit of the previous input', run_job('run5'), ((3, os.path.join(results_dirpath, 'run5', 'contigs.count')), '3', []))
+
+write_contigs(0)
+assert_equal('failed job', run_job('run6'), (None, None, [False]))
+assert_equal('failed job is not cached', run_job('run7'), (None, None, [False]))
+
+# the job of files_only entry is always started, after restoring its output files
+write_contigs(4)
+assert_equal('files-only cache miss', run_job('run8', files_only=True), ((4, os.path.join(results_dirpath, 'run8', 'contigs.count')), '4', [False]))
+assert_equal('files-only cache hit', run_job('run9', files_only=True), ((4, os.path.join(results_dirpath, 'run9', 'contigs.count')), '4', [True]))
+
+# alignments of reads to the reference are cached with the label of the reference
+reference_fpath = os.path.join(results_dirpath, 'reference.fasta')
+shutil.copy(contigs_fpath, reference_fpath)
+qconfig.assembly_labels_by_fpath[contigs_fpath] = 'contigs'
+reads_dirpath = os.path.join(results_dirpath, 'reads_stats', 'temp_output')
+assert_equal('reads alignment entries', [reads_analyzer.get_cache_entry(fpath, reads_dirpath, index=0, is_reference=is_reference).label
+                                         for fpath, is_reference in [(contigs_fpath, False), (reference_fpath, True)]],
+             ['contigs', 'reference'])
@@ -0,0 +1,46 @@
+#!/usr/bin/python
+
+import os
+from common import *
+
+sys.path.insert(0, quast_dirpath)
+from quast_libs.ca_utils.analyze_misassemblies import Mapping
+from quast_libs.ca_utils.coords_table import CoordsTable, CoordsWriter, save_coords
+
+name = os.path.basename(__file__)[5:-3]
+results_dirpath = get_results_dirpath(name)
+if os.path.exists(results_dirpath):
+    shutil.rmtree(results_dirpath)
+os.makedirs(results_dirpath)
+coords_fpath = os.path.join(results_dirpath, 'contigs.coords.bin')
+
+aligns = [Mapping(1, 1000, 1, 1000, 1000, 1000, 100.0, 'chr1', 'contig_1', ':1000'),
+          Mapping(5001, 5900, 900, 1, 900, 900, 98.765, 'chr2', 'contig_1', ':100*ag:799'),
+          Mapping(3000000000, 3000000099, 1, 100, 100, 100, 99.5, 'chr1', 'contig_2', ':100'),
+          Mapping(200, 300, 1, 101, 101, 101, 99.0, 'chr2', 'contig_3', '')]
+ambiguous = [False, False, True, False]
+
+writer = CoordsWriter(coords_fpath, text_coords=True, idy_format='%.2f')
+for align, is_ambiguous in zip(aligns, ambiguous):
+    writer.add(align, ambiguous=is_ambiguous)
+writer.close()
+
+table = CoordsTable(coords_fpath)
+assert_equal('number of alignments', len(table), len(aligns))
+assert_equal('alignments', [str(align) + ' ' + align.cigar for align in table.mappings()],
+             [str(align) + ' ' + align.cigar for align in aligns])
+assert_equal('ambiguity', table.column('ambiguous'), ambiguous)
+assert_equal('rows by reference', table.rows_by_ref(), {'chr1': [0, 2], 'chr2': [1, 3]})
+assert_equal('rows by contig', table.rows_by_contig(), {'contig_1': [0, 1], 'contig_2': [2], 'contig_3': [3]})
+assert_equal('rows slicing', list(table.iter_rows(['s1', 'cs'], [1, 3])), [(5001, ':100*ag:799'), (200, '')])
+
+table = CoordsTable(coords_fpath, columns=['s1', 'e1', 'ref'])
+assert_equal('loaded columns', sorted(table.columns), ['e1', 'ref', 's1'])
+assert_equal('reference column', table.column('ref'), ['chr1', 'chr2', 'chr1', 'chr2'])
+
+with open(coords_fpath[:-len('.bin')]) as text_coords_f:
+    assert_equal('text coords', [line.split('|')[3].strip() for line in text_coords_f],
+                 ['100.00', '98.77', '99.50', '99.00'])
+
+save_coords(coords_fpath, [])
+assert_equal('empty coords', len(CoordsTable(coords_fpath).mappings()), 0)
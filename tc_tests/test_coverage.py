@@ -0,0 +1,117 @@
+#!/usr/bin/python
+
+import os
+import random
+import re
+from collections import defaultdict
+from common import *
+
+sys.path.insert(0, quast_dirpath)
+from quast_libs.ra_utils import coverage
+from quast_libs.ra_utils.coverage import DepthRuns, calculate_coverage
+
+name = os.path.basename(__file__)[5:-3]
+results_dirpath = get_results_dirpath(name)
+if os.path.exists(results_dirpath):
+    shutil.rmtree(results_dirpath)
+os.makedirs(results_dirpath)
+sam_fpath = os.path.join(results_dirpath, 'reads.sam')
+
+random.seed(1)
+coverage.CHUNK_SIZE = 50  # depth runs are flushed many times per chromosome
+chr_lengths = [('chr1', 3000), ('chr2', 1000), ('chr3', 2000)]  # chr2 has no reads
+max_fragment_len = 400
+
+
+class DepthCollector(object):
+    def __init__(self):
+        self.depth = dict((chr_name, [None] * chr_len) for chr_name, chr_len in chr_lengths)
+        self.is_closed = False
+
+    def add_run(self, chr_name, start, end, depth):
+        for pos in range(start, end):
+            self.depth[chr_name][pos] = depth
+
+    def close(self):
+        self.is_closed = True
+
+
+def naive_depth(chr_len, intervals):
+    depth = [0] * chr_len
+    for start, end in intervals:
+        for pos in range(start, min(end, chr_len)):
+            depth[pos] += 1
+    return depth
+
+
+def ref_len(cigar):
+    return sum(int(length) for length, op in re.findall(r'(\d+)([MIDNSHP=X])', cigar) if op in 'MDN=X')
+
+
+# depth runs of random intervals sorted by their starts
+for chr_len in [1, 10, 1000]:
+    intervals = sorted((start, start + random.randint(0, 120)) for start in
+                       [random.randint(0, chr_len - 1) for _ in range(chr_len // 5 + 1)])
+    depth_runs = DepthRuns(chr_len)
+    runs = []
+    for start, end in intervals:
+        runs += depth_runs.add(start, end) or []
+    runs += depth_runs.close()
+    assert_equal('runs of chromosome of length %d cover it' % chr_len,
+                 [start for start, _, _ in runs] + [chr_len], [0] + [end for _, end, _ in runs])
+    assert_equal('depth of chromosome of length %d' % chr_len,
+                 [depth for start, end, depth in runs for _ in range(start, end)], naive_depth(chr_len, intervals))
+
+# read pairs with duplicates, supplementary, secondary and not properly paired alignments
+sam_records = []
+for chr_name, chr_len in [chr_lengths[0], chr_lengths[2]]:
+    for i in range(300):
+        read_name = '%s_pair%d' % (chr_name, i)
+        frag_start = random.randint(1, chr_len - 50)
+        frag_len = random.randint(150, 500)
+        mates = []
+        for cigar in random.sample(['60M', '10S50M', '30M2D30M', '25M3I32M', '50M10S'], 2):
+            mates.append([read_name, 0, chr_name, 0, 60, cigar, '=', 0, 0, 'A' * 60, '*'])
+        left, right = mates
+        right_start = max(frag_start, frag_start + frag_len - ref_len(right[5]))
+        left[1], left[3], left[7], left[8] = 99, frag_start, right_start, right_start + ref_len(right[5]) - frag_start
+        right[1], right[3], right[7], right[8] = 147, right_start, frag_start, -left[8]
+        for mate in mates:
+            r = random.random()
+            if r < 0.1:
+                mate[1] |= 0x400  # duplicate
+            elif r < 0.15:
+                mate[1] &= ~0x2  # not properly paired
+        if random.random() < 0.1:
+            sam_records.append(list(left))
+            sam_records[-1][1] |= 0x800  # supplementary
+            sam_records[-1][3] = random.randint(1, chr_len)
+        if random.random() < 0.1:
+            sam_records.append(list(right))
+            sam_records[-1][1] |= 0x100  # secondary
+            sam_records[-1][3] = random.randint(1, chr_len)
+        sam_records += mates
+sam_records.append(['unmapped', 77, '*', 0, 0, '*', '*', 0, 0, 'A' * 60, '*'])
+chr_indices = dict((chr_name, i) for i, (chr_name, _) in enumerate(chr_lengths))
+sam_records.sort(key=lambda fs: (chr_indices.get(fs[2], len(chr_lengths)), fs[3]))
+with open(sam_fpath, 'w') as sam_f:
+    for chr_name, chr_len in chr_lengths:
+        sam_f.write('@SQ\tSN:%s\tLN:%d\n' % (chr_name, chr_len))
+    for fs in sam_records:
+        sam_f.write('\t'.join(str(f) for f in fs) + '\n')
+
+reads_depth, fragments_depth = DepthCollector(), DepthCollector()
+calculate_coverage(sam_fpath, [reads_depth], [fragments_depth], max_fragment_len=max_fragment_len)
+assert_equal('closing of handlers', (reads_depth.is_closed, fragments_depth.is_closed), (True, True))
+
+pairs = defaultdict(list)
+for fs in sam_records:
+    if fs[1] & 0x2 and not fs[1] & (0x100 | 0x800):
+        pairs[fs[0]].append(fs)
+for chr_name, chr_len in chr_lengths:
+    reads = [(fs[3] - 1, fs[3] - 1 + ref_len(fs[5])) for fs in sam_records if fs[2] == chr_name]
+    fragments = [(fs[3] - 1, fs[3] - 1 + fs[8]) for pair in pairs.values() for fs in pair
+                 if fs[2] == chr_name and fs[8] > 0 and len(pair) == 2 and
+                 not any(mate[1] & 0x400 or abs(mate[8]) >= max_fragment_len for mate in pair)]
+    assert_equal('depth of coverage of %s' % chr_name, reads_depth.depth[chr_name], naive_depth(chr_len, reads))
+    assert_equal('physical coverage of %s' % chr_name, fragments_depth.depth[chr_name], naive_depth(chr_len, fragments))
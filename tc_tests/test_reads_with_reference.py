@@ -0,0 +1,25 @@
+#!/usr/bin/python
+
+import os
+from common import *
+
+name = os.path.basename(__file__)[5:-3]
+contigs = [contigs_10k_1, contigs_10k_2]
+reads_params = '-R ' + reference_10k + ' -1 reads_10k_1.fastq.gz -2 reads_10k_2.fastq.gz -t 4'
+cache_dirpath = os.path.abspath(get_results_dirpath(name) + '_cache')
+
+run_quast(name, contigs=contigs, params=reads_params)
+check_report_files(name)
+assert_report_header(name, contigs=contigs)
+assert_metric_comparison(name, 'Mapped (%)', '>', value='0')
+assert_metric_comparison(name, 'Reference mapped (%)', '>', value='0')
+mapped = get_metric_values(name, 'Mapped (%)')
+reference_mapped = get_metric_values(name, 'Reference mapped (%)')
+
+# the second run with the same cache restores alignments of the reads
+if os.path.exists(cache_dirpath):
+    shutil.rmtree(cache_dirpath)
+for i in range(2):
+    run_quast(name, contigs=contigs, params=reads_params + ' --cache-dir ' + cache_dirpath)
+    assert_metric(name, 'Mapped (%)', mapped)
+    assert_metric(name, 'Reference mapped (%)', reference_mapped)
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+
+import os
+import threading
+import time
+import traceback
+from common import *
+
+sys.path.insert(0, quast_dirpath)
+from quast_libs.stages import Stage, run_stages
+
+name = os.path.basename(__file__)[5:-3]
+events = []
+events_lock = threading.Lock()
+
+
+def log_event(stage_name, event):
+    with events_lock:
+        events.append((stage_name, event))
+
+
+def make_stage(stage_name, inputs=None, outputs=None, main_thread=False, duration=0, error=None,
+               signal=None, wait_for=None):
+    """
+        Stage logging its start and end, its outputs are values of its inputs prefixed with the stage name.
+        signal and wait_for are threading.Events for checking that stages run at the same time
+    """
+    def fn(data):
+        log_event(stage_name, 'start')
+        if signal:
+            signal.set()
+        if wait_for and not wait_for.wait(5):
+            log_event(stage_name, 'waited in vain')
+        time.sleep(duration)
+        if error:
+            log_event(stage_name, 'failed')
+            raise error
+        log_event(stage_name, 'finished in ' + ('main' if threading.current_thread().name == 'MainThread' else 'background'))
+        return dict((output, stage_name + '(' + ','.join(str(data.get(input_name)) for input_name in inputs or []) + ')')
+                    for output in outputs or [])
+    return Stage(stage_name, fn, inputs=inputs, outputs=outputs, main_thread=main_thread)
+
+
+def get_event_positions():
+    return dict((event, i) for i, event in enumerate(events))
+
+
+# the middle stages depend on the first one only, so they run at the same time in background threads
+genes_started = threading.Event()
+stages = [make_stage('basic', outputs=['lengths'], main_thread=True),
+          make_stage('aligner', inputs=['lengths', 'reference'], outputs=['alignments'], wait_for=genes_started),
+          make_stage('genes', inputs=['lengths'], signal=genes_started, duration=0.1),
+          make_stage('report', inputs=['alignments', 'genes'], outputs=['report_fpath'], main_thread=True),
+          make_stage('plots', inputs=['report_fpath'])]
+data = run_stages(stages, {'reference': 'ref.fa'})
+positions = get_event_positions()
+assert_equal('order of stages', [positions[(stage_name, 'start')] > positions[(provider_name, 'finished in ' + thread)]
+                                 for stage_name, provider_name, thread in [('aligner', 'basic', 'main'), ('genes', 'basic', 'main'),
+                                                                           ('report', 'aligner', 'background'),
+                                                                           ('report', 'genes', 'background'),
+                                                                           ('plots', 'report', 'main')]], [True] * 5)
+assert_equal('independent stages run at the same time', ('aligner', 'waited in vain') in positions, False)
+assert_equal('threads of stages', sorted(event for event in events if event[1].startswith('finished')),
+             [('aligner', 'finished in background'), ('basic', 'finished in main'), ('genes', 'finished in background'),
+              ('plots', 'finished in background'), ('report', 'finished in main')])
+assert_equal('outputs of stages', data, {'reference': 'ref.fa', 'lengths': 'basic()', 'alignments': 'aligner(basic(),ref.fa)',
+                                         'report_fpath': 'report(aligner(basic(),ref.fa),None)'})
+
+# if a stage fails, stages depending on it are not started, running stages are waited for,
+# and the exception is raised with the original traceback
+del events[:]
+stages = [make_stage('basic', outputs=['lengths'], main_thread=True),
+          make_stage('aligner', inputs=['lengths'], error=RuntimeError('aligner failed')),
+          make_stage('genes', inputs=['lengths'], duration=0.5),
+          make_stage('report', inputs=['aligner', 'genes'], main_thread=True)]
+try:
+    run_stages(stages, {})
+    assert_equal('failure of a stage', 'no exception', 'RuntimeError')
+except RuntimeError:
+    _, exc_value, exc_traceback = sys.exc_info()
+    assert_equal('exception of the failed stage', str(exc_value), 'aligner failed')
+    assert_equal('traceback of the failed stage', traceback.extract_tb(exc_traceback)[-1][2], 'fn')
+assert_equal('stages after the failure', sorted(events), [('aligner', 'failed'), ('aligner', 'start'),
+                                                          ('basic', 'finished in main'), ('basic', 'start'),
+                                                          ('genes', 'finished in background'), ('genes', 'start')])
+
+for what, stages in [('missing input', [make_stage('report', inputs=['alignments'])]),
+                     ('duplicate output', [make_stage('basic', outputs=['lengths']),
+                                           make_stage('aligner', outputs=['lengths'])]),
+                     ('cyclic dependencies', [make_stage('basic', inputs=['aligner']),
+                                              make_stage('aligner', inputs=['basic'])])]:
+    try:
+        run_stages(stages, {})
+        assert_equal(what, 'no exception', 'ValueError')
+    except ValueError:
+        print('%s is OK' % what)